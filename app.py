@@ -1,20 +1,42 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, session
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+# 必须在导入 services 之前：各模块在导入时读取自己的设置 (BAR_TIMEZONE、LLM_BUDGET_*、AI_JOB_* 等)
+load_dotenv()
+
+from flask import (Flask, render_template, request, redirect, url_for, jsonify, send_file, session, g, Response,
+                   stream_with_context)
 from models import db, Participant, InventoryItem, Recipe, Consumption, Event, RecipeIngredient, Bartender
-from services.llm_service import get_cocktail_suggestion, generate_event_summary, get_omakase_suggestion, get_sommelier_recommendation
+from services.llm_service import (get_cocktail_suggestion, get_omakase_suggestion,
+                                  get_sommelier_recommendation, stream_cocktail_suggestion, stream_omakase_suggestion,
+                                  stream_sommelier_recommendation, stream_omakase_batch, llm_enabled,
+                                  is_complete_recipe, SUGGESTION_TEMPERATURE, DEFAULT_MODEL,
+                                  OMAKASE_BATCH_MAX_GUESTS)
+from services import ai_cache, jobs, event_summary, sommelier_rank
+from services.database import configure_database, install_sqlite_pragmas, write_transaction
+from services import migrations, versioning, makeable, metrics, omakase_pool, pdf_fonts, pdf_assets
+from services.versioning import conditional
+from services.dashboard import build_index_snapshot
+from services.api import fetch_page, ApiError, RESOURCES as API_RESOURCES
+from services import bulk
+from services.stats import compute_event_stats, compute_day_stats, format_stats_text
+from services.barday import bar_day_for, current_bar_day
+from services.rollups import (record_consumption, retract_consumption, rebuild_rollups, rebuild_ingredient_rollups,
+                              rebuild_daily_rollups, recompute_bar_days, events_using_recipe, ensure_rollups)
 import os
-from datetime import datetime, timedelta
+import sys
+import json
+import time
+import hmac
+import click
+from contextlib import nullcontext
+from datetime import datetime
 from werkzeug.middleware.proxy_fix import ProxyFix
 import io
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.colors import black, gray, HexColor
-from reportlab.lib.utils import ImageReader
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
 
 app = Flask(__name__)
 # Security Configuration
@@ -27,8 +49,7 @@ if APP_PASSWORD:
 else:
     print("Auth disabled. APP_PASSWORD not set.")
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///bar.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+configure_database(app)
 app.config['PREFERRED_URL_SCHEME'] = 'https'
 app.wsgi_app = ProxyFix(
     app.wsgi_app,
@@ -40,7 +61,138 @@ app.wsgi_app = ProxyFix(
 db.init_app(app)
 
 with app.app_context():
-    db.create_all()
+    install_sqlite_pragmas(db.engine)
+    versioning.install(db.session)
+    makeable.install(db.session)
+    omakase_pool.install(db.session)
+    # 建表、迁移、汇总表补算在同一个写锁里完成，多个 worker 同时启动也不会 "database is locked"
+    migrations.prepare(db, backfill=ensure_rollups)
+
+# 酒单字体和 logo 每个进程只处理一次；gunicorn --preload 时在 master 里加载，fork 后各 worker 共享
+pdf_fonts.load()
+pdf_assets.load()
+# reportlab 默认把每个流再做一遍 ASCII85 编码（没有 C 扩展时是纯 Python，logo 这样的图片要几百毫秒），
+# 还会让 PDF 变大 25%。这是进程级设置，本应用只输出二进制流的 PDF，所以在这里统一关掉
+rl_config.useA85 = 0
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations (tracked in PRAGMA user_version)."""
+    applied = migrations.upgrade(db.engine)
+    print(f"Schema at version {migrations.current_version(db.engine)}"
+          + (f" (applied {applied})." if applied else " (up to date)."))
+
+@app.cli.command('db-check-indexes')
+def db_check_indexes_command():
+    """Verify with EXPLAIN QUERY PLAN that hot queries use their indexes."""
+    failed = False
+    for sql, index, plan, ok in migrations.explain_hot_queries(db.engine):
+        print(f"[{'OK' if ok else 'SCAN'}] {index}: {plan}")
+        failed = failed or not ok
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-rollups')
+@click.option('--event-id', type=int, default=None, help='Only rebuild this event.')
+@click.option('--bar-days', is_flag=True, help='Also re-derive bar days (after changing BAR_TIMEZONE/BAR_DAY_CUTOFF_HOUR).')
+def rebuild_rollups_command(event_id, bar_days):
+    """Recompute event and daily stats rollups from the consumption log."""
+    count = rebuild_rollups(event_id)
+    if bar_days:
+        recompute_bar_days()
+    else:
+        rebuild_daily_rollups()
+    event_ids = [event_id] if event_id else [e.id for e in Event.query.with_entities(Event.id)]
+    versioning.bump('consumption', *(f'event:{eid}' for eid in event_ids))
+    db.session.commit()
+    print(f"Rebuilt rollups for {count} event(s) and daily rollups.")
+
+@app.cli.command('ai-cache-stats')
+def ai_cache_stats_command():
+    """Show AI response cache hit/miss counters and entry counts."""
+    for kind, row in sorted(ai_cache.stats().items()):
+        total = row['hits'] + row['misses']
+        ratio = f"{row['hits'] / total:.0%}" if total else '-'
+        print(f"{kind}: {row['hits']} hits / {row['misses']} misses ({ratio}), {row['entries']} entries")
+
+@app.cli.command('ai-cache-clear')
+@click.option('--kind', default=None, help='Only clear this kind of entry (e.g. suggest).')
+def ai_cache_clear_command(kind):
+    """Drop cached AI responses."""
+    print(f"Removed {ai_cache.clear(kind)} cached response(s).")
+
+@app.cli.command('jobs-stats')
+def jobs_stats_command():
+    """Show AI job queue depth and timings."""
+    for name, value in jobs.queue_stats().items():
+        print(f"{name}: {value}")
+
+@app.cli.command('omakase-warmup')
+def omakase_warmup_command():
+    """Pre-generate Omakase drinks for the common mood/weather combinations."""
+    added, inventory_list = omakase_pool.warm(_inventory_list)
+    status = omakase_pool.status(inventory_list)
+    print(f"Generated {added} drink(s); {status['ready']} ready "
+          f"({len(status['combos'])} combinations x {status['target']}).")
+
+@app.cli.command('pdf-fonts')
+def pdf_fonts_command():
+    """Show which fonts the PDF menus use and where they were loaded from."""
+    for name, entry in pdf_fonts.status().items():
+        if entry['path']:
+            print(f"{name}: {entry['path']} ({entry['seconds'] * 1000:.0f} ms)")
+        else:
+            print(f"{name}: not available{' - ' + entry['error'] if entry['error'] else ''}")
+    print(f"menu text: {pdf_fonts.body_font()}, title: {pdf_fonts.title_font()}")
+
+@app.cli.command('export')
+@click.argument('resource', type=click.Choice(sorted(bulk.FIELDS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(bulk.FORMATS)), default=None,
+              help='Defaults to the output file extension, else jsonl.')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=None, help='Write to a file instead of stdout.')
+def export_command(resource, fmt, output):
+    """Stream a table out as CSV or JSON Lines."""
+    fmt = fmt or (output.rsplit('.', 1)[-1] if output and output.endswith(('.csv', '.jsonl')) else 'jsonl')
+    with (open(output, 'w', encoding='utf-8', newline='') if output else nullcontext(sys.stdout)) as out:
+        for chunk in bulk.export_stream(resource, fmt):
+            out.write(chunk)
+
+@app.cli.command('import')
+@click.argument('resource', type=click.Choice(sorted(bulk.FIELDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(sorted(bulk.FORMATS)), default=None,
+              help='Defaults to the file extension.')
+def import_command(resource, path, fmt):
+    """Import a CSV or JSON Lines file in one transaction, skipping rows that already exist."""
+    g.write_transaction = True
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        result = bulk.import_records(resource, bulk.read_records(f, fmt or path.rsplit('.', 1)[-1]))
+    db.session.commit()
+    print(f"Imported {result['inserted']} {resource} row(s), skipped {result['skipped']} duplicate(s).")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # 按路由模板统计 (/event/<int:event_id>)，不按具体 URL，避免序列数量随 id 增长
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('clam_http_request_duration_seconds', time.perf_counter() - started,
+                        route=route, method=request.method, status=str(response.status_code))
+    return response
+
+@app.teardown_appcontext
+def flush_metrics(exc):
+    # 先结束请求的 session：没有提交就返回的写路由仍持有 BEGIN IMMEDIATE 的写锁，
+    # 在它之前写指标会等自己的锁直到 busy_timeout。后注册的 teardown 先执行，所以这里自己 remove()
+    db.session.remove()
+    try:
+        metrics.flush()
+    except Exception:
+        app.logger.warning("metrics flush failed", exc_info=True)
 
 @app.before_request
 def require_login():
@@ -49,7 +201,7 @@ def require_login():
     if not APP_PASSWORD:
         return # Or strictly block? Let's assume if no password set, it's open (or dev mode).
         
-    allowed_routes = ['login', 'static']
+    allowed_routes = ['login', 'static', 'metrics_endpoint']  # /metrics 自行校验 METRICS_TOKEN
     if request.endpoint not in allowed_routes and not session.get('logged_in'):
         return redirect(url_for('login'))
 
@@ -70,44 +222,72 @@ def logout():
     return redirect(url_for('login'))
 
 @app.route('/')
+@conditional(lambda: ['participant', 'event'])
 def index():
-    participants = Participant.query.all()
-    inventory = InventoryItem.query.all()
-    recipes = Recipe.query.all()
-    events = Event.query.order_by(Event.date.desc()).all()
+    snapshot = build_index_snapshot()
+    return render_template('index.html', participants=snapshot.participants, events=snapshot.events)
 
-    # Calculate 4 AM logic (Local Time)
-    now = datetime.now()
-    if now.hour < 4:
-        start_time = (now - timedelta(days=1)).replace(hour=4, minute=0, second=0, microsecond=0)
-    else:
-        start_time = now.replace(hour=4, minute=0, second=0, microsecond=0)
-    end_time = start_time + timedelta(days=1)
+def _api_scopes(resource):
+    spec = API_RESOURCES.get(resource, {})
+    # “今日战况”到了营业日分界就会变化，即使没有新数据
+    extra = current_bar_day().isoformat() if resource == 'today' else ''
+    return spec.get('scopes', []), extra + '|' + request.query_string.decode()
+
+@app.route('/api/<resource>')
+@conditional(_api_scopes)
+def api_list(resource):
+    """标签页数据分页接口，参数见 services/api.py"""
+    try:
+        page = fetch_page(resource,
+                          cursor=request.args.get('cursor'),
+                          limit=request.args.get('limit'),
+                          fields=request.args.get('fields'))
+    except ApiError as e:
+        return jsonify({'error': str(e)}), 404 if resource not in API_RESOURCES else 400
+    return jsonify(page)
 
-    # Convert to UTC for DB query
-    # Calculate offset: Local - UTC
-    utc_offset = datetime.now() - datetime.utcnow()
-    start_utc = start_time - utc_offset
-    end_utc = end_time - utc_offset
+@app.route('/makeable')
+@conditional(lambda: ['recipe', 'inventory'])
+def makeable_recipes():
+    """用现有库存能做的配方，以及只差一样配料的配方 (JSON)，见 services/makeable.py"""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return jsonify(makeable.what_can_i_make(limit))
 
-    todays_consumptions = Consumption.query.filter(
-        Consumption.timestamp >= start_utc, 
-        Consumption.timestamp < end_utc
-    ).all()
+@app.route('/export/<resource>.<fmt>')
+def export_data(resource, fmt):
+    """流式导出 CSV / JSONL，见 services/bulk.py"""
+    try:
+        chunks = bulk.export_stream(resource, fmt)
+        first = next(chunks, '')
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 404
 
-    # Map to participants
-    consumption_map = {}
-    for c in todays_consumptions:
-        if c.participant_id not in consumption_map:
-            consumption_map[c.participant_id] = []
-        consumption_map[c.participant_id].append(c)
+    def generate():
+        yield first
+        yield from chunks
 
-    for p in participants:
-        p.today_consumptions = consumption_map.get(p.id, [])
+    return Response(stream_with_context(generate()), mimetype=bulk.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={resource}.{fmt}'})
 
-    return render_template('index.html', participants=participants, inventory=inventory, recipes=recipes, events=events)
+@app.route('/import/<resource>', methods=['POST'])
+@write_transaction
+def import_data(resource):
+    """上传 CSV / JSONL 文件批量导入（表单字段 file），整个文件一个事务"""
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': '请上传文件'}), 400
+    fmt = request.form.get('format') or upload.filename.rsplit('.', 1)[-1].lower()
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        result = bulk.import_records(resource, bulk.read_records(stream, fmt))
+    except (bulk.BulkError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify(result)
 
 @app.route('/add_participant', methods=['POST'])
+@write_transaction
 def add_participant():
     name = request.form.get('name')
     if name:
@@ -121,6 +301,7 @@ def add_inventory():
     return redirect(url_for('index', _anchor='inventory')) # Deprecated, use save_inventory
 
 @app.route('/save_inventory', methods=['POST'])
+@write_transaction
 def save_inventory():
     item_id = request.form.get('item_id')
     name = request.form.get('name')
@@ -144,6 +325,7 @@ def save_inventory():
     return redirect(url_for('index', _anchor='inventory'))
 
 @app.route('/delete_inventory/<int:item_id>', methods=['POST'])
+@write_transaction
 def delete_inventory(item_id):
     item = InventoryItem.query.get(item_id)
     if item:
@@ -152,13 +334,16 @@ def delete_inventory(item_id):
     return redirect(url_for('index', _anchor='inventory'))
 
 @app.route('/log_drink', methods=['POST'])
+@write_transaction
 def log_drink():
     participant_id = request.form.get('participant_id')
     drink_name = request.form.get('drink_name')
     event_id = request.form.get('event_id')
 
     if participant_id and drink_name:
-        log = Consumption(participant_id=participant_id, drink_name=drink_name)
+        now = datetime.utcnow()
+        log = Consumption(participant_id=participant_id, drink_name=drink_name,
+                          timestamp=now, bar_day=bar_day_for(now))
         if event_id:
             log.event_id = event_id
         
@@ -168,192 +353,422 @@ def log_drink():
             log.recipe_id = recipe.id
             
         db.session.add(log)
+        db.session.flush() # Get ID for rollups
+        record_consumption(log)
         db.session.commit()
     return redirect(url_for('index', _anchor='drink'))
 
 @app.route('/delete_consumption/<int:consumption_id>', methods=['POST'])
+@write_transaction
 def delete_consumption(consumption_id):
     consumption = Consumption.query.get(consumption_id)
     if consumption:
+        retract_consumption(consumption)
         db.session.delete(consumption)
         db.session.commit()
     return redirect(url_for('index', _anchor='drink'))
 
 @app.route('/event/<int:event_id>/stats')
+@conditional(lambda event_id: [f'event:{event_id}', 'recipe'])
 def event_stats(event_id):
     event = Event.query.get_or_404(event_id)
-    consumptions = Consumption.query.filter_by(event_id=event_id).all()
-    
-    stats = {
-        'total_drinks': len(consumptions),
-        'by_participant': {},
-        'drink_counts': {},
-        'ingredient_usage': {} # New stats
-    }
-    
-    for c in consumptions:
-        # By Participant
-        p_name = c.participant.name
-        if p_name not in stats['by_participant']:
-            stats['by_participant'][p_name] = {'count': 0, 'drinks': []}
-        stats['by_participant'][p_name]['count'] += 1
-        stats['by_participant'][p_name]['drinks'].append(c.drink_name)
-        
-        # Drink Counts
-        if c.drink_name not in stats['drink_counts']:
-            stats['drink_counts'][c.drink_name] = 0
-        stats['drink_counts'][c.drink_name] += 1
-        
-        # Ingredient Usage
-        # Priority: use linked recipe, fallback to parsing? No, just use linked recipe for now.
-        if c.recipe_id:
-            recipe = Recipe.query.get(c.recipe_id)
-            if recipe:
-                for ing in recipe.ingredients_structured:
-                    # Key by ingredient name + unit to avoid mixing units (e.g. ml vs oz)
-                    # Or normalize? Let's just key by name and assume unit consistency or display unit
-                    key = f"{ing.name} ({ing.unit})"
-                    if key not in stats['ingredient_usage']:
-                        stats['ingredient_usage'][key] = 0.0
-                    if ing.amount:
-                        stats['ingredient_usage'][key] += ing.amount
-        
-    # Sort top drinks
-    stats['top_drinks'] = sorted(stats['drink_counts'].items(), key=lambda x: x[1], reverse=True)
-    
-    # Sort ingredients
-    stats['ingredient_usage'] = sorted(stats['ingredient_usage'].items(), key=lambda x: x[1], reverse=True)
-    
+    stats = compute_event_stats(event_id)
     return render_template('event_stats.html', event=event, stats=stats)
 
+@app.route('/day/<day>')
+@conditional(lambda day: (['consumption'], current_bar_day().isoformat() if day == 'today' else day))
+def day_stats(day):
+    """某个营业日的饮酒统计 (JSON)，day 为 YYYY-MM-DD 或 today"""
+    if day == 'today':
+        bar_day = current_bar_day()
+    else:
+        try:
+            bar_day = datetime.strptime(day, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+    stats = compute_day_stats(bar_day)
+    stats['bar_day'] = bar_day.isoformat()
+    return jsonify(stats)
+
 @app.route('/event/<int:event_id>/get_summary', methods=['POST'])
 def get_event_summary(event_id):
+    """总结按统计文本哈希缓存；background=1 时先返回旧总结，后台重新生成"""
     event = Event.query.get_or_404(event_id)
-    consumptions = Consumption.query.filter_by(event_id=event_id).all()
-    
-    # Calculate stats for summary
-    stats = {
-        'total_drinks': len(consumptions),
-        'by_participant': {},
-        'drink_counts': {}
-    }
-    for c in consumptions:
-        p_name = c.participant.name
-        if p_name not in stats['by_participant']:
-            stats['by_participant'][p_name] = {'count': 0, 'drinks': []}
-        stats['by_participant'][p_name]['count'] += 1
-        stats['by_participant'][p_name]['drinks'].append(c.drink_name)
-        
-        if c.drink_name not in stats['drink_counts']:
-            stats['drink_counts'][c.drink_name] = 0
-        stats['drink_counts'][c.drink_name] += 1
-        
+    stats = compute_event_stats(event_id, include_ingredients=False)
+
     # Format stats for LLM
-    stats_text = f"总共喝了 {stats['total_drinks']} 杯。\n"
-    
-    # MVP
-    mvp = None
-    max_count = 0
-    for name, data in stats['by_participant'].items():
-        if data['count'] > max_count:
-            max_count = data['count']
-            mvp = name
-    
-    if mvp:
-        stats_text += f"今日酒神 (MVP)：{mvp}，喝了 {max_count} 杯。\n"
-    
-    stats_text += "大家喝了：\n"
-    for drink, count in stats['drink_counts'].items():
-        stats_text += f"- {drink}: {count} 杯\n"
-        
-    summary = generate_event_summary(event.name, str(event.date), stats_text)
-    
-    top_drinks = sorted(stats['drink_counts'].items(), key=lambda x: x[1], reverse=True)[:5]
+    stats_text = format_stats_text(stats)
+    stats_hash = event_summary.stats_fingerprint(event.name, str(event.date), stats_text)
+    event_name, date_str = event.name, str(event.date)
+    db.session.close()
 
-    return jsonify({
+    summary, cached_hash = event_summary.load(event_id)
+    state = 'HIT'
+    if _wants_fresh() or summary is None:
+        summary = event_summary.generate(event_id, event_name, date_str, stats_text, stats_hash,
+                                         previous=summary)
+        state = 'MISS'
+    elif cached_hash != stats_hash:
+        if request.form.get('background', '').lower() in ('1', 'true', 'on', 'yes'):
+            try:
+                jobs.submit('event_summary', {'event_id': event_id}, priority=JOB_PRIORITIES['event_summary'],
+                            unique=True)
+            except jobs.QueueFull:
+                pass  # 旧总结照样返回，下次请求再排队
+            state = 'STALE'
+        else:
+            summary = event_summary.generate(event_id, event_name, date_str, stats_text, stats_hash,
+                                             previous=summary)
+            state = 'MISS'
+
+    response = jsonify({
         'summary': summary,
-        'mvp': mvp,
-        'mvp_count': max_count,
-        'top_drinks': top_drinks
+        'stale': state == 'STALE',
+        'mvp': stats['mvp'],
+        'mvp_count': stats['mvp_count'],
+        'top_drinks': stats['top_drinks'][:5]
     })
+    response.headers['X-Cache'] = state
+    metrics.inc('clam_event_summary_requests_total', state=state.lower())
+    return response
+
+
+def _wants_fresh():
+    """Per-request cache bypass: form field fresh=1 asks the AI for a new idea."""
+    return request.form.get('fresh', '').lower() in ('1', 'true', 'on', 'yes')
+
+def _inventory_list():
+    inventory = InventoryItem.query.all()
+    return [f"{item.name} ({item.category})" for item in inventory]
 
+def _suggestion_cache_key(inventory_list, user_request):
+    return ai_cache.make_key('suggest',
+                             inventory=ai_cache.inventory_fingerprint(inventory_list),
+                             request=ai_cache.normalize_text(user_request),
+                             model=DEFAULT_MODEL, temperature=SUGGESTION_TEMPERATURE)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _on_done(events, finish):
+    """Pass stream events through, replacing the final result with finish(result)."""
+    for kind, *payload in events:
+        if kind == 'done':
+            yield ('done', finish(payload[0]))
+        else:
+            yield (kind, *payload)
+
+def _sse_response(events):
+    """把 llm_service.stream_* 产生的 ('token'|'field'|'guest'|'done', ...) 转成 Server-Sent Events：
+    token 为原始增量文本，field 为已完整的顶层字段，guest 为批量 Omakase 中一位客人的结果，
+    done 为与非流式接口相同的最终结果。"""
+    # 查询已经做完，流式输出期间不占用数据库连接
+    db.session.close()
+
+    def generate():
+        for kind, *payload in events:
+            if kind == 'token':
+                yield _sse('token', {'text': payload[0]})
+            elif kind == 'field':
+                yield _sse('field', {'name': payload[0], 'value': payload[1]})
+            elif kind == 'guest':
+                yield _sse('guest', payload[0])
+            else:
+                yield _sse('done', payload[0])
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _replay(result):
+    """Stream events for an already known result (cache hit)."""
+    for name, value in result.items():
+        yield ('field', name, value)
+    yield ('done', result)
 
 @app.route('/suggest', methods=['POST'])
 def suggest():
     try:
-        inventory = InventoryItem.query.all()
-        inventory_list = [f"{item.name} ({item.category})" for item in inventory]
-
+        inventory_list = _inventory_list()
         user_request = request.form.get('user_request', '')
-        suggestion = get_cocktail_suggestion(inventory_list, user_request)
+        key = _suggestion_cache_key(inventory_list, user_request)
+        suggestion, hit = ai_cache.get_or_compute(
+            'suggest', key,
+            lambda: get_cocktail_suggestion(inventory_list, user_request,
+                                            stale=lambda: ai_cache.lookup_stale('suggest', key)),
+            bypass=_wants_fresh() or not llm_enabled(), cacheable=is_complete_recipe)
 
         # suggestion is now a dict
-        return jsonify(suggestion)
+        response = jsonify(suggestion)
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
 
     except Exception as e:
         return jsonify({
             'error': str(e)
         }), 500
 
+def _suggestion_events(inventory_list, user_request, fresh=False):
+    """Stream events for a suggestion, served from / stored into the AI cache. Returns (events, hit)."""
+    key = _suggestion_cache_key(inventory_list, user_request)
+    use_cache = llm_enabled() and not fresh
+    cached = ai_cache.lookup('suggest', key) if use_cache else None
+    if cached is not None:
+        return _replay(cached), True
+
+    def finish(result):
+        if llm_enabled() and is_complete_recipe(result):
+            ai_cache.store('suggest', key, result)
+        return result
+
+    stale = lambda: ai_cache.lookup_stale('suggest', key)
+    return _on_done(stream_cocktail_suggestion(inventory_list, user_request, stale=stale), finish), False
+
+@app.route('/suggest/stream', methods=['POST'])
+def suggest_stream():
+    """/suggest 的流式版本 (SSE)"""
+    events, hit = _suggestion_events(_inventory_list(), request.form.get('user_request', ''), _wants_fresh())
+    response = _sse_response(events)
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
 @app.route('/omakase', methods=['POST'])
 def omakase():
     try:
-        inventory = InventoryItem.query.all()
-        inventory_list = [f"{item.name} ({item.category})" for item in inventory]
+        inventory_list = _inventory_list()
         
         mood = request.form.get('mood', '平静')
         weather = request.form.get('weather', '晴朗')
         
-        suggestion = get_omakase_suggestion(inventory_list, mood, weather)
+        # 常见的心情/天气组合先从预先生成的池子里拿 (services/omakase_pool.py)
+        suggestion = omakase_pool.take(inventory_list, mood, weather)
+        hit = suggestion is not None
+        if not hit:
+            suggestion = get_omakase_suggestion(inventory_list, mood, weather)
         # suggestion is now a dict
-        return jsonify(suggestion)
+        response = jsonify(suggestion)
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/omakase/stream', methods=['POST'])
+def omakase_stream():
+    """/omakase 的流式版本 (SSE)"""
+    inventory_list = _inventory_list()
+    mood, weather = request.form.get('mood', '平静'), request.form.get('weather', '晴朗')
+    prepared = omakase_pool.take(inventory_list, mood, weather)
+    if prepared is not None:
+        response = _sse_response(_replay(prepared))
+    else:
+        response = _sse_response(stream_omakase_suggestion(inventory_list, mood, weather))
+    response.headers['X-Cache'] = 'HIT' if prepared is not None else 'MISS'
+    return response
+
+@app.route('/omakase/batch', methods=['POST'])
+def omakase_batch():
+    """一次为多位客人特调 (SSE)：guest_name[] / guest_mood[] 一一对应，共用 weather；
+    每位客人的结果一完成就推送 guest 事件，最后 done 事件按客人顺序给出全部结果"""
+    names = request.form.getlist('guest_name[]')
+    moods = request.form.getlist('guest_mood[]')
+    guests = [{'name': (name or '').strip() or f'客人{i + 1}', 'mood': (mood or '').strip() or '平静'}
+              for i, (name, mood) in enumerate(zip(names, moods))]
+    if not guests:
+        return jsonify({'error': '请至少添加一位客人'}), 400
+    if len(guests) > OMAKASE_BATCH_MAX_GUESTS:
+        return jsonify({'error': f'一次最多为 {OMAKASE_BATCH_MAX_GUESTS} 位客人特调'}), 400
+    inventory_list = _inventory_list()
+    return _sse_response(stream_omakase_batch(
+        inventory_list, guests, request.form.get('weather', '晴朗'),
+        prepared=lambda mood, weather: omakase_pool.take(inventory_list, mood, weather)))
+
+@app.route('/omakase/pool')
+def omakase_pool_status():
+    """预先生成的 Omakase：各常见组合还剩几杯"""
+    return jsonify(omakase_pool.status(_inventory_list()))
+
+@app.route('/omakase/pool/warmup', methods=['POST'])
+def omakase_pool_warmup():
+    """在后台为常见组合补齐预先生成的 Omakase，返回任务 id（可轮询 GET /jobs/<id>）"""
+    if not omakase_pool.enabled():
+        return jsonify({'error': '未配置 AI 或已关闭预热 (OMAKASE_POOL_VARIANTS=0)'}), 400
+    job_id = omakase_pool.schedule_refresh()
+    if job_id is None:
+        return jsonify({'error': 'AI 任务队列已满，请稍后再试'}), 503
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+def _sommelier_recipes(user_request):
+    """酒单中与需求最相关的前 K 个配方：[{'name', 'ingredients', 'id'}]，见 services/sommelier_rank.py"""
+    return sommelier_rank.candidates(user_request)
+
+def _attach_recipe_id(result, recipes_data):
+    # 如果成功推荐，补充配方ID
+    if 'recommendation' in result and 'name' in result['recommendation']:
+        recommended_name = result['recommendation']['name']
+        # 查找对应的配方ID
+        for r in recipes_data:
+            if r['name'] == recommended_name:
+                result['recommendation']['recipe_id'] = r['id']
+                break
+    return result
+
 @app.route('/sommelier_recommend', methods=['POST'])
 def sommelier_recommend():
     """专业侍酒师推荐（从现有配方中选择）"""
     try:
-        # 读取所有配方
-        recipes = Recipe.query.all()
-        if not recipes:
+        # 读取与需求最相关的配方
+        user_request = request.form.get('user_request', '')
+        recipes_data = _sommelier_recipes(user_request)
+        if not recipes_data:
             return jsonify({'error': '配方本为空，请先添加配方'}), 400
         
-        # 构造配方数据
-        recipes_data = []
-        for r in recipes:
-            ingredients_str = ", ".join([
-                f"{ing.name} {ing.amount}{ing.unit}" 
-                for ing in r.ingredients_structured
-            ])
-            recipes_data.append({
-                'name': r.name,
-                'ingredients': ingredients_str,
-                'id': r.id
-            })
-        
-        user_request = request.form.get('user_request', '')
         if not user_request:
             return jsonify({'error': '请描述您的需求'}), 400
         
         # 调用侍酒师推荐服务
         result = get_sommelier_recommendation(recipes_data, user_request)
-        
-        # 如果成功推荐，补充配方ID
-        if 'recommendation' in result and 'name' in result['recommendation']:
-            recommended_name = result['recommendation']['name']
-            # 查找对应的配方ID
-            for r in recipes_data:
-                if r['name'] == recommended_name:
-                    result['recommendation']['recipe_id'] = r['id']
-                    break
-        
-        return jsonify(result)
+        return jsonify(_attach_recipe_id(result, recipes_data))
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/sommelier_recommend/stream', methods=['POST'])
+def sommelier_recommend_stream():
+    """/sommelier_recommend 的流式版本 (SSE)；field 事件是 recommendation 内的字段"""
+    user_request = request.form.get('user_request', '')
+    recipes_data = _sommelier_recipes(user_request)
+    if not recipes_data:
+        return jsonify({'error': '配方本为空，请先添加配方'}), 400
+    if not user_request:
+        return jsonify({'error': '请描述您的需求'}), 400
+    return _sse_response(_on_done(stream_sommelier_recommendation(recipes_data, user_request),
+                                  lambda result: _attach_recipe_id(result, recipes_data)))
+
+# ---------- 后台 AI 任务 (services/jobs.py) ----------
+# 提交时在请求里读取库存/酒单，任务参数里带着，后台线程不依赖请求上下文
+
+# 优先级只由服务端按任务类型决定，不接受请求里的 priority（否则谁都能插队）
+JOB_PRIORITIES = {'suggest': 10, 'omakase': 10, 'sommelier': 10, 'event_summary': 0}
+
+@jobs.handler('suggest')
+def _suggest_job(params):
+    return _suggestion_events(params['inventory_list'], params['user_request'], params.get('fresh'))[0]
+
+@jobs.handler('omakase')
+def _omakase_job(params):
+    return stream_omakase_suggestion(params['inventory_list'], params['mood'], params['weather'])
+
+@jobs.handler(omakase_pool.WARMUP_JOB)
+def _omakase_warmup_job(params):
+    """Top up the pre-generated Omakase pool for the inventory as it is when the job finishes."""
+    def load_inventory():
+        try:
+            return _inventory_list()
+        finally:
+            db.session.close()
+
+    added, inventory_list = omakase_pool.warm(load_inventory)
+    yield ('done', dict(omakase_pool.status(inventory_list), added=added))
+
+@jobs.handler('sommelier')
+def _sommelier_job(params):
+    return _on_done(stream_sommelier_recommendation(params['recipes_data'], params['user_request']),
+                    lambda result: _attach_recipe_id(result, params['recipes_data']))
+
+@jobs.handler('event_summary')
+def _event_summary_job(params):
+    """Regenerate a stale event summary from the current stats (queued by get_summary)."""
+    event = db.session.get(Event, params['event_id'])
+    if event is None:
+        yield ('done', {'error': '活动不存在'})
+        return
+    stats_text = format_stats_text(compute_event_stats(event.id, include_ingredients=False))
+    stats_hash = event_summary.stats_fingerprint(event.name, str(event.date), stats_text)
+    summary, cached_hash = event_summary.load(event.id)
+    if cached_hash != stats_hash:
+        summary = event_summary.generate(event.id, event.name, str(event.date), stats_text, stats_hash,
+                                         previous=summary)
+    db.session.close()
+    yield ('done', {'summary': summary})
+
+def _job_params(kind):
+    """Build job params from the form; returns (params, error message)."""
+    if kind == 'suggest':
+        return {'inventory_list': _inventory_list(), 'user_request': request.form.get('user_request', ''),
+                'fresh': _wants_fresh()}, None
+    if kind == 'omakase':
+        return {'inventory_list': _inventory_list(), 'mood': request.form.get('mood', '平静'),
+                'weather': request.form.get('weather', '晴朗')}, None
+    if kind == 'sommelier':
+        user_request = request.form.get('user_request', '')
+        recipes_data = _sommelier_recipes(user_request)
+        if not recipes_data:
+            return None, '配方本为空，请先添加配方'
+        if not user_request:
+            return None, '请描述您的需求'
+        return {'recipes_data': recipes_data, 'user_request': user_request}, None
+    if kind == 'event_summary':
+        event_id = request.form.get('event_id', type=int)
+        if event_id is None or db.session.get(Event, event_id) is None:
+            return None, '活动不存在'
+        return {'event_id': event_id}, None
+    return None, None
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 抓取接口：所有 worker 合并后的指标"""
+    if APP_PASSWORD and not session.get('logged_in'):
+        # 抓取程序没有登录会话，用 Authorization: Bearer <METRICS_TOKEN> 访问
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not METRICS_TOKEN or not hmac.compare_digest(supplied, METRICS_TOKEN):
+            return Response('unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.before_request
+def start_job_workers():
+    jobs.start_workers(app)
+
+@app.route('/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    """提交后台 AI 任务，立即返回 job id；之后轮询 GET /jobs/<id>"""
+    if kind not in JOB_PRIORITIES:
+        return jsonify({'error': f'未知任务类型: {kind}'}), 404
+    params, error = _job_params(kind)
+    if error:
+        return jsonify({'error': error}), 400
+    db.session.close()
+    if kind == 'omakase':
+        prepared = omakase_pool.take(params['inventory_list'], params['mood'], params['weather'])
+        if prepared is not None:
+            # 池子里有现成的：不排队，直接给结果
+            return jsonify({'job_id': None, 'status': 'done', 'result': prepared})
+    try:
+        job_id = jobs.submit(kind, params, priority=JOB_PRIORITIES[kind])
+    except jobs.QueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/jobs/stats')
+def job_stats():
+    return jsonify(jobs.queue_stats())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    status = jobs.cancel(job_id)
+    if status is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify({'job_id': job_id, 'status': status})
+
 @app.route('/save_recipe', methods=['POST'])
+@write_transaction
 def save_recipe():
     recipe_id = request.form.get('recipe_id')
     name = request.form.get('name')
@@ -403,6 +818,8 @@ def save_recipe():
                         new_ing = RecipeIngredient(recipe_id=recipe.id, name=n, amount=amount_val, unit=u)
                         db.session.add(new_ing)
                 
+                # Ingredient usage of past drinks follows the edited recipe
+                rebuild_ingredient_rollups(events_using_recipe(recipe.id))
                 db.session.commit()
         else:
             # Create new recipe
@@ -431,10 +848,14 @@ def save_recipe():
     return redirect(url_for('index', _anchor='recipes'))
 
 @app.route('/delete_recipe/<int:recipe_id>', methods=['POST'])
+@write_transaction
 def delete_recipe(recipe_id):
     recipe = Recipe.query.get(recipe_id)
     if recipe:
+        affected_events = events_using_recipe(recipe.id)
         db.session.delete(recipe)
+        db.session.flush()
+        rebuild_ingredient_rollups(affected_events)
         db.session.commit()
     return redirect(url_for('index', _anchor='recipes'))
 
@@ -449,39 +870,9 @@ def generate_menu():
     c = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
     
-    # Fonts
-    # 强制使用本地字体文件，避免系统差异
+    # Fonts：进程启动时已注册 (services/pdf_fonts.py)
     # 将字体文件 simkai.ttf 放入项目根目录下的 fonts 文件夹中
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    font_path = os.path.join(base_dir, 'fonts', 'simkai.ttf')
-    
-    font_name = 'Helvetica' # Fallback
-    
-    if os.path.exists(font_path):
-        try:
-            pdfmetrics.registerFont(TTFont('KaiTi', font_path))
-            font_name = 'KaiTi'
-        except Exception as e:
-            print(f"Font loading error: {e}")
-            # Fallback to system font if local fails (dev environment)
-            sys_font_path = "C:\\Windows\\Fonts\\simkai.ttf"
-            if os.path.exists(sys_font_path):
-                 try:
-                    pdfmetrics.registerFont(TTFont('KaiTi', sys_font_path))
-                    font_name = 'KaiTi'
-                 except:
-                     pass
-    else:
-        # Fallback to system font (Windows Dev)
-        sys_font_path = "C:\\Windows\\Fonts\\simkai.ttf"
-        if os.path.exists(sys_font_path):
-             try:
-                pdfmetrics.registerFont(TTFont('KaiTi', sys_font_path))
-                font_name = 'KaiTi'
-             except:
-                 pass
-        else:
-             print(f"Warning: Font file not found at {font_path}")
+    font_name = pdf_fonts.body_font()
 
     # Colors
     bg_color = HexColor('#F9F7F2') # Warm Rice Paper
@@ -679,42 +1070,9 @@ def generate_menu_by_spirit():
     c = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
     
-    # Font setup (same as original)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    font_path = os.path.join(base_dir, 'fonts', 'simkai.ttf')
-    font_name = 'Helvetica'
-    
-    if os.path.exists(font_path):
-        try:
-            pdfmetrics.registerFont(TTFont('KaiTi', font_path))
-            font_name = 'KaiTi'
-        except Exception as e:
-            print(f"Font loading error: {e}")
-            sys_font_path = "C:\\Windows\\Fonts\\simkai.ttf"
-            if os.path.exists(sys_font_path):
-                try:
-                    pdfmetrics.registerFont(TTFont('KaiTi', sys_font_path))
-                    font_name = 'KaiTi'
-                except:
-                    pass
-    else:
-        sys_font_path = "C:\\Windows\\Fonts\\simkai.ttf"
-        if os.path.exists(sys_font_path):
-            try:
-                pdfmetrics.registerFont(TTFont('KaiTi', sys_font_path))
-                font_name = 'KaiTi'
-            except:
-                pass
-    
-    # Register QWERTYpe font for title
-    qwertype_font_path = os.path.join(base_dir, 'fonts', 'QWERTYpe.ttf')
-    title_font_name = font_name  # Default to KaiTi
-    if os.path.exists(qwertype_font_path):
-        try:
-            pdfmetrics.registerFont(TTFont('QWERTYpe', qwertype_font_path))
-            title_font_name = 'QWERTYpe'
-        except Exception as e:
-            print(f"QWERTYpe font loading error: {e}")
+    # Fonts (services/pdf_fonts.py): KaiTi for text, QWERTYpe for the title
+    font_name = pdf_fonts.body_font()
+    title_font_name = pdf_fonts.title_font()
     
     # Colors
     bg_color = HexColor('#F9F7F2')
@@ -736,17 +1094,13 @@ def generate_menu_by_spirit():
     draw_page_template(c)
     
     # ========== COVER PAGE ==========
-    # Logo at top (if exists)
-    logo_path = os.path.join(base_dir, 'static', 'images', 'The Drunken Clam.png')
-    if os.path.exists(logo_path):
-        try:
-            logo_width = 120*mm
-            logo_height = 55*1.5*mm
-            logo_x = (width - logo_width) / 2
-            logo_y = height - 140*mm
-            c.drawImage(logo_path, logo_x, logo_y, width=logo_width, height=logo_height, preserveAspectRatio=True, mask='auto')
-        except Exception as e:
-            print(f"Logo loading error: {e}")
+    # Logo at top (if exists): pre-scaled once per process (services/pdf_assets.py)
+    logo = pdf_assets.logo()
+    if logo is not None:
+        logo_width, logo_height = pdf_assets.COVER_LOGO_SIZE
+        logo_x = (width - logo_width) / 2
+        logo_y = height - 140*mm
+        c.drawImage(logo, logo_x, logo_y, width=logo_width, height=logo_height, preserveAspectRatio=True, mask='auto')
     
     # Large centered title (moved down)
     c.setFillColor(text_main)
@@ -1133,6 +1487,7 @@ def generate_menu_by_spirit():
     return response
 
 @app.route('/create_event', methods=['POST'])
+@write_transaction
 def create_event():
     name = request.form.get('name')
     date_str = request.form.get('date')
@@ -1152,6 +1507,7 @@ def create_event():
     return redirect(url_for('index', _anchor='events'))
 
 @app.route('/event/<int:event_id>/add_recipe', methods=['POST'])
+@write_transaction
 def add_recipe_to_event(event_id):
     recipe_id = request.form.get('recipe_id')
     event = Event.query.get_or_404(event_id)
@@ -1164,6 +1520,7 @@ def add_recipe_to_event(event_id):
     return redirect(url_for('index', _anchor='events'))
 
 @app.route('/event/<int:event_id>/remove_recipe', methods=['POST'])
+@write_transaction
 def remove_recipe_from_event(event_id):
     recipe_id = request.form.get('recipe_id')
     event = Event.query.get_or_404(event_id)
@@ -1176,6 +1533,7 @@ def remove_recipe_from_event(event_id):
     return redirect(url_for('index', _anchor='events'))
 
 @app.route('/get_bartenders', methods=['GET'])
+@conditional(lambda: ['bartender'])
 def get_bartenders():
     bartenders = Bartender.query.order_by(Bartender.order).all()
     return jsonify([{
@@ -1187,6 +1545,7 @@ def get_bartenders():
     } for b in bartenders])
 
 @app.route('/save_bartender', methods=['POST'])
+@write_transaction
 def save_bartender():
     b_id = request.form.get('id')
     name = request.form.get('name')
@@ -1210,6 +1569,7 @@ def save_bartender():
     return jsonify({'success': True})
 
 @app.route('/delete_bartender/<int:b_id>', methods=['POST'])
+@write_transaction
 def delete_bartender(b_id):
     b = Bartender.query.get(b_id)
     if b:
@@ -0,0 +1,219 @@
+"""AI 接口压测：/suggest、/omakase、/sommelier_recommend、/event/<id>/get_summary
+
+用法 (在项目根目录)：
+    python benchmarks/ai_load_test.py --concurrency 16 --requests 400 --latency 2 --jitter 0.5
+    python benchmarks/ai_load_test.py --endpoints suggest,summary --same-input     # 观察缓存与请求合并
+    python benchmarks/ai_load_test.py --error-rate 0.3                             # 观察熔断与备选结果
+    python benchmarks/ai_load_test.py --stub-url http://127.0.0.1:8900/v1/chat/completions
+
+默认在后台线程启动本地 DashScope 桩服务器 (benchmarks/dashscope_stub.py)，在临时目录里新建数据库，
+导入示例库存、配方和几场活动的饮酒记录，再用 gunicorn 启动应用（DASHSCOPE_URL 指向桩服务器），
+然后以固定并发轮流请求各接口，输出每个接口的 p50/p95/p99 延迟和吞吐量。
+
+默认每个请求的输入都不同，并带 fresh=1 跳过 AI 缓存，测的是真正调用 AI 的路径；
+--same-input 时所有请求输入相同，测缓存命中与相同请求合并后的效果。
+活动总结在 --events 场活动之间轮换，同一场活动的并发请求仍会被合并。
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import requests
+
+from concurrency_bench import ROOT, _free_port, _wait_ready, _percentile
+from dashscope_stub import start_stub, add_arguments as add_stub_arguments
+
+sys.path.insert(0, ROOT)
+
+from services.llm_service import MOCK_SUMMARY, SUMMARY_FAILED_PREFIX  # noqa: E402
+
+ENDPOINTS = ('suggest', 'omakase', 'sommelier', 'summary')
+
+INVENTORY = [('孟买蓝宝石金酒', 'Gin'), ('绝对伏特加', 'Vodka'), ('百加得白朗姆', 'Rum'), ('通宁水', 'Mixer'),
+             ('苏打水', 'Mixer'), ('青柠', 'Fruit'), ('柠檬', 'Fruit'), ('薄荷', 'Herb'), ('糖浆', 'Syrup')]
+
+RECIPES = [
+    ('金汤力', [('金酒', 45), ('通宁水', 120), ('青柠', 1)]),
+    ('莫吉托', [('白朗姆', 45), ('薄荷', 6), ('青柠', 1), ('糖浆', 15), ('苏打水', 60)]),
+    ('伏特加汤力', [('伏特加', 45), ('通宁水', 120)]),
+    ('金菲士', [('金酒', 45), ('柠檬汁', 25), ('糖浆', 15), ('苏打水', 60)]),
+    ('大吉利', [('白朗姆', 60), ('青柠汁', 25), ('糖浆', 15)]),
+    ('柯林斯', [('金酒', 45), ('柠檬汁', 25), ('糖浆', 15), ('苏打水', 90)]),
+]
+
+
+def _jsonl(records):
+    return io.BytesIO('\n'.join(json.dumps(r, ensure_ascii=False) for r in records).encode())
+
+
+def seed(base_url, events):
+    """Inventory, recipes and a few drinks for each of ``events`` events via /import."""
+    http = requests.Session()
+    uploads = {
+        'inventory': [{'name': name, 'category': category, 'quantity': '1瓶'} for name, category in INVENTORY],
+        'recipes': [{'name': name, 'recipe_type': 'cocktail', 'instructions': '摇匀或搅拌后滤入杯中。',
+                     'ingredients_structured': [{'name': n, 'amount': a, 'unit': 'ml'} for n, a in ingredients]}
+                    for name, ingredients in RECIPES],
+        'consumption': [{'participant': f'朋友{j}', 'drink_name': RECIPES[(i + j) % len(RECIPES)][0],
+                         'timestamp': (datetime(2024, 1, 1, 21) + timedelta(days=i, minutes=j)).isoformat(),
+                         'event_name': f'压测聚会 {i + 1}', 'event_date': (datetime(2024, 1, 1) + timedelta(days=i)).date().isoformat()}
+                        for i in range(events) for j in range(4)],
+    }
+    for resource, records in uploads.items():
+        resp = http.post(f'{base_url}/import/{resource}', files={'file': (f'{resource}.jsonl', _jsonl(records))})
+        resp.raise_for_status()
+
+
+def event_ids(base_url):
+    resp = requests.get(base_url + '/api/events', params={'limit': 200, 'fields': 'id'})
+    resp.raise_for_status()
+    return [item['id'] for item in resp.json()['items']]
+
+
+def build_request(endpoint, n, events, same_input):
+    """(path, form data) for the n-th request to an endpoint."""
+    tag = '' if same_input else f' #{n}'
+    fresh = {} if same_input else {'fresh': '1'}
+    if endpoint == 'suggest':
+        return '/suggest', dict(fresh, user_request=f'清爽一点，不要太甜{tag}')
+    if endpoint == 'omakase':
+        return '/omakase', {'mood': f'平静{tag}', 'weather': '晴朗'}
+    if endpoint == 'sommelier':
+        return '/sommelier_recommend', {'user_request': f'想喝点果味、带气泡的{tag}'}
+    return f'/event/{events[n % len(events)]}/get_summary', fresh
+
+
+def outcome(resp):
+    if resp.status_code != 200:
+        return str(resp.status_code)
+    try:
+        body = resp.json()
+    except ValueError:
+        return 'bad-json'
+    if 'error' in body or (body.get('summary') or '').startswith(SUMMARY_FAILED_PREFIX):
+        return 'error'
+    if body.get('summary') == MOCK_SUMMARY:
+        return 'fallback'
+    if body.get('fallback') or (body.get('recommendation') or {}).get('fallback'):
+        return 'fallback'
+    return 'ok'
+
+
+def drive(base_url, endpoints, total, concurrency, events, same_input):
+    """Send ``total`` requests round-robin over the endpoints; returns (results, wall seconds)."""
+    results = defaultdict(lambda: {'latencies': [], 'outcomes': Counter()})
+    lock = threading.Lock()
+    counter = [0]
+
+    def client():
+        http = requests.Session()
+        while True:
+            with lock:
+                n = counter[0]
+                if n >= total:
+                    return
+                counter[0] += 1
+            endpoint = endpoints[n % len(endpoints)]
+            path, data = build_request(endpoint, n // len(endpoints), events, same_input)
+            start = time.perf_counter()
+            try:
+                result = outcome(http.post(base_url + path, data=data, timeout=120))
+            except requests.RequestException:
+                result = 'conn-error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                results[endpoint]['latencies'].append(elapsed)
+                results[endpoint]['outcomes'][result] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - started
+
+
+def report(results, wall):
+    print(f"{'endpoint':<12}{'count':>7}{'ok':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'req/s':>9}  outcomes")
+    everything = []
+    for endpoint in ENDPOINTS:
+        if endpoint not in results:
+            continue
+        latencies, outcomes = results[endpoint]['latencies'], results[endpoint]['outcomes']
+        everything += latencies
+        print(f"{endpoint:<12}{len(latencies):>7}{outcomes['ok']:>7}"
+              f"{_percentile(latencies, 50) * 1000:>8.0f}ms{_percentile(latencies, 95) * 1000:>8.0f}ms"
+              f"{_percentile(latencies, 99) * 1000:>8.0f}ms{len(latencies) / wall:>9.2f}  {dict(outcomes)}")
+    print(f"{'all':<12}{len(everything):>7}{'':>7}"
+          f"{_percentile(everything, 50) * 1000:>8.0f}ms{_percentile(everything, 95) * 1000:>8.0f}ms"
+          f"{_percentile(everything, 99) * 1000:>8.0f}ms{len(everything) / wall:>9.2f}  wall={wall:.1f}s")
+
+
+def run(args):
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        sys.exit(f"unknown endpoint(s): {', '.join(sorted(unknown))} (choose from {', '.join(ENDPOINTS)})")
+
+    stub = None
+    stub_url = args.stub_url
+    if not stub_url:
+        stub, stub_url = start_stub(0, args.latency, args.jitter, args.error_rate, args.chunk_size)
+
+    workdir = tempfile.mkdtemp(prefix='clam-ai-bench-')
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        DASHSCOPE_URL=stub_url,
+        DASHSCOPE_API_KEY=os.environ.get('DASHSCOPE_API_KEY', 'stub') if args.stub_url else 'stub',
+        APP_PASSWORD='',
+    )
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-k', 'gthread', '--threads', str(args.threads),
+         '-t', '120', '-b', f'127.0.0.1:{port}', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(base_url, proc)
+        seed(base_url, args.events)
+        events = event_ids(base_url)
+        results, wall = drive(base_url, endpoints, args.requests, args.concurrency, events, args.same_input)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        if stub:
+            stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"workers={args.workers}x{args.threads} threads concurrency={args.concurrency} "
+          f"input={'same' if args.same_input else 'unique+fresh'} "
+          + (f"stub={args.stub_url}" if args.stub_url else
+             f"stub latency={args.latency}s±{args.jitter}s error_rate={args.error_rate:g}"))
+    report(results, wall)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated subset of ' + ', '.join(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='Total requests across all endpoints')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker (gthread)')
+    parser.add_argument('--events', type=int, default=5, help='Events to seed and rotate summary requests over')
+    parser.add_argument('--same-input', action='store_true', help='Identical inputs, no fresh=1 (cache/coalescing)')
+    parser.add_argument('--stub-url', default=None,
+                        help='Use an already running stub (or real endpoint; uses DASHSCOPE_API_KEY) instead')
+    add_stub_arguments(parser)
+    run(parser.parse_args())
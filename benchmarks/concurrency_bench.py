@@ -0,0 +1,157 @@
+"""并发写入压测：多个 gunicorn worker 同时处理 /log_drink
+
+用法 (在项目根目录)：
+    python benchmarks/concurrency_bench.py --workers 4 --clients 32 --requests 2000
+    python benchmarks/concurrency_bench.py --journal-mode DELETE --no-immediate   # 对比旧行为
+
+会在临时目录里新建一个数据库，启动 gunicorn，等所有 worker 都加载完应用（post_worker_init 钩子在
+临时目录里各写一个标记文件）后，再用多个线程并发 POST /log_drink，
+最后输出吞吐量、延迟分位数以及失败（含 "database is locked" 导致的 500）次数。
+gunicorn 启动失败时输出它的日志末尾。
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# gunicorn 配置：每个 worker 加载完应用后写一个标记文件
+GUNICORN_CONFIG = '''
+import os
+
+def post_worker_init(worker):
+    open(os.path.join({ready_dir!r}, str(worker.pid)), 'w').close()
+'''
+
+
+def _log_tail(path, lines=20):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return ''.join(f.readlines()[-lines:])
+
+
+def _wait_ready(base_url, proc, ready_dir, workers, log_path, timeout=60):
+    """Wait until every worker has loaded the app and the server answers."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited early:\n{_log_tail(log_path)}")
+        if len(os.listdir(ready_dir)) >= workers:
+            try:
+                requests.get(base_url + '/login', timeout=5)
+                return
+            except requests.RequestException:
+                pass
+        time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not start in time:\n{_log_tail(log_path)}")
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='clam-bench-')
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        SQLITE_JOURNAL_MODE=args.journal_mode,
+        SQLITE_IMMEDIATE_WRITES='0' if args.no_immediate else '1',
+        APP_PASSWORD='',
+    )
+    if args.busy_timeout is not None:
+        env['SQLITE_BUSY_TIMEOUT_MS'] = str(args.busy_timeout)
+
+    ready_dir = os.path.join(workdir, 'ready')
+    os.mkdir(ready_dir)
+    config_path = os.path.join(workdir, 'gunicorn_conf.py')
+    with open(config_path, 'w') as f:
+        f.write(GUNICORN_CONFIG.format(ready_dir=ready_dir))
+    log_path = os.path.join(workdir, 'gunicorn.log')
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', config_path, '-w', str(args.workers),
+             '-b', f'127.0.0.1:{port}', 'app:app'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log,
+        )
+    try:
+        _wait_ready(base_url, proc, ready_dir, args.workers, log_path)
+        requests.post(base_url + '/add_participant', data={'name': 'bench'}, allow_redirects=False)
+        requests.post(base_url + '/create_event', data={'name': 'bench night'}, allow_redirects=False)
+
+        statuses = Counter()
+        latencies = []
+        lock = threading.Lock()
+        remaining = [args.requests]
+
+        def client():
+            http = requests.Session()
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                start = time.perf_counter()
+                try:
+                    resp = http.post(base_url + '/log_drink', data={
+                        'participant_id': 1, 'drink_name': 'Highball', 'event_id': 1,
+                    }, allow_redirects=False, timeout=60)
+                    status = resp.status_code
+                except requests.RequestException:
+                    status = 'conn-error'
+                elapsed = time.perf_counter() - start
+                with lock:
+                    statuses[status] += 1
+                    latencies.append(elapsed)
+
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ok = statuses.get(302, 0)
+    print(f"journal_mode={args.journal_mode} immediate={'off' if args.no_immediate else 'on'} "
+          f"workers={args.workers} clients={args.clients}")
+    print(f"requests:   {sum(statuses.values())} in {wall:.2f}s -> {ok / wall:.1f} writes/s")
+    print(f"latency:    p50={_percentile(latencies, 50) * 1000:.1f}ms "
+          f"p95={_percentile(latencies, 95) * 1000:.1f}ms p99={_percentile(latencies, 99) * 1000:.1f}ms")
+    print(f"succeeded:  {ok}")
+    print(f"failed:     {sum(v for k, v in statuses.items() if k != 302)} {dict(statuses)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--journal-mode', default='WAL')
+    parser.add_argument('--busy-timeout', type=int, default=None, help='SQLITE_BUSY_TIMEOUT_MS override')
+    parser.add_argument('--no-immediate', action='store_true', help='Use deferred transactions for writes')
+    run(parser.parse_args())
@@ -0,0 +1,156 @@
+"""本地 DashScope (OpenAI 兼容) 桩服务器：压测 AI 接口时不消耗真实额度
+
+用法 (在项目根目录)：
+    python benchmarks/dashscope_stub.py --port 8900 --latency 2 --jitter 0.5 --error-rate 0.05
+    DASHSCOPE_URL=http://127.0.0.1:8900/v1/chat/completions DASHSCOPE_API_KEY=stub python app.py
+
+POST 任意路径都按 chat completions 处理，根据 system 提示词返回对应的固定答案：
+调酒推荐 / Omakase 返回配方 JSON，侍酒师从提示词的酒单里选第一款，活动总结返回一段文字。
+- 延迟：每次响应等待 latency ± jitter 秒（均匀分布）；流式请求把这段时间平均分到各个数据块之间；
+- 错误：按 error-rate 的概率返回 503（客户端会按 LLM_MAX_RETRIES 重试，重试同样可能失败）；
+- 流式：`stream: true` 时按 SSE 逐段返回，`stream_options.include_usage` 时最后附带 usage。
+
+也可以在脚本里 import 后用 start_stub() 在后台线程启动（见 benchmarks/ai_load_test.py）。
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECIPE = {
+    "name": "桩服务器金汤力",
+    "ingredients": [
+        {"name": "金酒", "amount": 45, "unit": "ml"},
+        {"name": "通宁水", "amount": 120, "unit": "ml"},
+        {"name": "青柠", "amount": 1, "unit": "片"},
+    ],
+    "instructions": "1. 杯中加满冰块。\n2. 倒入金酒与通宁水。\n3. 轻轻搅拌，放上青柠片。",
+    "comment": "压测专用，味道稳定。",
+}
+
+OMAKASE = dict(RECIPE, name="桩服务器热托迪", ending="下次再来。", comment="Kenji (桩): 慢慢喝。")
+
+SOMMELIER = {
+    "presentation": "今晚，我想为您推荐这一款。",
+    "tasting_notes": "入口清爽，中段柔和，尾韵干净。",
+    "pairing_reason": "它和您描述的心情很配。",
+    "service_tip": "冰镇后饮用。",
+}
+
+SUMMARY = "今夜的酒杯碰得很响，每个人都带着一点微醺回家。(桩服务器)"
+
+
+def canned_answer(messages):
+    """Canned content for a request, chosen by its prompts."""
+    system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+    user = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+    if '侍酒师' in system:
+        match = re.search(r'【当前酒单】\s*\n- (.+?)：', user)
+        return json.dumps(dict(SOMMELIER, name=match.group(1) if match else "经典马天尼"), ensure_ascii=False)
+    if 'Kenji' in system:
+        return json.dumps(OMAKASE, ensure_ascii=False)
+    if 'JSON' in system:
+        return json.dumps(RECIPE, ensure_ascii=False)
+    return SUMMARY
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    # 由 start_stub() 设置
+    latency = 1.0
+    jitter = 0.0
+    error_rate = 0.0
+    chunk_size = 8
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if random.random() < self.error_rate:
+            time.sleep(delay / 2)
+            self._send_json(503, {"error": {"message": "stub: injected failure", "type": "server_error"}})
+            return
+        content = canned_answer(body.get('messages') or [])
+        usage = {"prompt_tokens": sum(len(m.get('content') or '') for m in body.get('messages') or []),
+                 "completion_tokens": len(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        try:
+            if body.get('stream'):
+                self._stream(content, delay, usage if (body.get('stream_options') or {}).get('include_usage') else None)
+            else:
+                time.sleep(delay)
+                self._send_json(200, {
+                    "id": "stub", "object": "chat.completion", "model": body.get('model'),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端超时或取消
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content, delay, usage):
+        pieces = [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            self._event({"id": "stub", "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+        if usage:
+            self._event({"id": "stub", "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        self._write_chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _event(self, payload):
+        self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode())
+
+    def _write_chunk(self, data):
+        self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(port=0, latency=1.0, jitter=0.0, error_rate=0.0, chunk_size=8):
+    """Serve in a daemon thread; returns (server, chat completions URL)."""
+    handler = type('ConfiguredStubHandler', (StubHandler,), {
+        'latency': latency, 'jitter': jitter, 'error_rate': error_rate, 'chunk_size': chunk_size,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1/chat/completions'
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=1.0, help='Seconds per completion (default 1)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='± seconds of uniform random jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--chunk-size', type=int, default=8, help='Characters per streamed delta')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, url = start_stub(args.port, args.latency, args.jitter, args.error_rate, args.chunk_size)
+    print(f"DashScope stub listening; set DASHSCOPE_URL={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
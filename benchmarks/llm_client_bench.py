@@ -0,0 +1,132 @@
+"""AI 客户端连接复用压测：每次 requests.post 新建连接 vs 共享连接池的 Session
+
+用法 (在项目根目录)：
+    python benchmarks/llm_client_bench.py --calls 200
+    python benchmarks/llm_client_bench.py --no-tls          # 只比较 TCP 建连
+
+在本机启动一个返回固定 chat completion 的 HTTPS 桩服务器（自签名证书，需要 openssl），
+分别用旧写法（裸 requests.post）和 services.llm_client.chat_completion 调用同样次数，
+输出每次调用的平均/中位延迟以及平均节省的时间。真实 DashScope 的往返延迟更高，节省会更明显。
+"""
+import argparse
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import llm_client  # noqa: E402
+
+COMPLETION = json.dumps({
+    "choices": [{"message": {"role": "assistant", "content": '{"name": "Gin Tonic"}'}}]
+}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True  # 头和正文分两次写出，否则 keep-alive 下会碰上 40ms 延迟 ACK
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, *args):
+        pass
+
+
+def _self_signed_cert(workdir):
+    cert, key = os.path.join(workdir, 'cert.pem'), os.path.join(workdir, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+         '-keyout', key, '-out', cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def start_stub(tls):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    cert = None
+    if tls:
+        cert, key = _self_signed_cert(tempfile.mkdtemp(prefix='clam-llm-bench-'))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheme = 'https' if tls else 'http'
+    return server, f'{scheme}://127.0.0.1:{server.server_address[1]}/v1/chat/completions', cert
+
+
+MESSAGES = [{"role": "user", "content": "something refreshing with gin"}]
+
+
+def bare_post(url):
+    """The old llm_service code path: a new connection for every call."""
+    resp = requests.post(
+        url,
+        json={"model": llm_client.DEFAULT_MODEL, "messages": MESSAGES, "temperature": 0.7},
+        headers={"Authorization": "Bearer test", "Content-Type": "application/json"},
+        timeout=30,
+    )
+    resp.raise_for_status()
+    return resp.json()["choices"][0]["message"]["content"]
+
+
+def pooled_post(url):
+    return llm_client.chat_completion(MESSAGES, 0.7, 'test', url=url)
+
+
+def measure(fn, calls):
+    fn()  # warm-up (the pooled client opens its connection here)
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run(args):
+    server, url, cert = start_stub(not args.no_tls)
+    try:
+        if cert:
+            # requests 的环境变量 CA 设置优先于 session.verify，两条路径都从这里信任自签名证书
+            os.environ['REQUESTS_CA_BUNDLE'] = cert
+        results = {
+            'bare requests.post': measure(lambda: bare_post(url), args.calls),
+            'pooled session': measure(lambda: pooled_post(url), args.calls),
+        }
+    finally:
+        server.shutdown()
+
+    print(f"{args.calls} calls against {url}")
+    for name, timings in results.items():
+        print(f"  {name:<20} mean {statistics.mean(timings):7.2f} ms   p50 {statistics.median(timings):7.2f} ms")
+    saved = statistics.mean(results['bare requests.post']) - statistics.mean(results['pooled session'])
+    print(f"  saved per call: {saved:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--no-tls', action='store_true', help='Plain HTTP stub (no TLS handshake to save).')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
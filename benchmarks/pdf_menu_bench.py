@@ -0,0 +1,136 @@
+"""PDF 酒单生成耗时：字体注册表与预处理过的 logo
+
+用法 (在项目根目录)：
+    python benchmarks/pdf_menu_bench.py
+    python benchmarks/pdf_menu_bench.py --requests 50 --recipes 40
+    python benchmarks/pdf_menu_bench.py --cjk-font /path/to/simkai.ttf   # 用真实的中文字体（几 MB）对比
+
+在临时目录里新建数据库并写入 --recipes 个配方，然后在进程内（Flask test client）反复请求
+/generate_menu 和 /generate_menu_by_spirit，输出每种模式下每次请求的平均/p50/p95 耗时和 PDF 大小：
+- per-request：每次请求前重新解析并注册所有字体，相当于以前的做法；
+- registry：使用启动时注册好的字体 (services/pdf_fonts.py)。
+仓库里没有附带中文字体 (fonts/simkai.ttf)，不指定 --cjk-font 时只有 QWERTYpe 参与，差别会小很多。
+
+另外单独测封面 logo：在空白 PDF 上按封面尺寸画一次 logo，对比以前的做法（原图文件、reportlab 默认的
+ASCII85 编码）和 services/pdf_assets.py 预处理后共用的 ImageReader，输出耗时和 PDF 大小。
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROUTES = ('/generate_menu', '/generate_menu_by_spirit')
+MODES = ('per-request', 'registry')
+SPIRITS = [('孟买蓝宝石金酒', 'Gin'), ('绝对伏特加', 'Vodka'), ('百加得白朗姆', 'Rum'), ('野格', 'Other'),
+           ('尊尼获加黑牌', 'Whisky'), ('豪帅金快活', 'Tequila'), ('轩尼诗VSOP', 'Brandy')]
+
+
+def seed(db, models, n):
+    """Inventory plus ``n`` recipes (half 经典, half 特调); returns the recipe ids."""
+    db.session.add_all(models.InventoryItem(name=name, category=category, quantity='1瓶') for name, category in SPIRITS)
+    for i in range(n):
+        spirit = SPIRITS[i % len(SPIRITS)][0]
+        recipe = models.Recipe(name=f'{spirit[-2:]}特饮 No.{i + 1}', instructions='摇和后滤入冰镇鸡尾酒杯，以柠檬皮装饰。',
+                               recipe_type='经典' if i % 2 == 0 else '特调')
+        recipe.ingredients_structured = [models.RecipeIngredient(name=spirit, amount=45, unit='ml'),
+                                         models.RecipeIngredient(name='柠檬汁', amount=20, unit='ml'),
+                                         models.RecipeIngredient(name='糖浆', amount=15, unit='ml')]
+        db.session.add(recipe)
+    db.session.commit()
+    return [r.id for r in models.Recipe.query.all()]
+
+
+def measure(client, route, recipe_ids, requests, reload_fonts):
+    """(per-request seconds, PDF bytes of the last response)."""
+    from services import pdf_fonts
+    timings, size = [], 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        if reload_fonts:
+            pdf_fonts.load(force=True)
+        resp = client.post(route, data={'selected_recipes': recipe_ids})
+        size = len(resp.data)
+        timings.append(time.perf_counter() - started)
+        assert resp.status_code == 200, resp.status_code
+    return timings, size
+
+
+def measure_logo(requests):
+    """{'original' | 'prepared': (per-render seconds, PDF bytes)} for drawing just the cover logo."""
+    import io
+    from reportlab import rl_config
+    from reportlab.pdfgen import canvas
+    from services import pdf_assets
+
+    def render(image):
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        c.drawImage(image, 0, 0, *pdf_assets.COVER_LOGO_SIZE, preserveAspectRatio=True, mask='auto')
+        c.save()
+        return len(buffer.getvalue())
+
+    results = {}
+    configured = rl_config.useA85
+    for mode, image, a85 in (('original', pdf_assets.LOGO_PATH, 1), ('prepared', pdf_assets.logo(), configured)):
+        rl_config.useA85 = a85
+        timings, size = [], 0
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                size = render(image)
+                timings.append(time.perf_counter() - started)
+        finally:
+            rl_config.useA85 = configured
+        results[mode] = (timings, size)
+    return results
+
+
+def _row(label, mode, timings, size):
+    timings = sorted(timings)
+    print(f"{label:<26}{mode:<13}{statistics.mean(timings) * 1000:>7.1f}ms"
+          f"{timings[len(timings) // 2] * 1000:>7.1f}ms"
+          f"{timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000:>7.1f}ms"
+          f"{size / 1024:>8.0f}KB")
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='clam-pdf-bench-')
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}", APP_PASSWORD='')
+    if args.cjk_font:
+        os.environ['PDF_CJK_FONT'] = os.path.abspath(args.cjk_font)
+    try:
+        import models
+        from app import app, db
+        from services import pdf_fonts, pdf_assets
+        with app.app_context():
+            recipe_ids = seed(db, models, args.recipes)
+        for name, entry in pdf_fonts.status().items():
+            loaded = f"{entry['path']} ({os.path.getsize(entry['path']) / 1e6:.1f} MB)" if entry['path'] else 'not available'
+            print(f"{name}: {loaded}")
+        print(f"recipes={args.recipes} requests={args.requests} per route and mode")
+        print(f"{'route':<26}{'mode':<13}{'mean':>9}{'p50':>9}{'p95':>9}{'PDF':>10}")
+        with app.test_client() as client:
+            for route in ROUTES:
+                measure(client, route, recipe_ids, 1, False)  # 预热
+                for mode in MODES:
+                    _row(route, mode, *measure(client, route, recipe_ids, args.requests, mode == 'per-request'))
+        if os.path.exists(pdf_assets.LOGO_PATH):
+            for mode, (timings, size) in measure_logo(args.logo_requests).items():
+                _row('cover logo only', mode, timings, size)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20, help='Requests per route and mode')
+    parser.add_argument('--recipes', type=int, default=24, help='Recipes on the menu')
+    parser.add_argument('--logo-requests', type=int, default=5, help='Renders per mode for the logo-only comparison')
+    parser.add_argument('--cjk-font', default=None, help='TTF file to load as KaiTi (sets PDF_CJK_FONT)')
+    run(parser.parse_args())
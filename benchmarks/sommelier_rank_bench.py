@@ -0,0 +1,118 @@
+"""侍酒师提示词规模压测：整本配方 vs 本地预筛选后的前 K 个候选
+
+用法 (在项目根目录)：
+    python benchmarks/sommelier_rank_bench.py                    # 50 / 500 / 5000 个配方，K=20
+    python benchmarks/sommelier_rank_bench.py --sizes 500 --k 10
+    python benchmarks/sommelier_rank_bench.py --live             # 另外真实调用 DashScope (需要 DASHSCOPE_API_KEY，会产生费用)
+
+配方为随机生成的合成数据。对每个规模输出：建索引耗时、每次排序耗时、提示词字符数与估算 token 数
+（中文按 1 字 1 token、其余按 4 字符 1 token 估算）。--live 时读取接口返回的 usage.prompt_tokens 和
+实际往返延迟；超过 --max-live-tokens 的整本提示词不会发送。
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import sommelier_rank, llm_client  # noqa: E402
+from services.llm_service import _sommelier_messages, SOMMELIER_TEMPERATURE  # noqa: E402
+
+SPIRITS = ['金酒', '伏特加', '白朗姆', '黑朗姆', '波本威士忌', '艾雷岛威士忌', '龙舌兰', '梅斯卡尔', '干邑白兰地', '清酒']
+MODIFIERS = ['柠檬汁', '青柠汁', '糖浆', '蜂蜜糖浆', '金巴利', '甜味美思', '干味美思', '橙味利口酒', '咖啡利口酒',
+             '椰奶', '菠萝汁', '西柚汁', '姜汁啤酒', '汤力水', '苏打水', '薄荷叶', '安格斯特拉苦精', '蛋清', '奶油']
+METHODS = ['摇和后滤入冰镇鸡尾酒杯。', '在杯中搅拌后加入大冰块。', '直调，加满冰块。', '加热后倒入马克杯。',
+           '摇和后双重过滤，以橙皮装饰。']
+QUERIES = ['想喝点酸酸甜甜、清爽一点的', '来一杯烈一些、带烟熏味的威士忌', '有没有经典的金酒鸡尾酒',
+           '今天有点冷，想要暖身的热饮', '适合夏天的热带果味', '苦一点的餐前酒', '带咖啡和奶香的甜点酒']
+
+
+def synthetic_recipes(n, seed=42):
+    rng = random.Random(seed)
+    recipes = []
+    for i in range(n):
+        spirit = rng.choice(SPIRITS)
+        modifiers = rng.sample(MODIFIERS, rng.randint(2, 4))
+        ingredients = [(spirit, 45, 'ml')] + [(m, rng.choice([10, 15, 20, 30, 60]), 'ml') for m in modifiers]
+        recipes.append({
+            'id': i + 1,
+            'name': f"{spirit}{modifiers[0][:2]}特饮 No.{i + 1}",
+            'ingredients': [name for name, _, _ in ingredients],
+            'prompt_ingredients': ", ".join(f"{name} {float(amount)}{unit}" for name, amount, unit in ingredients),
+            'recipe_type': rng.choice(['经典', '特调']),
+            'text': rng.choice(METHODS),
+        })
+    return recipes
+
+
+def estimate_tokens(messages):
+    text = ''.join(m['content'] for m in messages)
+    cjk = len(re.findall(r'[一-鿿　-〿＀-￯]', text))
+    return cjk + (len(text) - cjk) // 4
+
+
+def live_call(messages):
+    """(prompt_tokens, seconds) of a real completion."""
+    api_key = os.environ['DASHSCOPE_API_KEY']
+    start = time.perf_counter()
+    resp = llm_client.get_session().post(
+        llm_client.DASHSCOPE_URL,
+        json={"model": llm_client.DEFAULT_MODEL, "messages": messages, "temperature": SOMMELIER_TEMPERATURE},
+        headers={"Authorization": f"Bearer {api_key}"},
+        timeout=llm_client.timeouts(),
+    )
+    resp.raise_for_status()
+    return resp.json().get('usage', {}).get('prompt_tokens'), time.perf_counter() - start
+
+
+def run(args):
+    print(f"K = {args.k}")
+    header = f"{'recipes':>8} {'index ms':>9} {'rank ms':>8} {'full chars':>11} {'full tok≈':>10} {'top-K tok≈':>11}"
+    if args.live:
+        header += f" {'full tok':>9} {'full s':>7} {'top-K tok':>10} {'top-K s':>8}"
+    print(header)
+    for size in args.sizes:
+        recipes = synthetic_recipes(size)
+        start = time.perf_counter()
+        index = sommelier_rank.build_index(recipes)
+        index_ms = (time.perf_counter() - start) * 1000
+
+        rank_times = []
+        for query in QUERIES:
+            start = time.perf_counter()
+            sommelier_rank.top_k(index, query, args.k)
+            rank_times.append((time.perf_counter() - start) * 1000)
+
+        query = QUERIES[0]
+        full = _sommelier_messages(sommelier_rank.to_prompt(index['docs']), query)
+        ranked = _sommelier_messages(sommelier_rank.to_prompt(sommelier_rank.top_k(index, query, args.k)), query)
+        full_tokens, ranked_tokens = estimate_tokens(full), estimate_tokens(ranked)
+        line = (f"{size:>8} {index_ms:>9.1f} {statistics.mean(rank_times):>8.2f} "
+                f"{sum(len(m['content']) for m in full):>11} {full_tokens:>10} {ranked_tokens:>11}")
+        if args.live:
+            if full_tokens <= args.max_live_tokens:
+                tokens, seconds = live_call(full)
+                line += f" {tokens:>9} {seconds:>7.2f}"
+            else:
+                line += f" {'skipped':>9} {'-':>7}"
+            tokens, seconds = live_call(ranked)
+            line += f" {tokens:>10} {seconds:>8.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 5000])
+    parser.add_argument('--k', type=int, default=sommelier_rank.SOMMELIER_TOP_K)
+    parser.add_argument('--live', action='store_true', help='also call DashScope and report real usage/latency')
+    parser.add_argument('--max-live-tokens', type=int, default=30000)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+"""Apply pending schema migrations to the configured database.
+
+Equivalent to `flask db-upgrade`; replaces the old one-off migrate_*.py scripts.
+Importing the app already runs the upgrade, so this just reports the result.
+"""
+from app import app, db
+from services import migrations
+
+if __name__ == "__main__":
+    with app.app_context():
+        print(f"Schema at version {migrations.current_version(db.engine)} (latest {migrations.LATEST_VERSION}).")
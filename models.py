@@ -1,7 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 
-db = SQLAlchemy()
+from services.database import WriteLockSession
+
+db = SQLAlchemy(session_options={'class_': WriteLockSession})  # 写路由的 session 申请写锁，见 services/database.py
+
+# 索引与 schema 变更同时记录在 services/migrations.py 中，已有数据库通过迁移补齐
 
 # 关联表：Event 和 Recipe 的多对多关系
 event_recipe = db.Table('event_recipe',
@@ -23,7 +27,7 @@ class InventoryItem(db.Model):
 
 class Recipe(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     ingredients = db.Column(db.Text, nullable=True) # Legacy text field
     instructions = db.Column(db.Text, nullable=False)
     is_generated = db.Column(db.Boolean, default=False)
@@ -33,7 +37,7 @@ class Recipe(db.Model):
 
 class RecipeIngredient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.id'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Float, default=0.0)
     unit = db.Column(db.String(20), default="ml")
@@ -49,11 +53,12 @@ class Event(db.Model):
 
 class Consumption(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    participant_id = db.Column(db.Integer, db.ForeignKey('participant.id'), nullable=False)
+    participant_id = db.Column(db.Integer, db.ForeignKey('participant.id'), nullable=False, index=True)
     drink_name = db.Column(db.String(100), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=True) # 关联到活动
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=True, index=True) # 关联到活动
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.id'), nullable=True) # 关联到配方
+    bar_day = db.Column(db.Date, index=True) # 营业日 (凌晨分界)，见 services/barday.py
 
 class Bartender(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -61,3 +66,99 @@ class Bartender(db.Model):
     title = db.Column(db.String(100), nullable=False) # e.g. "Head Mixologist | Clam Master"
     is_active = db.Column(db.Boolean, default=True)
     order = db.Column(db.Integer, default=0)
+
+# 活动统计汇总表：在 log_drink / delete_consumption 中增量维护，可用 `flask rebuild-rollups` 重算
+class EventDrinkRollup(db.Model):
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    participant_id = db.Column(db.Integer, db.ForeignKey('participant.id'), primary_key=True)
+    drink_name = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    first_consumption_id = db.Column(db.Integer) # 用于保持“首次出现”顺序
+
+class EventIngredientRollup(db.Model):
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    name = db.Column(db.String(100), primary_key=True)
+    unit = db.Column(db.String(20), primary_key=True)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    uses = db.Column(db.Integer, nullable=False, default=0) # 计入的配料行数，归零时删除该行
+
+# 每个营业日的饮酒汇总表，维护方式同上
+class DailyDrinkRollup(db.Model):
+    bar_day = db.Column(db.Date, primary_key=True)
+    participant_id = db.Column(db.Integer, db.ForeignKey('participant.id'), primary_key=True)
+    drink_name = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    first_consumption_id = db.Column(db.Integer)
+
+# 数据版本号：每个作用域 (global / 表名 / event:<id>) 一行，用于读路由的 ETag，见 services/versioning.py
+# (另有 omakase_variant_seq：预先生成 Omakase 的序号计数器，见 services/omakase_pool.py)
+class DataVersion(db.Model):
+    scope = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# AI 响应缓存 (所有 worker 共享)，见 services/ai_cache.py；时间为 Unix 时间戳
+class AIResponseCache(db.Model):
+    key = db.Column(db.String(64), primary_key=True) # sha256(kind + 归一化参数)
+    kind = db.Column(db.String(20), nullable=False)
+    value = db.Column(db.Text, nullable=False) # JSON
+    created_at = db.Column(db.Float, nullable=False)
+    last_used_at = db.Column(db.Float, nullable=False, index=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+
+class AICacheCounter(db.Model):
+    kind = db.Column(db.String(20), primary_key=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    misses = db.Column(db.Integer, nullable=False, default=0)
+
+# 后台 AI 任务队列 (所有 worker 共享)，见 services/jobs.py；时间为 Unix 时间戳
+class AIJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    params = db.Column(db.Text, nullable=False) # JSON
+    priority = db.Column(db.Integer, nullable=False, default=0) # 越大越先执行
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True) # queued/running/done/failed/cancelled
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    partial = db.Column(db.Text) # JSON：流式生成中已完成的字段
+    result = db.Column(db.Text) # JSON
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(50)) # pid:线程名
+    created_at = db.Column(db.Float, nullable=False)
+    started_at = db.Column(db.Float)
+    finished_at = db.Column(db.Float)
+
+# 活动 AI 总结：按生成时统计文本的哈希保存，数据未变时直接复用，见 services/event_summary.py
+class EventSummary(db.Model):
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    stats_hash = db.Column(db.String(64), nullable=False) # sha256(活动名 + 日期 + 统计文本)
+    summary = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+
+# 相同 AI 请求合并 (single-flight) 的跨 worker 租约，见 services/single_flight.py；时间为 Unix 时间戳
+class LLMFlight(db.Model):
+    key = db.Column(db.String(64), primary_key=True) # sha256(model + messages + temperature)
+    owner = db.Column(db.String(32), nullable=False) # 正在请求上游的那一方
+    expires_at = db.Column(db.Float, nullable=False) # 租约到期时间，请求期间定期续约
+    done = db.Column(db.Boolean, nullable=False, default=False)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    finished_at = db.Column(db.Float)
+
+# 运行指标：每个 worker 一组累计值，/metrics 按序列求和，见 services/metrics.py
+class MetricSample(db.Model):
+    worker = db.Column(db.String(80), primary_key=True) # 主机名:pid:随机后缀
+    name = db.Column(db.String(80), primary_key=True)
+    labels = db.Column(db.String(300), primary_key=True) # 已格式化的 {k="v",...}
+    value = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+
+# 预先生成的 Omakase (常见心情 × 天气)，每条只端出一次，见 services/omakase_pool.py；时间为 Unix 时间戳
+class OmakaseVariant(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    mood = db.Column(db.String(20), nullable=False)
+    weather = db.Column(db.String(20), nullable=False)
+    inventory_hash = db.Column(db.String(64), nullable=False) # 生成时的库存指纹，库存变了就不再使用
+    result = db.Column(db.Text, nullable=False) # JSON
+    created_at = db.Column(db.Float, nullable=False)
+    served_at = db.Column(db.Float) # 端出时间；为空表示还没用过
+
+    __table_args__ = (db.Index('ix_omakase_variant_lookup', 'mood', 'weather', 'inventory_hash', 'served_at'),)
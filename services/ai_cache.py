@@ -0,0 +1,131 @@
+"""AI 响应缓存 (SQLite，LRU + TTL)
+
+同一晚上常常有人用同样的库存问同样的问题（“来点清爽的金酒”），每次都要等 qwen3-max 好几秒。
+缓存以 sha256(种类 + 归一化参数) 为键存放在 ai_response_cache 表中，所有 gunicorn worker 共享：
+- TTL：超过 AI_CACHE_TTL 秒的条目视为过期；
+- LRU：条目数超过 AI_CACHE_MAX_ENTRIES 时按最近使用时间淘汰；
+- ai_cache_counter 表按种类记录命中/未命中次数（`flask ai-cache-stats` 查看）。
+
+缓存读写使用独立的短事务（不经过 db.session），不会把请求的事务拉长到 LLM 调用期间。
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, AIResponseCache, AICacheCounter
+
+AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', str(12 * 3600)))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '500'))
+
+_TRAILING_PUNCTUATION = '。.!！?？~～,，、 '
+
+
+def normalize_text(text):
+    """Case/width/whitespace-insensitive form of a free-text request."""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return re.sub(r'\s+', ' ', text).strip().rstrip(_TRAILING_PUNCTUATION)
+
+
+def inventory_fingerprint(names):
+    """Order- and duplicate-insensitive hash of an inventory list."""
+    items = sorted({normalize_text(name) for name in names if name})
+    return hashlib.sha256('\n'.join(items).encode()).hexdigest()
+
+
+def make_key(kind, **params):
+    payload = json.dumps([kind, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _count(conn, kind, hit):
+    column = 'hits' if hit else 'misses'
+    stmt = insert(AICacheCounter).values(kind=kind, hits=int(hit), misses=int(not hit))
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=['kind'], set_={column: getattr(AICacheCounter, column) + 1}
+    ))
+
+
+def lookup(kind, key):
+    """Return the cached value (touching its LRU timestamp), or None on a miss."""
+    now = time.time()
+    with db.engine.begin() as conn:
+        value = conn.execute(
+            update(AIResponseCache)
+            .where(AIResponseCache.key == key, AIResponseCache.created_at > now - AI_CACHE_TTL)
+            .values(last_used_at=now, hits=AIResponseCache.hits + 1)
+            .returning(AIResponseCache.value)
+        ).scalar()
+        _count(conn, kind, value is not None)
+    return json.loads(value) if value is not None else None
+
+
+def lookup_stale(kind, key):
+    """The stored value even if expired (fallback when the AI is unavailable); no LRU touch or counters."""
+    with db.engine.connect() as conn:
+        value = conn.execute(
+            select(AIResponseCache.value).where(AIResponseCache.key == key, AIResponseCache.kind == kind)
+        ).scalar()
+    return json.loads(value) if value is not None else None
+
+
+def store(kind, key, value):
+    now = time.time()
+    with db.engine.begin() as conn:
+        stmt = insert(AIResponseCache).values(
+            key=key, kind=kind, value=json.dumps(value, ensure_ascii=False),
+            created_at=now, last_used_at=now, hits=0,
+        )
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=['key'],
+            set_={'value': stmt.excluded.value, 'created_at': now, 'last_used_at': now},
+        ))
+        _evict(conn, now)
+
+
+def _evict(conn, now):
+    conn.execute(delete(AIResponseCache).where(AIResponseCache.created_at <= now - AI_CACHE_TTL))
+    overflow = (
+        select(AIResponseCache.key)
+        .order_by(AIResponseCache.last_used_at.desc())
+        .limit(-1).offset(AI_CACHE_MAX_ENTRIES)
+    )
+    conn.execute(delete(AIResponseCache).where(AIResponseCache.key.in_(overflow)))
+
+
+def get_or_compute(kind, key, compute, bypass=False, cacheable=lambda value: True):
+    """Return (value, hit). ``bypass`` skips the lookup but still stores the fresh value."""
+    if not bypass:
+        value = lookup(kind, key)
+        if value is not None:
+            return value, True
+    value = compute()
+    if cacheable(value):
+        store(kind, key, value)
+    return value, False
+
+
+def stats():
+    """{kind: {'hits', 'misses', 'entries'}} across all workers."""
+    result = {}
+    with db.engine.connect() as conn:
+        for kind, hits, misses in conn.execute(select(AICacheCounter.kind, AICacheCounter.hits, AICacheCounter.misses)):
+            result[kind] = {'hits': hits, 'misses': misses, 'entries': 0}
+        for kind, entries in conn.execute(
+            select(AIResponseCache.kind, func.count()).group_by(AIResponseCache.kind)
+        ):
+            result.setdefault(kind, {'hits': 0, 'misses': 0})['entries'] = entries
+    return result
+
+
+def clear(kind=None):
+    with db.engine.begin() as conn:
+        stmt = delete(AIResponseCache)
+        if kind:
+            stmt = stmt.where(AIResponseCache.kind == kind)
+        return conn.execute(stmt).rowcount
@@ -0,0 +1,201 @@
+"""首页各标签页的分页 JSON 数据
+
+GET /api/<resource>?limit=50&cursor=...&fields=id,name
+
+- 游标分页 (keyset)：next_cursor 为不透明字符串，原样传回即可取下一页，为 null 表示没有更多。
+- 字段选择：fields 只返回需要的字段；嵌套字段（配方原料、活动酒单）只有被请求时才会查询，
+  且每页只多一条查询。
+"""
+import base64
+import json
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import select, func, and_, or_
+
+from models import db, Participant, InventoryItem, Recipe, RecipeIngredient, Event, Consumption, event_recipe
+from services.barday import current_bar_day
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class ApiError(ValueError):
+    """Bad query parameters; the route answers 400 with the message."""
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _decode_cursor(cursor, date_desc=False):
+    """The keyset values of a cursor: [id], or (date, id) for resources ordered by date."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ApiError('无效的 cursor')
+    # 能解码的 JSON 也可能不是我们生成的形状，例如 "MQ" -> 1
+    if not isinstance(values, list) or len(values) != (2 if date_desc else 1) or not _is_id(values[-1]):
+        raise ApiError('无效的 cursor')
+    if date_desc:
+        try:
+            return date.fromisoformat(values[0]), values[1]
+        except (ValueError, TypeError):
+            raise ApiError('无效的 cursor')
+    return values
+
+
+def _recipe_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = db.session.execute(
+        select(RecipeIngredient.recipe_id, RecipeIngredient.name, RecipeIngredient.amount, RecipeIngredient.unit)
+        .where(RecipeIngredient.recipe_id.in_(recipe_ids))
+        .order_by(RecipeIngredient.recipe_id, RecipeIngredient.id)
+    )
+    for recipe_id, name, amount, unit in rows:
+        ingredients[recipe_id].append({'name': name, 'amount': amount, 'unit': unit})
+    return ingredients
+
+
+def _event_recipes(event_ids):
+    recipes = defaultdict(list)
+    rows = db.session.execute(
+        select(event_recipe.c.event_id, Recipe.id, Recipe.name)
+        .join(Recipe, Recipe.id == event_recipe.c.recipe_id)
+        .where(event_recipe.c.event_id.in_(event_ids))
+        .order_by(event_recipe.c.event_id, Recipe.id)
+    )
+    for event_id, recipe_id, name in rows:
+        recipes[event_id].append({'id': recipe_id, 'name': name})
+    return recipes
+
+
+# 资源定义：columns 为可选的普通字段，nested 为按页批量加载的嵌套字段，
+# scopes 为 ETag 依赖的数据版本作用域 (services/versioning.py)
+RESOURCES = {
+    'participants': {
+        'scopes': ['participant'],
+        'columns': {'id': Participant.id, 'name': Participant.name},
+    },
+    'inventory': {
+        'scopes': ['inventory'],
+        'columns': {
+            'id': InventoryItem.id, 'name': InventoryItem.name,
+            'category': InventoryItem.category, 'quantity': InventoryItem.quantity,
+        },
+    },
+    'recipes': {
+        'scopes': ['recipe'],
+        'columns': {
+            'id': Recipe.id, 'name': Recipe.name, 'ingredients': Recipe.ingredients,
+            'instructions': Recipe.instructions, 'is_generated': Recipe.is_generated,
+            'recipe_type': Recipe.recipe_type,
+        },
+        'nested': {'ingredients_structured': _recipe_ingredients},
+    },
+    'events': {
+        'scopes': ['event', 'recipe'],
+        'columns': {
+            'id': Event.id, 'name': Event.name, 'date': Event.date, 'description': Event.description,
+        },
+        'nested': {'recipes': _event_recipes},
+        # 最新的活动在前
+        'order': 'date_desc',
+    },
+    'today': {
+        'scopes': ['consumption', 'participant'],
+        'columns': {
+            'id': Consumption.id, 'participant_id': Consumption.participant_id,
+            'participant_name': Participant.name, 'drink_name': Consumption.drink_name,
+            'timestamp': Consumption.timestamp,
+        },
+        'join': (Participant, Participant.id == Consumption.participant_id),
+        'where': lambda: Consumption.bar_day == current_bar_day(),
+    },
+}
+
+
+def _parse_fields(spec, resource):
+    available = set(resource['columns']) | set(resource.get('nested', {}))
+    if not spec:
+        return available
+    fields = {f.strip() for f in spec.split(',') if f.strip()}
+    unknown = fields - available
+    if unknown:
+        raise ApiError(f"未知字段: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def _serialize(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def fetch_page(name, cursor=None, limit=None, fields=None):
+    """Return {'items': [...], 'next_cursor': str|None} for one page of ``name``."""
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(f"未知资源: {name}")
+
+    try:
+        limit = min(max(int(limit or DEFAULT_LIMIT), 1), MAX_LIMIT)
+    except ValueError:
+        raise ApiError('limit 必须是整数')
+    fields = _parse_fields(fields, resource)
+
+    columns = resource['columns']
+    selected = [f for f in columns if f in fields and f != 'id']
+    id_col = columns['id']
+    date_desc = resource.get('order') == 'date_desc'
+
+    stmt = select(id_col, *(columns[f] for f in selected))
+    if date_desc:
+        sort_date = func.coalesce(Event.date, date.min)
+        stmt = stmt.add_columns(sort_date)
+    if 'join' in resource:
+        stmt = stmt.join(*resource['join'])
+    if 'where' in resource:
+        stmt = stmt.where(resource['where']())
+
+    if cursor:
+        last = _decode_cursor(cursor, date_desc)
+        if date_desc:
+            last_date, last_id = last
+            stmt = stmt.where(or_(sort_date < last_date, and_(sort_date == last_date, id_col < last_id)))
+        else:
+            stmt = stmt.where(id_col > last[0])
+
+    if date_desc:
+        stmt = stmt.order_by(sort_date.desc(), id_col.desc())
+    else:
+        stmt = stmt.order_by(id_col)
+
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        item = {'id': row[0]} if 'id' in fields else {}
+        for i, f in enumerate(selected, start=1):
+            item[f] = _serialize(row[i])
+        items.append(item)
+
+    ids = [row[0] for row in rows]
+    for nested_name, loader in resource.get('nested', {}).items():
+        if nested_name in fields and ids:
+            nested = loader(ids)
+            for item, row_id in zip(items, ids):
+                item[nested_name] = nested.get(row_id, [])
+
+    next_cursor = None
+    if has_more:
+        last_row = rows[-1]
+        next_cursor = _encode_cursor([last_row[-1].isoformat(), last_row[0]] if date_desc else [last_row[0]])
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,25 @@
+"""营业日 (bar day) 计算
+
+凌晨 4 点之前喝的酒算作前一天的“今日战况”。营业日在记录饮酒时计算一次并存入
+consumption.bar_day，查询“今天”只需对索引列做等值匹配，不再每次请求换算时区和 UTC 偏移。
+
+时区与分界时刻可通过环境变量配置：
+    BAR_TIMEZONE=Asia/Shanghai
+    BAR_DAY_CUTOFF_HOUR=4
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+BAR_TIMEZONE = ZoneInfo(os.environ.get('BAR_TIMEZONE', 'Asia/Shanghai'))
+BAR_DAY_CUTOFF_HOUR = int(os.environ.get('BAR_DAY_CUTOFF_HOUR', '4'))
+
+
+def bar_day_for(utc_timestamp):
+    """Bar day (a date) of a naive UTC timestamp as stored in Consumption.timestamp."""
+    local = utc_timestamp.replace(tzinfo=timezone.utc).astimezone(BAR_TIMEZONE)
+    return (local - timedelta(hours=BAR_DAY_CUTOFF_HOUR)).date()
+
+
+def current_bar_day():
+    return bar_day_for(datetime.utcnow())
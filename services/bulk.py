@@ -0,0 +1,374 @@
+"""CSV / JSONL 批量导入导出
+
+支持的资源：inventory、recipes（含结构化原料）、participants、consumption（饮酒记录）。
+
+- 导出：按主键分批 (keyset) 读取并逐批写出，生成器直接作为响应体，不会把整张表读进内存。
+  饮酒记录导出时用名字代替 id（朋友、活动名+日期、配方名），可以导入到另一个数据库。
+- 导入：逐行解析上传流，每 BATCH_SIZE 行做一次去重查询 + executemany 插入，整个文件在同一个事务里，
+  任何一行出错都会整体回滚。已存在的记录（见 DEDUPE_KEYS）计为 skipped。
+  导入饮酒记录会补齐营业日、缺失的朋友/活动，并重算相关活动和每日汇总表。
+
+路由：GET /export/<resource>.<csv|jsonl>，POST /import/<resource>（表单字段 file）
+命令行：flask export <resource> [-o 文件]，flask import <resource> 文件
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from sqlalchemy import select, insert
+
+from models import db, Participant, InventoryItem, Recipe, RecipeIngredient, Event, Consumption
+from services import versioning
+from services.barday import bar_day_for
+from services.rollups import rebuild_rollups, rebuild_daily_rollups
+
+BATCH_SIZE = 1000
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+class BulkError(ValueError):
+    """Unknown resource/format or a malformed row; the route answers 400 with the message."""
+
+
+FIELDS = {
+    'inventory': ['name', 'category', 'quantity'],
+    'recipes': ['name', 'recipe_type', 'is_generated', 'ingredients', 'instructions', 'ingredients_structured'],
+    'participants': ['name'],
+    'consumption': ['participant', 'drink_name', 'timestamp', 'event_name', 'event_date', 'recipe_name'],
+}
+
+# 导入时判断“已存在”的字段
+DEDUPE_KEYS = {
+    'inventory': ('name', 'category'),
+    'recipes': ('name',),
+    'participants': ('name',),
+    'consumption': ('participant_id', 'drink_name', 'timestamp'),
+}
+
+
+def _check(resource, fmt=None):
+    if resource not in FIELDS:
+        raise BulkError(f"未知资源: {resource}")
+    if fmt is not None and fmt not in FORMATS:
+        raise BulkError(f"不支持的格式: {fmt}（可选 csv、jsonl）")
+
+
+# ---------- 导出 ----------
+
+def _batches(stmt, id_col):
+    """Run ``stmt`` page by page on ``id_col`` (must be the first selected column)."""
+    last_id = 0
+    while True:
+        rows = db.session.execute(stmt.where(id_col > last_id).order_by(id_col).limit(BATCH_SIZE)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _export_inventory():
+    stmt = select(InventoryItem.id, InventoryItem.name, InventoryItem.category, InventoryItem.quantity)
+    for rows in _batches(stmt, InventoryItem.id):
+        yield [{'name': name, 'category': category, 'quantity': quantity} for _, name, category, quantity in rows]
+
+
+def _export_recipes():
+    stmt = select(Recipe.id, Recipe.name, Recipe.recipe_type, Recipe.is_generated,
+                  Recipe.ingredients, Recipe.instructions)
+    for rows in _batches(stmt, Recipe.id):
+        ingredients = {}
+        for recipe_id, name, amount, unit in db.session.execute(
+            select(RecipeIngredient.recipe_id, RecipeIngredient.name, RecipeIngredient.amount, RecipeIngredient.unit)
+            .where(RecipeIngredient.recipe_id.in_([row[0] for row in rows]))
+            .order_by(RecipeIngredient.recipe_id, RecipeIngredient.id)
+        ):
+            ingredients.setdefault(recipe_id, []).append({'name': name, 'amount': amount, 'unit': unit})
+        yield [{
+            'name': name, 'recipe_type': recipe_type, 'is_generated': bool(is_generated),
+            'ingredients': text, 'instructions': instructions,
+            'ingredients_structured': ingredients.get(recipe_id, []),
+        } for recipe_id, name, recipe_type, is_generated, text, instructions in rows]
+
+
+def _export_participants():
+    for rows in _batches(select(Participant.id, Participant.name), Participant.id):
+        yield [{'name': name} for _, name in rows]
+
+
+def _export_consumption():
+    stmt = (
+        select(Consumption.id, Participant.name, Consumption.drink_name, Consumption.timestamp,
+               Event.name, Event.date, Recipe.name)
+        .join(Participant, Participant.id == Consumption.participant_id)
+        .outerjoin(Event, Event.id == Consumption.event_id)
+        .outerjoin(Recipe, Recipe.id == Consumption.recipe_id)
+    )
+    for rows in _batches(stmt, Consumption.id):
+        yield [{
+            'participant': participant, 'drink_name': drink_name,
+            'timestamp': timestamp.isoformat() if timestamp else None,
+            'event_name': event_name, 'event_date': event_date.isoformat() if event_date else None,
+            'recipe_name': recipe_name,
+        } for _, participant, drink_name, timestamp, event_name, event_date, recipe_name in rows]
+
+
+_EXPORTERS = {
+    'inventory': _export_inventory,
+    'recipes': _export_recipes,
+    'participants': _export_participants,
+    'consumption': _export_consumption,
+}
+
+
+def export_stream(resource, fmt):
+    """Yield the export of ``resource`` as text chunks (one chunk per batch)."""
+    _check(resource, fmt)
+    fields = FIELDS[resource]
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writeheader()
+        for batch in _EXPORTERS[resource]():
+            for record in batch:
+                if resource == 'recipes':
+                    record['ingredients_structured'] = json.dumps(record['ingredients_structured'], ensure_ascii=False)
+                writer.writerow(record)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        for batch in _EXPORTERS[resource]():
+            yield ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch)
+
+
+# ---------- 导入 ----------
+
+def read_records(stream, fmt):
+    """Yield dicts from a text stream of CSV (with header) or JSON Lines."""
+    if fmt not in FORMATS:
+        raise BulkError(f"不支持的格式: {fmt}（可选 csv、jsonl）")
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for lineno, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise BulkError(f"第 {lineno} 行不是合法的 JSON")
+        if not isinstance(record, dict):
+            raise BulkError(f"第 {lineno} 行应为 JSON 对象")
+        yield record
+
+
+def _text(record, key, required=False):
+    value = record.get(key)
+    value = value.strip() if isinstance(value, str) else value
+    if value in (None, ''):
+        if required:
+            raise BulkError(f"缺少字段 {key}: {record}")
+        return None
+    return str(value)
+
+
+def _float(value):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BulkError(f"无效的数量: {value}")
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y', '是')
+    return bool(value)
+
+
+def _datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise BulkError(f"无效的时间: {value}")
+
+
+def _date(value):
+    if value in (None, ''):
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise BulkError(f"无效的日期: {value}")
+
+
+def _chunks(records):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _existing(model, keys, rows):
+    """Set of dedupe-key tuples among ``rows`` that already exist in ``model``'s table."""
+    if not rows:
+        return set()
+    # 先按最有区分度的索引列 (name / timestamp) 缩小范围，再在 Python 里比对完整的键
+    lead = 'timestamp' if 'timestamp' in keys else keys[0]
+    columns = [getattr(model, k) for k in keys]
+    stmt = select(*columns).where(getattr(model, lead).in_({row[lead] for row in rows}))
+    return {tuple(row) for row in db.session.execute(stmt)}
+
+
+def _insert_new(model, resource, rows, seen):
+    """Dedupe ``rows`` against the file so far and the table, executemany the rest. Returns the new rows."""
+    keys = DEDUPE_KEYS[resource]
+    fresh = []
+    for row in rows:
+        key = tuple(row[k] for k in keys)
+        if key not in seen:
+            seen.add(key)
+            fresh.append(row)
+    existing = _existing(model, keys, fresh)
+    fresh = [row for row in fresh if tuple(row[k] for k in keys) not in existing]
+    if fresh:
+        # Core 表级 insert：真正的 executemany，不经过 ORM 按行分组
+        db.session.execute(insert(model.__table__), fresh)
+    return fresh
+
+
+def _ids_by_name(model, names):
+    """name -> smallest id, for the given names."""
+    ids = {}
+    for row_id, name in db.session.execute(
+        select(model.id, model.name).where(model.name.in_(set(names))).order_by(model.id)
+    ):
+        ids.setdefault(name, row_id)
+    return ids
+
+
+def _import_inventory(batch, seen, stats):
+    rows = [{
+        'name': _text(r, 'name', required=True),
+        'category': _text(r, 'category') or 'Other',
+        'quantity': _text(r, 'quantity'),
+    } for r in batch]
+    stats['inserted'] += len(_insert_new(InventoryItem, 'inventory', rows, seen))
+
+
+def _import_participants(batch, seen, stats):
+    rows = [{'name': _text(r, 'name', required=True)} for r in batch]
+    stats['inserted'] += len(_insert_new(Participant, 'participants', rows, seen))
+
+
+def _import_recipes(batch, seen, stats):
+    rows, structured = [], {}
+    for r in batch:
+        name = _text(r, 'name', required=True)
+        ingredients = r.get('ingredients_structured') or []
+        if isinstance(ingredients, str):
+            try:
+                ingredients = json.loads(ingredients)
+            except ValueError:
+                raise BulkError(f"配方 {name} 的 ingredients_structured 不是合法的 JSON")
+        structured.setdefault(name, ingredients)
+        rows.append({
+            'name': name,
+            'recipe_type': _text(r, 'recipe_type') or '经典',
+            'is_generated': _bool(r.get('is_generated')),
+            'ingredients': _text(r, 'ingredients'),
+            'instructions': _text(r, 'instructions') or '',
+        })
+    fresh = _insert_new(Recipe, 'recipes', rows, seen)
+    if not fresh:
+        return
+    # 新插入的配方名在表内唯一（已存在的已被跳过），按名字取回 id
+    ids = _ids_by_name(Recipe, [row['name'] for row in fresh])
+    ingredient_rows = [{
+        'recipe_id': ids[row['name']],
+        'name': str(ing.get('name', '')).strip(),
+        'amount': _float(ing.get('amount')),
+        'unit': ing.get('unit') or 'ml',
+    } for row in fresh for ing in structured[row['name']] if str(ing.get('name', '')).strip()]
+    if ingredient_rows:
+        db.session.execute(insert(RecipeIngredient.__table__), ingredient_rows)
+    stats['inserted'] += len(fresh)
+
+
+def _import_consumption(batch, seen, stats):
+    parsed = []
+    for r in batch:
+        timestamp = _datetime(_text(r, 'timestamp', required=True))
+        parsed.append((r, timestamp))
+
+    # 朋友与活动按名字匹配，不存在则创建
+    names = {_text(r, 'participant', required=True) for r, _ in parsed}
+    participants = _ids_by_name(Participant, names)
+    missing = names - set(participants)
+    if missing:
+        db.session.execute(insert(Participant.__table__), [{'name': n} for n in sorted(missing)])
+        participants.update(_ids_by_name(Participant, missing))
+
+    event_keys = {(_text(r, 'event_name'), _date(r.get('event_date'))) for r, _ in parsed}
+    event_keys.discard((None, None))
+    events = {}
+    for key in event_keys:
+        name, event_date = key
+        event_id = db.session.execute(
+            select(Event.id).where(Event.name == (name or '周末聚会'), Event.date == event_date).order_by(Event.id)
+        ).scalar()
+        if event_id is None:
+            event_id = db.session.execute(
+                insert(Event).values(name=name or '周末聚会', date=event_date).returning(Event.id)
+            ).scalar_one()
+        events[key] = event_id
+
+    recipes = _ids_by_name(Recipe, {_text(r, 'recipe_name') for r, _ in parsed} - {None})
+
+    rows = [{
+        'participant_id': participants[_text(r, 'participant')],
+        'drink_name': _text(r, 'drink_name', required=True),
+        'timestamp': timestamp,
+        'event_id': events.get((_text(r, 'event_name'), _date(r.get('event_date')))),
+        'recipe_id': recipes.get(_text(r, 'recipe_name')),
+        'bar_day': bar_day_for(timestamp),
+    } for r, timestamp in parsed]
+    fresh = _insert_new(Consumption, 'consumption', rows, seen)
+    stats['inserted'] += len(fresh)
+    stats['events'].update(row['event_id'] for row in fresh if row['event_id'])
+
+
+_IMPORTERS = {
+    'inventory': (_import_inventory, ('inventory',)),
+    'recipes': (_import_recipes, ('recipe',)),
+    'participants': (_import_participants, ('participant',)),
+    'consumption': (_import_consumption, ('consumption', 'participant', 'event')),
+}
+
+
+def import_records(resource, records):
+    """Import an iterable of dicts into ``resource`` (caller commits). Returns {'inserted', 'skipped'}."""
+    _check(resource)
+    importer, scopes = _IMPORTERS[resource]
+    stats = {'inserted': 0, 'total': 0, 'events': set()}
+    seen = set()
+    for batch in _chunks(records):
+        stats['total'] += len(batch)
+        importer(batch, seen, stats)
+
+    if stats['inserted']:
+        if resource == 'consumption':
+            for event_id in sorted(stats['events']):
+                rebuild_rollups(event_id)
+            rebuild_daily_rollups()
+        versioning.bump(*scopes, *(f'event:{event_id}' for event_id in stats['events']))
+    return {'inserted': stats['inserted'], 'skipped': stats['total'] - stats['inserted']}
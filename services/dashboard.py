@@ -0,0 +1,31 @@
+"""首页 (/) 页面骨架数据
+
+首页只渲染“喝点什么”标签页需要的下拉选项（朋友、活动），用固定 2 条查询取出轻量行对象；
+其余标签页（酒库、活动、朋友、配方、今日战况）在打开时通过 /api/<resource> 分页加载，
+见 services/api.py。
+"""
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from models import db, Participant, Event
+
+ParticipantRow = namedtuple('ParticipantRow', ['id', 'name'])
+EventRow = namedtuple('EventRow', ['id', 'name', 'date'])
+
+IndexSnapshot = namedtuple('IndexSnapshot', ['participants', 'events'])
+
+
+def build_index_snapshot():
+    """Build the page shell in a fixed number of queries (2)."""
+    participants = [
+        ParticipantRow(*row)
+        for row in db.session.execute(select(Participant.id, Participant.name).order_by(Participant.id))
+    ]
+    events = [
+        EventRow(*row)
+        for row in db.session.execute(
+            select(Event.id, Event.name, Event.date).order_by(Event.date.desc(), Event.id.desc())
+        )
+    ]
+    return IndexSnapshot(participants, events)
@@ -0,0 +1,145 @@
+"""数据库连接配置
+
+默认使用 SQLite，并针对 `gunicorn -w N` 多进程并发写入做了调优：
+WAL 日志模式、busy_timeout、缓存/mmap 等 PRAGMA，以及写路由 (@write_transaction) 使用 BEGIN IMMEDIATE，
+避免聚会高峰时多台手机同时记录饮酒出现 "database is locked"。
+
+只有请求的 db.session（WriteLockSession 的连接）按 g.write_transaction 申请写锁；服务模块里
+db.engine.begin() 开的旁路连接不受影响，否则它会在请求自己持有的写锁上排队直到 busy_timeout。
+先读后写的旁路事务（例如提交后台任务时先查重再插入）用 immediate(engine) 显式申请写锁。
+
+所有参数都可以通过环境变量覆盖（见 .env.example）。
+"""
+import os
+from functools import wraps
+
+import weakref
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_DATABASE_URI = 'sqlite:///bar.db'
+
+# PRAGMA 默认值：WAL + NORMAL 在 WAL 下是安全的，且每次提交无需 fsync 主库文件
+SQLITE_DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT_MS': '5000',
+    'SQLITE_CACHE_SIZE': '-16000',     # 负数单位为 KiB，约 16 MB
+    'SQLITE_MMAP_SIZE': '134217728',   # 128 MB
+    'SQLITE_IMMEDIATE_WRITES': '1',    # 写路由直接申请写锁
+    'DB_POOL_SIZE': '5',
+    'DB_MAX_OVERFLOW': '5',
+}
+
+
+def _setting(name):
+    return os.environ.get(name, SQLITE_DEFAULTS[name])
+
+
+def write_transaction(view):
+    """Mark a route that modifies the database.
+
+    Its transaction starts with BEGIN IMMEDIATE so concurrent writers queue on
+    busy_timeout instead of failing. Read-only POST routes (AI calls, PDF menus)
+    must not use it, or they would hold the write lock for the whole LLM call.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.write_transaction = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _in_write_transaction():
+    return has_app_context() and g.get('write_transaction', False)
+
+
+_session_engines = weakref.WeakKeyDictionary()
+
+
+def _session_engine(engine):
+    # 每个 engine 只建一个，session 按 bind 复用连接
+    if engine not in _session_engines:
+        _session_engines[engine] = engine.execution_options(write_lock='request')
+    return _session_engines[engine]
+
+
+class WriteLockSession(Session):
+    """db.session class: its connections take the write lock on @write_transaction routes."""
+
+    def get_bind(self, *args, **kwargs):
+        if self.bind is not None:
+            return self.bind  # 显式绑定到某个连接 (见 migrations.prepare)
+        bind = super().get_bind(*args, **kwargs)
+        return _session_engine(bind) if isinstance(bind, Engine) else bind
+
+
+def immediate(engine):
+    """``engine`` whose transactions always start with BEGIN IMMEDIATE (for read-then-write side connections)."""
+    return engine.execution_options(write_lock='always')
+
+
+def configure_database(app):
+    """Fill SQLAlchemy config on ``app`` before ``db.init_app(app)``."""
+    uri = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URI)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    if uri.startswith('sqlite'):
+        busy_timeout_ms = int(_setting('SQLITE_BUSY_TIMEOUT_MS'))
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            # Each gunicorn worker gets its own small pool; connections are per process
+            'pool_size': int(_setting('DB_POOL_SIZE')),
+            'max_overflow': int(_setting('DB_MAX_OVERFLOW')),
+            'connect_args': {
+                'timeout': busy_timeout_ms / 1000.0,
+                'check_same_thread': False,
+            },
+        }
+
+
+def install_sqlite_pragmas(engine):
+    """Apply PRAGMAs on every new connection and take the write lock up front for write requests."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    journal_mode = _setting('SQLITE_JOURNAL_MODE')
+    synchronous = _setting('SQLITE_SYNCHRONOUS')
+    busy_timeout_ms = int(_setting('SQLITE_BUSY_TIMEOUT_MS'))
+    cache_size = int(_setting('SQLITE_CACHE_SIZE'))
+    mmap_size = int(_setting('SQLITE_MMAP_SIZE'))
+    immediate_writes = _setting('SQLITE_IMMEDIATE_WRITES') == '1'
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy (not pysqlite) decide when transactions begin
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+        cursor.execute(f"PRAGMA cache_size={cache_size}")
+        cursor.execute(f"PRAGMA mmap_size={mmap_size}")
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _on_begin(conn):
+        # A deferred transaction that reads first and writes later (e.g. log_drink looks up
+        # the recipe, then inserts) fails with SQLITE_BUSY instead of waiting on busy_timeout.
+        write_lock = conn.get_execution_options().get('write_lock')
+        if write_lock == 'always' or (immediate_writes and write_lock == 'request' and _in_write_transaction()):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            conn.exec_driver_sql("BEGIN")
+
+
+def sqlite_status(engine):
+    """Current PRAGMA values, for diagnostics."""
+    with engine.connect() as conn:
+        return {
+            name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size')
+        }
@@ -0,0 +1,60 @@
+"""活动 AI 总结缓存
+
+分享卡片上的“今夜总结语”每次点击都要重新统计并调用一次 LLM，即使之后没有人再点过酒。
+生成的总结按活动保存在 event_summary 表中，并记录生成时所用统计文本（连同活动名、日期）的哈希：
+- 哈希一致：数据没有变化，直接返回已保存的总结；
+- 哈希不一致：有新的饮酒记录（或活动改名），重新生成并覆盖；
+- 也可以先返回旧总结，同时提交一个低优先级的后台任务重新生成（见 app.py 的 event_summary 任务）。
+
+生成失败的结果和模拟总结（无 API Key 或 AI 不可用时的备选）不会保存。
+"""
+import hashlib
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, EventSummary
+from services.llm_service import generate_event_summary, llm_enabled, SUMMARY_FAILED_PREFIX, MOCK_SUMMARY
+
+
+def stats_fingerprint(event_name, date_str, stats_text):
+    payload = '\n'.join([event_name or '', date_str, stats_text])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def load(event_id):
+    """(summary, stats_hash) stored for the event, or (None, None)."""
+    with db.engine.connect() as conn:
+        row = conn.execute(
+            select(EventSummary.summary, EventSummary.stats_hash).where(EventSummary.event_id == event_id)
+        ).first()
+    return (row.summary, row.stats_hash) if row else (None, None)
+
+
+def store(event_id, stats_hash, summary):
+    now = time.time()
+    with db.engine.begin() as conn:
+        stmt = insert(EventSummary).values(event_id=event_id, stats_hash=stats_hash, summary=summary, created_at=now)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=['event_id'],
+            set_={'stats_hash': stats_hash, 'summary': summary, 'created_at': now},
+        ))
+
+
+def is_cacheable(summary):
+    return (llm_enabled() and bool(summary) and summary != MOCK_SUMMARY
+            and not summary.startswith(SUMMARY_FAILED_PREFIX))
+
+
+def generate(event_id, event_name, date_str, stats_text, stats_hash, previous=None):
+    """Call the LLM and keep the result if it is a real summary.
+
+    If the call fails, the ``previous`` (outdated) summary beats the generic fallback text.
+    """
+    summary = generate_event_summary(event_name, date_str, stats_text)
+    if is_cacheable(summary):
+        store(event_id, stats_hash, summary)
+    elif previous and llm_enabled():
+        return previous
+    return summary
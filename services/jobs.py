@@ -0,0 +1,268 @@
+"""后台 AI 任务队列
+
+gunicorn 同步 worker 只有几个，如果每个 AI 请求都在 worker 里等 10–30 秒，几位客人同时点 Omakase
+就会把记录饮酒也一起卡住。改为：
+- 请求只把任务写入 ai_job 表并立即返回 job id（202）；
+- 每个 worker 进程内有 AI_JOB_WORKERS 个后台线程，按 priority（大者优先）、提交时间领取任务，
+  领取是一条原子 UPDATE，多个进程同时领取也不会重复执行；
+- 任务状态、流式生成中已完成的字段 (partial) 和最终结果都在表里，任何 worker 都能回答轮询；
+- 排队任务超过 AI_JOB_MAX_QUEUED 时拒绝提交 (QueueFull)；
+- 取消：排队中的任务直接取消，运行中的任务在下一个流式片段到达时中止（关闭上游连接）；
+- 空闲时只做一次只读查询看有没有排队任务，有才去拿写锁领取，轮询间隔从 POLL_INTERVAL 逐步退到
+  IDLE_POLL_MAX；本进程提交任务时立即唤醒，其它进程提交的任务最迟 IDLE_POLL_MAX 秒后被领取。
+
+处理函数用 @handler(kind) 注册，接收 params，返回 llm_service.stream_* 形式的事件生成器：
+('token', text) / ('field', name, value) / ('done', result)。
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import select, update, delete, func
+
+from models import db, AIJob
+from services.database import immediate
+
+logger = logging.getLogger(__name__)
+
+AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', '2'))
+AI_JOB_MAX_QUEUED = int(os.environ.get('AI_JOB_MAX_QUEUED', '100'))
+AI_JOB_STALE_SECONDS = int(os.environ.get('AI_JOB_STALE_SECONDS', '300'))
+AI_JOB_RETENTION_SECONDS = int(os.environ.get('AI_JOB_RETENTION_SECONDS', str(24 * 3600)))
+POLL_INTERVAL = 0.5
+IDLE_POLL_MAX = 5.0
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+_handlers = {}
+
+
+class QueueFull(Exception):
+    """Too many queued jobs; the route answers 503."""
+
+
+class UnknownJobKind(KeyError):
+    pass
+
+
+def handler(kind):
+    """Register ``fn(params) -> event generator`` for jobs of ``kind``."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def submit(kind, params, priority=0, unique=False):
+    """Queue a job and return its id. With ``unique``, reuse an identical queued/running job instead."""
+    if kind not in _handlers:
+        raise UnknownJobKind(kind)
+    job_id = uuid.uuid4().hex
+    # 先查重/计数再插入：普通 BEGIN 在读和写之间有别的连接提交时会立即 SQLITE_BUSY（不等 busy_timeout）
+    with immediate(db.engine).begin() as conn:
+        if unique:
+            existing = conn.execute(select(AIJob.id).where(
+                AIJob.kind == kind, AIJob.params == _dumps(params), AIJob.status.in_(('queued', 'running'))
+            )).scalar()
+            if existing:
+                return existing
+        queued = conn.execute(select(func.count()).select_from(AIJob).where(AIJob.status == 'queued')).scalar()
+        if queued >= AI_JOB_MAX_QUEUED:
+            raise QueueFull(f"AI 任务排队已满 ({queued})，请稍后再试")
+        conn.execute(AIJob.__table__.insert().values(
+            id=job_id, kind=kind, params=_dumps(params), priority=priority,
+            status='queued', cancel_requested=False, created_at=time.time(),
+        ))
+    _wake.set()
+    return job_id
+
+
+def get(job_id):
+    """Job as a dict (for polling), or None."""
+    with db.engine.connect() as conn:
+        row = conn.execute(select(AIJob).where(AIJob.id == job_id)).mappings().first()
+    if row is None:
+        return None
+    job = {
+        'id': row['id'], 'kind': row['kind'], 'status': row['status'], 'priority': row['priority'],
+        'partial': json.loads(row['partial']) if row['partial'] else {},
+        'result': json.loads(row['result']) if row['result'] else None,
+        'error': row['error'],
+    }
+    if row['status'] == 'queued':
+        with db.engine.connect() as conn:
+            job['position'] = conn.execute(
+                select(func.count()).select_from(AIJob).where(
+                    AIJob.status == 'queued',
+                    (AIJob.priority > row['priority'])
+                    | ((AIJob.priority == row['priority']) & (AIJob.created_at < row['created_at'])),
+                )
+            ).scalar() + 1
+    return job
+
+
+def cancel(job_id):
+    """Cancel a queued job, or ask a running one to stop. Returns the new status (None if unknown)."""
+    now = time.time()
+    with db.engine.begin() as conn:
+        cancelled = conn.execute(
+            update(AIJob).where(AIJob.id == job_id, AIJob.status == 'queued')
+            .values(status='cancelled', finished_at=now)
+        ).rowcount
+        if cancelled:
+            return 'cancelled'
+        conn.execute(update(AIJob).where(AIJob.id == job_id, AIJob.status == 'running').values(cancel_requested=True))
+        return conn.execute(select(AIJob.status).where(AIJob.id == job_id)).scalar()
+
+
+def queue_stats():
+    """Queue depth and timing across all workers."""
+    now = time.time()
+    with db.engine.connect() as conn:
+        counts = dict(conn.execute(select(AIJob.status, func.count()).group_by(AIJob.status)).all())
+        oldest = conn.execute(select(func.min(AIJob.created_at)).where(AIJob.status == 'queued')).scalar()
+        wait, run = conn.execute(
+            select(func.avg(AIJob.started_at - AIJob.created_at), func.avg(AIJob.finished_at - AIJob.started_at))
+            .where(AIJob.status == 'done', AIJob.finished_at > now - 3600)
+        ).one()
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'cancelled': counts.get('cancelled', 0),
+        'oldest_queued_seconds': round(now - oldest, 1) if oldest else 0,
+        'avg_wait_seconds_1h': round(wait or 0, 2),
+        'avg_run_seconds_1h': round(run or 0, 2),
+        'max_queued': AI_JOB_MAX_QUEUED,
+        'workers_per_process': AI_JOB_WORKERS,
+    }
+
+
+# ---------- 后台线程 ----------
+
+_wake = threading.Event()
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def start_workers(app):
+    """Start this process's worker threads once (after fork, so each gunicorn worker has its own)."""
+    global _started_pid
+    if _started_pid == os.getpid() or AI_JOB_WORKERS <= 0:
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        for i in range(AI_JOB_WORKERS):
+            threading.Thread(target=_worker_loop, args=(app,), name=f'ai-job-{i}', daemon=True).start()
+
+
+def _has_queued():
+    """Cheap read (no write lock): is any job waiting?"""
+    with db.engine.connect() as conn:
+        return conn.execute(select(AIJob.id).where(AIJob.status == 'queued').limit(1)).first() is not None
+
+
+def _claim(worker):
+    now = time.time()
+    next_job = (
+        select(AIJob.id).where(AIJob.status == 'queued')
+        .order_by(AIJob.priority.desc(), AIJob.created_at).limit(1)
+        .scalar_subquery()
+    )
+    with db.engine.begin() as conn:
+        return conn.execute(
+            update(AIJob).where(AIJob.id == next_job, AIJob.status == 'queued')
+            .values(status='running', worker=worker, started_at=now)
+            .returning(AIJob.id, AIJob.kind, AIJob.params)
+        ).first()
+
+
+def _update(job_id, **values):
+    with db.engine.begin() as conn:
+        return conn.execute(
+            update(AIJob).where(AIJob.id == job_id).values(**values).returning(AIJob.cancel_requested)
+        ).scalar()
+
+
+def _cancel_requested(job_id):
+    with db.engine.connect() as conn:
+        return conn.execute(select(AIJob.cancel_requested).where(AIJob.id == job_id)).scalar()
+
+
+def _run(job_id, kind, params):
+    partial = {}
+    events = _handlers[kind](json.loads(params))
+    last_check = time.time()
+    try:
+        for kind_, *payload in events:
+            cancelled = False
+            if kind_ == 'field':
+                partial[payload[0]] = payload[1]
+                cancelled = _update(job_id, partial=_dumps(partial))
+            elif kind_ == 'token' and time.time() - last_check > 1:
+                cancelled = _cancel_requested(job_id)
+                last_check = time.time()
+            if cancelled:
+                _update(job_id, status='cancelled', finished_at=time.time())
+                return
+            if kind_ == 'done':
+                result = payload[0]
+                failed = isinstance(result, dict) and 'error' in result
+                _update(job_id, status='failed' if failed else 'done', result=_dumps(result),
+                        error=result['error'] if failed else None, finished_at=time.time())
+                return
+        _update(job_id, status='failed', error='任务没有返回结果', finished_at=time.time())
+    finally:
+        events.close()
+
+
+def _housekeeping():
+    """Fail jobs whose worker died mid-run and drop old finished jobs."""
+    now = time.time()
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(AIJob).where(AIJob.status == 'running', AIJob.started_at < now - AI_JOB_STALE_SECONDS)
+            .values(status='failed', error='任务超时或 worker 已退出', finished_at=now)
+        )
+        conn.execute(delete(AIJob).where(AIJob.status.in_(FINISHED), AIJob.finished_at < now - AI_JOB_RETENTION_SECONDS))
+
+
+def _worker_loop(app):
+    worker = f'{os.getpid()}:{threading.current_thread().name}'
+    last_housekeeping = 0
+    idle = POLL_INTERVAL
+    while True:
+        try:
+            with app.app_context():
+                if time.time() - last_housekeeping > 60:
+                    _housekeeping()
+                    last_housekeeping = time.time()
+                # 先清除唤醒标记再查询：查询之后提交的任务会重新 set，不会漏掉
+                _wake.clear()
+                claimed = _claim(worker) if _has_queued() else None
+                if claimed is not None:
+                    idle = POLL_INTERVAL
+                    job_id, kind, params = claimed
+                    try:
+                        _run(job_id, kind, params)
+                    except Exception as e:
+                        logger.exception("AI job %s failed", job_id)
+                        _update(job_id, status='failed', error=str(e), finished_at=time.time())
+                    continue
+        except Exception:
+            logger.exception("AI job worker error")
+        # 本进程有新任务提交时立即醒来，否则定期轮询（其它进程提交的任务），越空闲间隔越长
+        if _wake.wait(idle):
+            idle = POLL_INTERVAL
+        else:
+            idle = min(idle * 2, IDLE_POLL_MAX)
@@ -0,0 +1,308 @@
+"""AI 回答的 JSON 容错解析
+
+模型偶尔不按要求只返回 JSON：前后带说明文字、用单引号或中文引号、用中文冒号逗号、
+多一个尾逗号、漏一个逗号、字符串里有没转义的引号，或者输出被截断。以前这些都直接变成“解析失败”。
+
+parse(text, schema) 依次尝试：
+1. 去掉 ```json 代码块标记后直接 json.loads；
+2. 本地修复：从第一个 '{' 开始逐字符扫描（括号配平，之后的文字忽略），
+   统一引号和中文标点、补/删逗号、给裸键名加引号、补全截断的字符串和括号；
+3. 按 schema 检查并规整字段：必填字段必须存在，列表形式的步骤合并成文本，
+   配料的 amount 转成数字（"45ml" -> 45 并补上 unit，"1/2" -> 0.5，“适量”等无法识别的记 0）。
+
+返回 (结果, outcome, 错误说明)，outcome 为 'ok'（原样可用）、'repaired'（经过本地修复或规整）或 'failed'。
+本地修复仍失败时，由调用方决定是否再请求一次 AI 修正（见 services/llm_service.py）。
+"""
+import json
+import re
+import unicodedata
+
+_OPEN_QUOTES = {'"': '"', '“': '”"', '”': '”"', "'": "'’", '‘': "’'", '’': "’'"}
+_PUNCTUATION = {'｛': '{', '｝': '}', '［': '[', '］': ']', '：': ':', '，': ',', '、': ','}
+_CLOSERS = {'{': '}', '[': ']'}
+_VALUE_END = set(',:}]')
+_FULLWIDTH_END = set('，：｝］')
+_OBJECT_START = re.compile('[{｛]')
+_LITERALS = {'true': 'true', 'false': 'false', 'null': 'null', 'True': 'true', 'False': 'false', 'None': 'null'}
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?$')
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '/': '/', '\\': '\\', '"': '"', "'": "'"}
+_MAX_STARTS = 5
+
+
+class _Repairer:
+    """One left-to-right pass that rewrites almost-JSON into JSON text."""
+
+    def __init__(self, text, start):
+        self.src = text
+        self.i = start
+        self.out = []
+        self.stack = []
+        self.last = None          # 'open' / 'value' / 'colon' / 'comma'
+        self.commas = []          # (len(out), stack 快照)：截断时回退到最后一个完整成员
+        self.truncated = False
+
+    def run(self):
+        src = self.src
+        while self.i < len(src):
+            c = src[self.i]
+            if c in _OPEN_QUOTES:
+                self._value(json.dumps(self._read_string(), ensure_ascii=False))
+                continue
+            c = _PUNCTUATION.get(c, c)
+            if c in '{[':
+                self._separate()
+                self.stack.append(c)
+                self.out.append(c)
+                self.last = 'open'
+            elif c in '}]':
+                self._drop_trailing_comma()
+                if self.stack:
+                    self.out.append(_CLOSERS[self.stack.pop()])
+                self.last = 'value'
+                if not self.stack:
+                    self.i += 1
+                    return ''.join(self.out)
+            elif c == ',':
+                if self.last == 'value':
+                    self.out.append(',')
+                    self.commas.append((len(self.out) - 1, list(self.stack)))
+                    self.last = 'comma'
+            elif c == ':':
+                self.out.append(':')
+                self.last = 'colon'
+            elif c.isspace():
+                pass
+            elif src.startswith('//', self.i):
+                end = src.find('\n', self.i)
+                self.i = len(src) if end < 0 else end
+                continue
+            else:
+                self._value(self._read_bare())
+                continue
+            self.i += 1
+        self.truncated = True
+        return self._close(len(self.out), self.stack)
+
+    def candidates(self):
+        """Texts to try for a truncated object: everything, then cut back to earlier complete members."""
+        yield self._close(len(self.out), self.stack)
+        for length, stack in reversed(self.commas[-3:]):
+            yield self._close(length, stack)
+
+    def _close(self, length, stack):
+        text = ''.join(self.out[:length]).rstrip().rstrip(',:')
+        return text + ''.join(_CLOSERS[c] for c in reversed(stack))
+
+    def _separate(self):
+        if self.last == 'value':
+            # 漏掉的逗号
+            self.out.append(',')
+            self.commas.append((len(self.out) - 1, list(self.stack)))
+
+    def _value(self, token):
+        self._separate()
+        self.out.append(token)
+        self.last = 'value'
+
+    def _drop_trailing_comma(self):
+        if self.out and self.out[-1] == ',':
+            self.out.pop()
+            self.commas = [c for c in self.commas if c[0] < len(self.out)]
+
+    def _read_string(self):
+        src = self.src
+        opener = src[self.i]
+        closers = _OPEN_QUOTES[opener]
+        # 用中文引号的回答，分隔符多半也是中文标点；ASCII 引号的字符串里，中文逗号更可能是正文
+        strict = opener in '"\''
+        self.i += 1
+        chars = []
+        while self.i < len(src):
+            c = src[self.i]
+            if c == '\\' and self.i + 1 < len(src):
+                nxt = src[self.i + 1]
+                if nxt == 'u' and re.match(r'[0-9a-fA-F]{4}', src[self.i + 2:self.i + 6]):
+                    chars.append(chr(int(src[self.i + 2:self.i + 6], 16)))
+                    self.i += 6
+                    continue
+                chars.append(_ESCAPES.get(nxt, '\\' + nxt))
+                self.i += 2
+                continue
+            if c in closers and self._ends_string(self.i + 1, strict):
+                self.i += 1
+                return ''.join(chars)
+            chars.append(c)
+            self.i += 1
+        self.truncated = True
+        return ''.join(chars)
+
+    def _ends_string(self, j, strict):
+        """A quote closes the string only if what follows looks like JSON structure (else it is content).
+
+        With ``strict`` (ASCII quotes) a Chinese comma only counts when the next member starts right after it.
+        """
+        src = self.src
+        j, newline = self._skip_space(j)
+        if j >= len(src) or src[j] in _VALUE_END or src[j] in '：｝］':
+            return True
+        if src[j] == '，':
+            k, _ = self._skip_space(j + 1)
+            return not strict or (k < len(src) and (src[k] in _OPEN_QUOTES or src[k] in '{[｛［'))
+        # 换行后紧跟下一个键：上一行漏了逗号
+        return newline and src[j] in _OPEN_QUOTES
+
+    def _skip_space(self, j):
+        newline = False
+        while j < len(self.src) and self.src[j].isspace():
+            newline = newline or self.src[j] == '\n'
+            j += 1
+        return j, newline
+
+    def _read_bare(self):
+        src = self.src
+        start = self.i
+        while self.i < len(src) and src[self.i] not in _VALUE_END | _FULLWIDTH_END and src[self.i] not in '\n{[｛［':
+            self.i += 1
+        word = src[start:self.i].strip()
+        if self.i == start:
+            self.i += 1  # 无法识别的单个字符，跳过
+            return '""'
+        if word in _LITERALS:
+            return _LITERALS[word]
+        if _NUMBER.match(word):
+            return word
+        return json.dumps(word, ensure_ascii=False)
+
+
+def _strip_fences(text):
+    text = text.strip()
+    match = re.search(r"```(?:json)?\s*(.*?)\s*```", text, re.DOTALL)
+    return match.group(1) if match else text.strip('`')
+
+
+def repair(text):
+    """The first JSON object found in ``text`` after local repair, or None."""
+    text = _strip_fences(text or '')
+    starts = [m.start() for m in _OBJECT_START.finditer(text)][:_MAX_STARTS]
+    for start in starts:
+        repairer = _Repairer(text, start)
+        candidates = [repairer.run()]
+        if repairer.truncated:
+            candidates += list(repairer.candidates())
+        for candidate in candidates:
+            try:
+                value = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict) and value:
+                return value
+    return None
+
+
+# ---------- schema ----------
+
+def coerce_amount(value):
+    """(number, unit found in the text or '') for an ingredient amount; unknown amounts become 0."""
+    if isinstance(value, bool) or value is None:
+        return 0, ''
+    if isinstance(value, (int, float)):
+        return value, ''
+    text = unicodedata.normalize('NFKC', str(value)).strip()
+    if text.startswith('半'):
+        return 0.5, text[1:].strip()
+    match = re.match(r'(\d+(?:\.\d+)?)\s*(?:/\s*(\d+))?\s*(?:[-~～到至]\s*\d+(?:\.\d+)?)?\s*(.*)$', text)
+    if not match:
+        return 0, ''
+    number = float(match.group(1))
+    if match.group(2) and float(match.group(2)):
+        number /= float(match.group(2))
+    number = round(number, 3)
+    return (int(number) if number.is_integer() else number), match.group(3).strip()
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, list) and all(isinstance(v, (str, int, float)) for v in value):
+        return '\n'.join(str(v).strip() for v in value)
+    raise ValueError('应为文本')
+
+
+def _ingredient(value):
+    if isinstance(value, str):
+        # "金酒 45ml" / "金酒：45 ml"
+        match = re.match(r'(.+?)[\s:：]+([\d.／/]+.*)$', value.strip())
+        value = {'name': match.group(1), 'amount': match.group(2)} if match else {'name': value}
+    if not isinstance(value, dict) or not _text(value.get('name', '')):
+        raise ValueError('配料缺少 name')
+    amount, unit_hint = coerce_amount(value.get('amount'))
+    unit = value.get('unit')
+    unit = _text(unit) if unit not in (None, '') else unit_hint
+    return dict(value, name=_text(value['name']), amount=amount, unit=unit)
+
+
+def _ingredients(value):
+    if isinstance(value, dict):
+        # {"金酒": "45ml"}
+        value = [{'name': k, 'amount': v} for k, v in value.items()]
+    if not isinstance(value, list) or not value:
+        raise ValueError('应为非空的配料列表')
+    return [_ingredient(v) for v in value]
+
+
+COERCERS = {'text': _text, 'ingredients': _ingredients}
+
+
+def validate(data, schema):
+    """Coerce ``data`` to ``schema`` ({field: 'text' | 'ingredients', optional fields end in '?'}).
+
+    Returns the coerced dict; raises ValueError naming the first bad field.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('不是 JSON 对象')
+    result = dict(data)
+    for field, kind in schema.items():
+        optional = kind.endswith('?')
+        if data.get(field) in (None, ''):
+            if optional:
+                result.pop(field, None)
+                continue
+            raise ValueError(f'缺少字段 {field}')
+        try:
+            result[field] = COERCERS[kind.rstrip('?')](data[field])
+        except ValueError as e:
+            raise ValueError(f'{field} {e}') from None
+    return result
+
+
+def describe(schema):
+    """Example object for a schema, used in the follow-up "fix your JSON" prompt."""
+    example = {'text': '文本', 'ingredients': [{'name': '配料名', 'amount': 0, 'unit': 'ml'}]}
+    return json.dumps({field: example[kind.rstrip('?')] for field, kind in schema.items()}, ensure_ascii=False)
+
+
+def parse(text, schema, unwrap=None):
+    """(result, outcome, error) for an AI answer; see the module docstring.
+
+    ``unwrap`` names a wrapper key the model sometimes adds ({"recommendation": {...}}).
+    """
+    data, outcome = None, 'ok'
+    try:
+        data = json.loads(_strip_fences(text or ''))
+    except json.JSONDecodeError:
+        pass
+    if not isinstance(data, dict):
+        data, outcome = repair(text), 'repaired'
+        if data is None:
+            return None, 'failed', '找不到可解析的 JSON 对象'
+    if unwrap and isinstance(data.get(unwrap), dict) and len(data) == 1:
+        data = data[unwrap]
+    try:
+        result = validate(data, schema)
+    except ValueError as e:
+        return None, 'failed', str(e)
+    if result != data:
+        outcome = 'repaired'
+    return result, outcome, None
@@ -0,0 +1,103 @@
+"""流式 JSON 字段提取
+
+LLM 以流式返回一个 JSON 对象时，逐段 feed 收到的文本，每当某个顶层字段的值完整出现
+（字符串闭合、数组/对象括号配平、数字/布尔值后遇到逗号或右括号），就立即返回 (字段名, 值)，
+前端可以先填好 name，再填 ingredients，而不用等整段回复结束。
+
+第一个 '{' 之前的内容（例如 ```json 代码块标记）会被忽略。
+"""
+import json
+
+
+class JsonFieldExtractor:
+    """Incrementally extract completed top-level fields of the first JSON object in a text stream."""
+
+    def __init__(self):
+        self._text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = 'key'        # 'key' -> 'colon' -> 'value' -> 'comma'
+        self._key = None
+        self._start = None          # start index of the key/value being read
+        self.fields = {}
+        self.done = False
+
+    def feed(self, chunk):
+        """Consume more text; return [(name, value)] for fields completed by it."""
+        completed = []
+        if self.done:
+            return completed
+        self._text += chunk
+        text = self._text
+        while self._pos < len(text) and not self.done:
+            i, c = self._pos, text[self._pos]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._finish_string(i, completed)
+                continue
+
+            if self._depth == 0:
+                if c == '{':
+                    self._depth = 1
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect in ('key', 'value'):
+                    self._start = i
+            elif c in '{[':
+                if self._depth == 1 and self._expect == 'value':
+                    self._start = i
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 1 and self._start is not None:
+                    self._emit(text[self._start:i + 1], completed)
+                elif self._depth == 0:
+                    if self._expect == 'value' and self._start is not None:
+                        self._emit(text[self._start:i], completed)
+                    self.done = True
+            elif self._depth == 1:
+                if c == ':' and self._expect == 'colon':
+                    self._expect = 'value'
+                    self._start = None
+                elif c == ',':
+                    if self._expect == 'value' and self._start is not None:
+                        self._emit(text[self._start:i], completed)
+                    self._expect = 'key'
+                elif not c.isspace() and self._expect == 'value' and self._start is None:
+                    self._start = i     # number / true / false / null
+        return completed
+
+    def _finish_string(self, end, completed):
+        raw = self._text[self._start:end + 1]
+        if self._expect == 'key':
+            try:
+                self._key = json.loads(raw)
+            except ValueError:
+                self._key = None
+            self._expect = 'colon'
+        elif self._expect == 'value':
+            self._emit(raw, completed)
+
+    def _emit(self, raw, completed):
+        self._start = None
+        self._expect = 'comma'
+        if self._key is None:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        self.fields[self._key] = value
+        completed.append((self._key, value))
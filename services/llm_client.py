@@ -0,0 +1,362 @@
+"""DashScope (OpenAI 兼容接口) HTTP 客户端
+
+所有 AI 调用共用一个进程级的 requests.Session：
+- 连接池 + keep-alive，后续请求复用已建立的 TCP/TLS 连接，省去每次的握手；
+- 连接超时和读取超时分开设置（建连很快就该失败，生成内容则可能要等几十秒）；
+- 连接失败以及 429/5xx 响应按指数退避自动重试。读取超时不重试，避免把一次慢生成变成两次。
+  重试由 _post() 自己做而不是交给 urllib3：所有尝试和退避等待共用同一个截止时间（时间预算），
+  每次尝试只拿剩余的时间，剩余时间不够再等一次退避就不再重试。
+
+stream_chat_completion 以 `stream: true` 调用，逐段返回模型输出（OpenAI 兼容的 SSE 格式）。
+并发的相同请求只调用一次上游，见 services/single_flight.py。
+
+DashScope 变慢或宕机时不让每个请求都等满超时：
+- 时间预算 (budget)：调用方给出本次最多等多久（包括重试），连接/读取超时不超过剩余的预算，
+  流式请求超出预算即中止；
+- 熔断器：连续 LLM_BREAKER_FAILURES 次失败/超时后打开，LLM_BREAKER_COOLDOWN 秒内直接抛出 CircuitOpen，
+  之后放行一个试探请求，成功则关闭。熔断状态按 worker 进程各自统计；
+- 对冲请求 (可选)：非流式调用超过 LLM_HEDGE_AFTER 秒还没返回时再发一个相同请求，取先成功的那个。
+
+每次实际发往上游的调用都记录耗时、结果、首个 token 的时间以及响应 usage 中的 token 数（services/metrics.py）；
+流式请求带上 stream_options.include_usage，让最后一个数据块附带 usage。
+
+参数可通过环境变量覆盖（见 .env.example）。DASHSCOPE_URL 可指向其它 OpenAI 兼容的接口，
+例如压测用的本地桩服务器 (benchmarks/dashscope_stub.py)。
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services import single_flight, metrics
+
+DASHSCOPE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"  # 默认地址，见 api_url()
+DEFAULT_MODEL = "qwen3-max"
+
+LLM_DEFAULTS = {
+    'LLM_CONNECT_TIMEOUT': '5',
+    'LLM_READ_TIMEOUT': '60',
+    'LLM_MAX_RETRIES': '2',
+    'LLM_RETRY_BACKOFF': '0.5',   # 0.5s, 1s, 2s ...
+    'LLM_POOL_SIZE': '10',        # 每个 worker 进程内可同时保持的连接数
+    'LLM_BREAKER_FAILURES': '3',  # 连续失败多少次后熔断
+    'LLM_BREAKER_COOLDOWN': '30', # 熔断多少秒后放行试探请求
+    'LLM_HEDGE_AFTER': '0',       # 非流式调用多少秒未返回就发对冲请求，0 关闭
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class LLMError(Exception):
+    """The completion request failed or returned an unexpected body."""
+
+
+class CircuitOpen(LLMError):
+    """Recent calls kept failing; the request was refused without contacting the API."""
+
+
+def _setting(name, cast=float):
+    return cast(os.environ.get(name, LLM_DEFAULTS[name]))
+
+
+def api_url():
+    """Chat completions endpoint: DASHSCOPE_URL from the environment, else the public DashScope URL."""
+    return os.environ.get('DASHSCOPE_URL') or DASHSCOPE_URL
+
+
+def timeouts(budget=None):
+    """(connect, read) timeout tuple for requests; neither exceeds the (remaining) budget."""
+    connect, read = _setting('LLM_CONNECT_TIMEOUT'), _setting('LLM_READ_TIMEOUT')
+    if budget is not None:
+        connect, read = max(0.1, min(connect, budget)), max(0.1, min(read, budget))
+    return connect, read
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open (one probe) after the cooldown."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+
+    def allow(self):
+        cooldown = _setting('LLM_BREAKER_COOLDOWN')
+        now = time.time()
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and now - self.opened_at < cooldown:
+                return False
+            # 冷却结束（或上一个试探请求迟迟没有结果）：放行一个试探请求
+            if self.state == 'half-open' and now - self.probe_started < cooldown:
+                return False
+            self.state = 'half-open'
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= _setting('LLM_BREAKER_FAILURES', int):
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'opened_at': self.opened_at or None}
+
+
+breaker = CircuitBreaker()
+
+
+def _check_breaker():
+    if not breaker.allow():
+        raise CircuitOpen("AI 服务暂时不可用（连续失败，已熔断）")
+
+
+def build_session():
+    pool_size = _setting('LLM_POOL_SIZE', int)
+    # 不让 urllib3 重试：重试在 _post() 里按时间预算进行
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Content-Type'] = 'application/json'
+    return session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def get_session():
+    """Process-wide pooled session; recreated after fork so workers never share sockets."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = build_session()
+                _session_pid = os.getpid()
+    return _session
+
+
+def _get_executor():
+    """Threads for hedged requests (one pool per worker process)."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _session_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=_setting('LLM_POOL_SIZE', int),
+                                               thread_name_prefix='llm-hedge')
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _retry_delay(attempt, resp=None):
+    """Backoff before retry number ``attempt`` (1-based), honouring a numeric Retry-After."""
+    delay = _setting('LLM_RETRY_BACKOFF') * 2 ** (attempt - 1)
+    try:
+        return max(delay, float(resp.headers.get('Retry-After', 0))) if resp is not None else delay
+    except ValueError:
+        return delay
+
+
+def _post(url, deadline, **kwargs):
+    """POST with retries on connection errors and RETRY_STATUSES, all before ``deadline`` (time.time()).
+
+    Each attempt's timeouts are capped by the time left; no retry starts if its backoff would
+    end past the deadline. Returns the last response (possibly a 429/5xx) or raises.
+    """
+    retries = _setting('LLM_MAX_RETRIES', int)
+    attempt = 0
+    while True:
+        remaining = None if deadline is None else deadline - time.time()
+        resp = error = None
+        try:
+            resp = get_session().post(url, timeout=timeouts(remaining), **kwargs)
+        except requests.ConnectionError as e:  # 包括连接超时；读取超时 (ReadTimeout) 不重试
+            if attempt >= retries:
+                raise
+            error = e
+        else:
+            if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                return resp
+        attempt += 1
+        delay = _retry_delay(attempt, resp)
+        if deadline is not None and time.time() + delay >= deadline:
+            if resp is not None:
+                return resp
+            raise LLMError(f"超出时间预算，不再重试: {error}") from error
+        if resp is not None:
+            resp.close()
+        time.sleep(delay)
+
+
+def chat_completion(messages, temperature, api_key, model=DEFAULT_MODEL, url=None, budget=None):
+    """POST a chat completion and return the assistant message content.
+
+    Identical concurrent calls share one upstream request (services/single_flight.py).
+    ``budget`` caps the wait in seconds.
+    """
+    url = url or api_url()
+    try:
+        return single_flight.call(single_flight.make_key(url, model, messages, temperature),
+                                  lambda: _post_completion(messages, temperature, api_key, model, url, budget))
+    except single_flight.FlightError as e:
+        raise LLMError(str(e)) from e
+
+
+def _post_completion(messages, temperature, api_key, model, url, budget):
+    _check_breaker_recorded('chat')
+    started = time.perf_counter()
+    try:
+        content = _hedged(lambda remaining: _request_completion(messages, temperature, api_key, model, url, remaining),
+                          budget)
+    except LLMError:
+        breaker.record_failure()
+        _record_call('chat', 'error', started)
+        raise
+    breaker.record_success()
+    _record_call('chat', 'ok', started)
+    return content
+
+
+def _check_breaker_recorded(mode):
+    try:
+        _check_breaker()
+    except CircuitOpen:
+        metrics.inc('clam_llm_requests_total', mode=mode, outcome='circuit_open')
+        raise
+
+
+def _record_call(mode, outcome, started):
+    metrics.observe('clam_llm_request_duration_seconds', time.perf_counter() - started, buckets=metrics.LLM_BUCKETS,
+                    mode=mode, outcome=outcome)
+    metrics.inc('clam_llm_requests_total', mode=mode, outcome=outcome)
+
+
+def _record_usage(usage, mode):
+    if isinstance(usage, dict):
+        metrics.inc('clam_llm_prompt_tokens_total', usage.get('prompt_tokens') or 0, mode=mode)
+        metrics.inc('clam_llm_completion_tokens_total', usage.get('completion_tokens') or 0, mode=mode)
+
+
+def _hedged(request, budget):
+    """request(budget) once, plus a second identical request if the first is slower than LLM_HEDGE_AFTER."""
+    delay = _setting('LLM_HEDGE_AFTER')
+    if delay <= 0 or (budget is not None and delay >= budget):
+        return request(budget)
+    started = time.time()
+    first = _get_executor().submit(request, budget)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeout:
+        pass
+    remaining = None if budget is None else budget - (time.time() - started)
+    pending = {first, _get_executor().submit(request, remaining)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                return future.result()  # 较慢的那个在后台自行结束，结果丢弃
+            except LLMError as e:
+                error = e
+    raise error
+
+
+def _request_completion(messages, temperature, api_key, model, url, budget):
+    deadline = None if budget is None else time.time() + budget
+    try:
+        resp = _post(
+            url, deadline,
+            json={"model": model, "messages": messages, "temperature": temperature},
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        resp.raise_for_status()
+        body = resp.json()
+        _record_usage(body.get("usage"), 'chat')
+        return body["choices"][0]["message"]["content"]
+    except requests.RequestException as e:
+        raise LLMError(str(e)) from e
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        raise LLMError(f"Unexpected response: {e}") from e
+
+
+def stream_chat_completion(messages, temperature, api_key, model=DEFAULT_MODEL, url=None, budget=None):
+    """Yield content deltas of a streamed chat completion as they arrive (shared like chat_completion)."""
+    url = url or api_url()
+    try:
+        yield from single_flight.stream(single_flight.make_key(url, model, messages, temperature),
+                                        lambda: _stream_deltas(messages, temperature, api_key, model, url, budget))
+    except single_flight.FlightError as e:
+        raise LLMError(str(e)) from e
+
+
+def _stream_deltas(messages, temperature, api_key, model, url, budget):
+    _check_breaker_recorded('stream')
+    started = time.perf_counter()
+    first = True
+    try:
+        for delta in _read_stream(messages, temperature, api_key, model, url, budget):
+            if first:
+                metrics.observe('clam_llm_first_token_seconds', time.perf_counter() - started,
+                                buckets=metrics.LLM_BUCKETS, mode='stream')
+                first = False
+            yield delta
+    except LLMError:
+        breaker.record_failure()
+        _record_call('stream', 'error', started)
+        raise
+    except GeneratorExit:
+        _record_call('stream', 'cancelled', started)
+        raise
+    breaker.record_success()
+    _record_call('stream', 'ok', started)
+
+
+def _read_stream(messages, temperature, api_key, model, url, budget):
+    deadline = None if budget is None else time.time() + budget
+    try:
+        with _post(
+            url, deadline,
+            json={"model": model, "messages": messages, "temperature": temperature, "stream": True,
+                  "stream_options": {"include_usage": True}},
+            headers={"Authorization": f"Bearer {api_key}", "Accept": "text/event-stream"},
+            stream=True,
+        ) as resp:
+            resp.raise_for_status()
+            resp.encoding = 'utf-8'  # text/event-stream 没有 charset 时 requests 默认按 latin-1 解码
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    return
+                chunk = json.loads(data)
+                _record_usage(chunk.get("usage"), 'stream')
+                choices = chunk.get("choices") or []
+                delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                if delta:
+                    yield delta
+                if deadline is not None and time.time() > deadline:
+                    raise LLMError(f"超出时间预算 ({budget:g}s)")
+    except requests.RequestException as e:
+        raise LLMError(str(e)) from e
+    except (ValueError, AttributeError, TypeError) as e:
+        raise LLMError(f"Unexpected stream chunk: {e}") from e
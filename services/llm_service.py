@@ -1,36 +1,96 @@
 import os
-import requests
-import json
-import re
-
-DASHSCOPE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
-
-def _clean_json_string(s):
-    """Attempt to extract and clean JSON string from LLM response"""
-    s = s.strip()
-    # Try to find JSON block
-    match = re.search(r"```json\s*(.*?)\s*```", s, re.DOTALL)
-    if match:
-        s = match.group(1)
-    elif s.startswith("```"):
-        s = s.strip("`")
-    return s
-
-def get_cocktail_suggestion(inventory_list, user_request):
-    api_key = os.environ.get("DASHSCOPE_API_KEY")
-
-    if not api_key:
-        return {
-            "name": "经典金汤力 (Gin & Tonic) [模拟]",
-            "ingredients": [
-                {"name": "金酒", "amount": 45, "unit": "ml"},
-                {"name": "通宁水", "amount": 100, "unit": "ml"},
-                {"name": "柠檬角", "amount": 1, "unit": "个"}
-            ],
-            "instructions": "1. 在杯中加满冰块。\n2. 倒入金酒。\n3. 缓缓倒入通宁水。\n4. 搅拌并挤入柠檬汁。",
-            "comment": "模拟模式：未配置 API Key。"
-        }
-
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+
+from flask import current_app, has_app_context
+
+from services.llm_client import chat_completion, stream_chat_completion, LLMError, DEFAULT_MODEL
+from services.json_stream import JsonFieldExtractor
+from services import metrics, json_repair
+
+SUGGESTION_TEMPERATURE = 0.7
+
+# 每类请求最多等多久 (秒)，超出即按失败处理；见 services/llm_client.py
+BUDGETS = {
+    'suggest': float(os.environ.get('LLM_BUDGET_SUGGEST', '20')),
+    'omakase': float(os.environ.get('LLM_BUDGET_OMAKASE', '20')),
+    'sommelier': float(os.environ.get('LLM_BUDGET_SOMMELIER', '25')),
+    'summary': float(os.environ.get('LLM_BUDGET_SUMMARY', '15')),
+    'repair': float(os.environ.get('LLM_BUDGET_REPAIR', '10')),
+}
+
+# 调用失败（超时、熔断、接口报错）时返回缓存或模拟结果，而不是 {"error": ...}；LLM_FALLBACK=0 关闭
+LLM_FALLBACK = os.environ.get('LLM_FALLBACK', '1') != '0'
+FALLBACK_NOTICE = "AI 调酒师暂时联系不上，先为您端上一杯备选。"
+
+def llm_enabled():
+    """False in mock mode (no DASHSCOPE_API_KEY); mock answers should not be cached."""
+    return bool(os.environ.get("DASHSCOPE_API_KEY"))
+
+def is_complete_recipe(result):
+    """A parsed recipe answer, i.e. not an error dict, a fallback or a parse-failure placeholder."""
+    return (isinstance(result, dict) and "error" not in result and "fallback" not in result
+            and result.get("name") not in (None, "解析失败"))
+
+def _fallback(error, mock, stale=None, wrap=lambda r: r):
+    """Answer for a failed call: the stale cached result if any, else the mock (marked with 'fallback')."""
+    if not LLM_FALLBACK:
+        return {"error": str(error)}
+    result = stale() if stale else None
+    source = 'cache'
+    if result is None:
+        result, source = wrap(copy.deepcopy(mock)), 'mock'
+    metrics.inc('clam_llm_fallback_total', source=source)
+    return dict(result, fallback=source, notice=FALLBACK_NOTICE, fallback_reason=str(error))
+
+# 各接口回答的字段，见 services/json_repair.py；以 ? 结尾的可省略
+SCHEMAS = {
+    'suggest': {'name': 'text', 'ingredients': 'ingredients', 'instructions': 'text', 'comment': 'text?'},
+    'omakase': {'comment': 'text?', 'name': 'text', 'ingredients': 'ingredients', 'instructions': 'text',
+                'ending': 'text?'},
+    'sommelier': {'name': 'text', 'presentation': 'text', 'tasting_notes': 'text', 'pairing_reason': 'text',
+                  'service_tip': 'text?'},
+}
+
+def _parse_json(content, endpoint, api_key=None):
+    """The answer as a schema-checked dict, or None.
+
+    Malformed JSON is repaired locally first; only if that fails (and ``api_key`` is given) one short
+    follow-up call asks the model to fix its own output. Outcomes are counted per endpoint.
+    """
+    unwrap = 'recommendation' if endpoint == 'sommelier' else None
+    result, outcome, error = json_repair.parse(content, SCHEMAS[endpoint], unwrap=unwrap)
+    if result is None and api_key:
+        try:
+            fixed = chat_completion(_repair_messages(content, endpoint, error), 0, api_key, budget=BUDGETS['repair'])
+            result, _, error = json_repair.parse(fixed, SCHEMAS[endpoint], unwrap=unwrap)
+        except LLMError:
+            result = None
+        outcome = 'llm_repaired' if result is not None else 'failed'
+    metrics.inc('clam_llm_parse_total', endpoint=endpoint, outcome=outcome)
+    return result
+
+def _repair_messages(content, endpoint, error):
+    return [
+        {"role": "system", "content": "你负责修正格式有误的 JSON。只输出修正后的 JSON 对象，不要任何其他文字。"},
+        {"role": "user", "content": f"下面的内容应当是符合这个结构的 JSON 对象：\n{json_repair.describe(SCHEMAS[endpoint])}\n"
+                                    f"问题：{error}\n请保留原有内容，只修正格式。\n\n{content[:4000]}"},
+    ]
+
+MOCK_SUGGESTION = {
+    "name": "经典金汤力 (Gin & Tonic) [模拟]",
+    "ingredients": [
+        {"name": "金酒", "amount": 45, "unit": "ml"},
+        {"name": "通宁水", "amount": 100, "unit": "ml"},
+        {"name": "柠檬角", "amount": 1, "unit": "个"}
+    ],
+    "instructions": "1. 在杯中加满冰块。\n2. 倒入金酒。\n3. 缓缓倒入通宁水。\n4. 搅拌并挤入柠檬汁。",
+    "comment": "模拟模式：未配置 API Key。"
+}
+
+def _suggestion_messages(inventory_list, user_request):
     inventory_str = ", ".join(inventory_list)
 
     prompt = f"""
@@ -52,52 +112,51 @@ def get_cocktail_suggestion(inventory_list, user_request):
     注意：amount 必须是数字，如果是适量请估算或写0，unit 必须统一。
     """
 
-    payload = {
-        "model": "qwen3-max",
-        "messages": [
-            {"role": "system", "content": "你是一位专业的调酒师助手。请只返回 JSON 格式的数据。"},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7
-    }
+    messages = [
+        {"role": "system", "content": "你是一位专业的调酒师助手。请只返回 JSON 格式的数据。"},
+        {"role": "user", "content": prompt}
+    ]
+    return messages
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+def _parse_suggestion(content, api_key=None):
+    result = _parse_json(content, 'suggest', api_key)
+    if result is None:
+        # Fallback for parsing error
+        return {
+            "name": "解析失败",
+            "ingredients": "见描述",
+            "instructions": content,
+            "comment": "AI 返回格式有误"
+        }
+    return result
+
+def get_cocktail_suggestion(inventory_list, user_request, stale=None):
+    """``stale()`` may return an expired cached answer to serve if the call fails."""
+    api_key = os.environ.get("DASHSCOPE_API_KEY")
+
+    if not api_key:
+        return copy.deepcopy(MOCK_SUGGESTION)
 
     try:
-        resp = requests.post(
-            DASHSCOPE_URL,
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        content = data["choices"][0]["message"]["content"]
-        
-        # Parse JSON
-        try:
-            cleaned_content = _clean_json_string(content)
-            return json.loads(cleaned_content)
-        except json.JSONDecodeError:
-            # Fallback for parsing error
-            return {
-                "name": "解析失败",
-                "ingredients": "见描述",
-                "instructions": content,
-                "comment": "AI 返回格式有误"
-            }
-
-    except Exception as e:
-        return {"error": str(e)}
+        content = chat_completion(_suggestion_messages(inventory_list, user_request), SUGGESTION_TEMPERATURE, api_key,
+                                  budget=BUDGETS['suggest'])
+        return _parse_suggestion(content, api_key)
+    except LLMError as e:
+        return _fallback(e, MOCK_SUGGESTION, stale)
+
+def stream_cocktail_suggestion(inventory_list, user_request, stale=None):
+    """Streaming get_cocktail_suggestion, see _stream_json."""
+    return _stream_json(lambda: _suggestion_messages(inventory_list, user_request), SUGGESTION_TEMPERATURE,
+                        _parse_suggestion, MOCK_SUGGESTION, budget=BUDGETS['suggest'], stale=stale)
+
+SUMMARY_FAILED_PREFIX = "总结生成失败"
+MOCK_SUMMARY = "今夜微醺，好友相聚。虽然没有 AI 的加持，但快乐是真实的。（模拟总结）"
 
 def generate_event_summary(event_name, date_str, stats_summary):
     api_key = os.environ.get("DASHSCOPE_API_KEY")
     
     if not api_key:
-        return "今夜微醺，好友相聚。虽然没有 AI 的加持，但快乐是真实的。（模拟总结）"
+        return MOCK_SUMMARY
 
     prompt = f"""
     活动名称：{event_name}
@@ -110,52 +169,38 @@ def generate_event_summary(event_name, date_str, stats_summary):
     内容包含：对大家酒量的调侃（如果有数据支持）、对聚会氛围的总结。
     """
     
-    payload = {
-        "model": "qwen3-max",
-        "messages": [
-            {"role": "system", "content": "你是一位经营日式酒吧多年的老板，见惯了悲欢离合，说话温和而有深意。"},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.8
-    }
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    messages = [
+        {"role": "system", "content": "你是一位经营日式酒吧多年的老板，见惯了悲欢离合，说话温和而有深意。"},
+        {"role": "user", "content": prompt}
+    ]
 
     try:
-        resp = requests.post(
-            DASHSCOPE_URL,
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data["choices"][0]["message"]["content"]
-    except Exception as e:
-        return f"总结生成失败: {e}"
-
-def get_omakase_suggestion(inventory_list, mood, weather):
-    api_key = os.environ.get("DASHSCOPE_API_KEY")
-    if not api_key:
-        return {
-            "name": "热托迪 (Hot Toddy) [模拟]",
-            "ingredients": [
-                {"name": "威士忌", "amount": 45, "unit": "ml"},
-                {"name": "热水", "amount": 100, "unit": "ml"},
-                {"name": "蜂蜜", "amount": 10, "unit": "ml"},
-                {"name": "柠檬", "amount": 1, "unit": "片"}
-            ],
-            "instructions": "1. 混合所有材料。\n2. 搅拌均匀。\n3. 趁热饮用。",
-            "comment": "Kenji (模拟): 今天的风有点喧嚣呢... 喝杯热酒暖暖身子吧。"
-        }
-
+        return chat_completion(messages, 0.8, api_key, budget=BUDGETS['summary'])
+    except LLMError as e:
+        return MOCK_SUMMARY if LLM_FALLBACK else f"{SUMMARY_FAILED_PREFIX}: {e}"
+
+MOCK_OMAKASE = {
+    "name": "热托迪 (Hot Toddy) [模拟]",
+    "ingredients": [
+        {"name": "威士忌", "amount": 45, "unit": "ml"},
+        {"name": "热水", "amount": 100, "unit": "ml"},
+        {"name": "蜂蜜", "amount": 10, "unit": "ml"},
+        {"name": "柠檬", "amount": 1, "unit": "片"}
+    ],
+    "instructions": "1. 混合所有材料。\n2. 搅拌均匀。\n3. 趁热饮用。",
+    "comment": "Kenji (模拟): 今天的风有点喧嚣呢... 喝杯热酒暖暖身子吧。"
+}
+
+OMAKASE_TEMPERATURE = 0.9 # Higher creativity
+
+def _omakase_messages(inventory_list, mood, weather, guest=None, variant=None):
     inventory_str = ", ".join(inventory_list)
+    guest_line = f"这位客人叫{guest}。" if guest else ""
+    # 预先生成同一组合的几杯时 (services/omakase_pool.py)，让每杯各不相同
+    variant_line = f"这是今晚为这种心情准备的第 {variant} 杯，请换一个思路，别和常见的做法雷同。" if variant else ""
     prompt = f"""
     我是一个家庭调酒师，我有这些库存：{inventory_str}。
-    现在客人的心情是：{mood}。
+    {guest_line}现在客人的心情是：{mood}。
     现在的天气是：{weather}。
 
     请你扮演一位名叫 Kenji 的日式酒吧老板（类似于《深夜食堂》的老板）。
@@ -173,69 +218,108 @@ def get_omakase_suggestion(inventory_list, mood, weather):
         "ending": "一句简单的祝福"
     }}
     
-    请用温暖、治愈的语气撰写 comment 和 ending。
+    请用温暖、治愈的语气撰写 comment 和 ending。{variant_line}
     """
 
-    payload = {
-        "model": "qwen3-max",
-        "messages": [
-            {"role": "system", "content": "你是一位拥有20年经验的日式酒吧老板 Kenji。请只返回 JSON 格式的数据。"},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.9 # Higher creativity
-    }
+    messages = [
+        {"role": "system", "content": "你是一位拥有20年经验的日式酒吧老板 Kenji。请只返回 JSON 格式的数据。"},
+        {"role": "user", "content": prompt}
+    ]
+    return messages
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+def _parse_omakase(content, api_key=None):
+    # 'ending' is kept as its own field for display
+    result = _parse_json(content, 'omakase', api_key)
+    if result is None:
+        return {
+            "name": "解析失败",
+            "ingredients": "见描述",
+            "instructions": content,
+            "comment": "Kenji 似乎喝醉了..."
+        }
+    return result
+
+def get_omakase_suggestion(inventory_list, mood, weather, stale=None, guest=None, variant=None):
+    api_key = os.environ.get("DASHSCOPE_API_KEY")
+    if not api_key:
+        return copy.deepcopy(MOCK_OMAKASE)
 
     try:
-        resp = requests.post(
-            DASHSCOPE_URL,
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        content = data["choices"][0]["message"]["content"]
-        
-        # Parse JSON
-        try:
-            cleaned_content = _clean_json_string(content)
-            res_json = json.loads(cleaned_content)
-            # Combine ending into comment or separate? Let's keep them structured but maybe combine for display
-            # But the user wants structured fields for saving.
-            # We can put 'ending' into instructions or just keep it in JSON.
-            return res_json
-        except json.JSONDecodeError:
-            return {
-                "name": "解析失败",
-                "ingredients": "见描述",
-                "instructions": content,
-                "comment": "Kenji 似乎喝醉了..."
-            }
-            
-    except Exception as e:
-        return {"error": str(e)}
+        content = chat_completion(_omakase_messages(inventory_list, mood, weather, guest, variant), OMAKASE_TEMPERATURE, api_key,
+                                  budget=BUDGETS['omakase'])
+        return _parse_omakase(content, api_key)
+    except LLMError as e:
+        return _fallback(e, MOCK_OMAKASE, stale)
+
+def stream_omakase_suggestion(inventory_list, mood, weather, stale=None):
+    """Streaming get_omakase_suggestion, see _stream_json."""
+    return _stream_json(lambda: _omakase_messages(inventory_list, mood, weather), OMAKASE_TEMPERATURE,
+                        _parse_omakase, MOCK_OMAKASE, budget=BUDGETS['omakase'], stale=stale)
+
+# 多位客人一起点 Omakase：每位客人一次调用，在有界线程池里并发，总耗时接近最慢的那一次
+OMAKASE_BATCH_CONCURRENCY = int(os.environ.get('OMAKASE_BATCH_CONCURRENCY', '4'))
+OMAKASE_BATCH_MAX_GUESTS = int(os.environ.get('OMAKASE_BATCH_MAX_GUESTS', '12'))
+
+_batch_executor = None
+_batch_executor_pid = None
+_batch_lock = threading.Lock()
+
+def _get_batch_executor():
+    """Threads for batch Omakase calls, shared by all requests of a worker process."""
+    global _batch_executor, _batch_executor_pid
+    with _batch_lock:
+        if _batch_executor is None or _batch_executor_pid != os.getpid():
+            _batch_executor = ThreadPoolExecutor(max_workers=OMAKASE_BATCH_CONCURRENCY,
+                                                 thread_name_prefix='omakase-batch')
+            _batch_executor_pid = os.getpid()
+    return _batch_executor
+
+def stream_omakase_batch(inventory_list, guests, weather, prepared=None):
+    """Omakase for several guests ([{'name', 'mood'}]) at once.
+
+    Yields ('guest', {'index', 'name', 'mood', 'result'}) as each drink is ready (in completion order),
+    then ('done', {'results': [...]}) in guest order. The guest's name goes into the prompt, so guests
+    with the same mood still get their own drink. ``prepared(mood, weather)`` may return a
+    pre-generated drink (services/omakase_pool.py) to serve instead of calling the AI.
+    """
+    app = current_app._get_current_object() if has_app_context() else None
 
+    def one(guest):
+        # 带上应用上下文，相同请求合并 (single_flight) 才能跨 worker 生效
+        with app.app_context() if app else nullcontext():
+            result = prepared(guest['mood'], weather) if prepared else None
+            return result or get_omakase_suggestion(inventory_list, guest['mood'], weather, guest=guest['name'])
 
-def get_sommelier_recommendation(recipes_data, user_request):
-    """专业侍酒师风格的单一推荐"""
-    api_key = os.environ.get("DASHSCOPE_API_KEY")
-    
-    if not api_key:
-        return {
-            "recommendation": {
-                "name": "经典马天尼 (Classic Martini)",
-                "presentation": "今晚，我想为您推荐一款经典马天尼...",
-                "tasting_notes": "入口冰冷纯净，中段金酒的植物香气缓缓释放...",
-                "pairing_reason": "它的简约与优雅，正如您所追求的品质。",
-                "service_tip": "建议冰镇至-5°C，使用马天尼杯，一饮而尽。"
-            }
-        }
-    
+    executor = _get_batch_executor()
+    futures = {executor.submit(one, guest): index for index, guest in enumerate(guests)}
+    results = [None] * len(guests)
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": str(e)}
+            results[index] = result
+            yield ('guest', dict(guests[index], index=index, result=result))
+    finally:
+        # 客户端断开：还没开始的调用不再发出
+        for future in futures:
+            future.cancel()
+    yield ('done', {'results': results})
+
+
+MOCK_SOMMELIER = {
+    "name": "经典马天尼 (Classic Martini)",
+    "presentation": "今晚，我想为您推荐一款经典马天尼...",
+    "tasting_notes": "入口冰冷纯净，中段金酒的植物香气缓缓释放...",
+    "pairing_reason": "它的简约与优雅，正如您所追求的品质。",
+    "service_tip": "建议冰镇至-5°C，使用马天尼杯，一饮而尽。"
+}
+
+SOMMELIER_TEMPERATURE = 0.85
+
+def _sommelier_messages(recipes_data, user_request):
     # 构造配方列表文本
     recipes_text = "\n".join([
         f"- {r['name']}：{r['ingredients']}" 
@@ -280,46 +364,74 @@ def get_sommelier_recommendation(recipes_data, user_request):
 请只返回JSON，不要有其他内容。
 """
     
-    payload = {
-        "model": "qwen3-max",
-        "messages": [
-            {"role": "system", "content": "你是米其林三星餐厅的首席侍酒师 Alexandre，拥有15年侍酒经验。你的推荐总是精准且令人信服。"},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.85
+    messages = [
+        {"role": "system", "content": "你是米其林三星餐厅的首席侍酒师 Alexandre，拥有15年侍酒经验。你的推荐总是精准且令人信服。"},
+        {"role": "user", "content": prompt}
+    ]
+    return messages
+
+def _parse_sommelier(content, api_key=None):
+    result = _parse_json(content, 'sommelier', api_key)
+    if result is not None:
+        return {"recommendation": result}
+    return {
+        "recommendation": {
+            "name": "解析失败",
+            "presentation": content[:200],
+            "tasting_notes": "抱歉，侍酒师的笔记有些潦草...",
+            "pairing_reason": "但我相信这会是个不错的选择。",
+            "service_tip": ""
+        }
     }
+
+def get_sommelier_recommendation(recipes_data, user_request):
+    """专业侍酒师风格的单一推荐"""
+    api_key = os.environ.get("DASHSCOPE_API_KEY")
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    if not api_key:
+        return {"recommendation": copy.deepcopy(MOCK_SOMMELIER)}
     
     try:
-        resp = requests.post(
-            DASHSCOPE_URL,
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        content = data["choices"][0]["message"]["content"]
-        
-        # Parse JSON
-        try:
-            cleaned_content = _clean_json_string(content)
-            result = json.loads(cleaned_content)
-            return {"recommendation": result}
-        except json.JSONDecodeError:
-            return {
-                "recommendation": {
-                    "name": "解析失败",
-                    "presentation": content[:200],
-                    "tasting_notes": "抱歉，侍酒师的笔记有些潦草...",
-                    "pairing_reason": "但我相信这会是个不错的选择。",
-                    "service_tip": ""
-                }
-            }
-    except Exception as e:
-        return {"error": str(e)}
+        content = chat_completion(_sommelier_messages(recipes_data, user_request), SOMMELIER_TEMPERATURE, api_key,
+                                  budget=BUDGETS['sommelier'])
+        return _parse_sommelier(content, api_key)
+    except LLMError as e:
+        return _fallback(e, MOCK_SOMMELIER, wrap=_wrap_sommelier)
+
+def _wrap_sommelier(recommendation):
+    return {"recommendation": recommendation}
+
+def stream_sommelier_recommendation(recipes_data, user_request):
+    """Streaming get_sommelier_recommendation; fields are those of the inner recommendation."""
+    return _stream_json(lambda: _sommelier_messages(recipes_data, user_request), SOMMELIER_TEMPERATURE,
+                        _parse_sommelier, MOCK_SOMMELIER, wrap_mock=_wrap_sommelier, budget=BUDGETS['sommelier'])
+
 
+def _stream_json(build_messages, temperature, parse, mock, wrap_mock=lambda r: r, budget=None, stale=None):
+    """Stream a JSON answer: yields ('token', text) for every delta, ('field', name, value) as soon as
+    a top-level field is complete, and finally ('done', result) with the same result as the
+    non-streaming function (a fallback or {"error": ...} dict if the call failed)."""
+    api_key = os.environ.get("DASHSCOPE_API_KEY")
+    if not api_key:
+        for name, value in mock.items():
+            yield ('field', name, copy.deepcopy(value))
+        yield ('done', wrap_mock(copy.deepcopy(mock)))
+        return
+
+    extractor = JsonFieldExtractor()
+    parts = []
+    try:
+        for delta in stream_chat_completion(build_messages(), temperature, api_key, budget=budget):
+            parts.append(delta)
+            yield ('token', delta)
+            for name, value in extractor.feed(delta):
+                yield ('field', name, value)
+    except LLMError as e:
+        result = _fallback(e, mock, stale, wrap_mock)
+        if 'error' not in result and not extractor.fields:
+            for name, value in result.get('recommendation', result).items():
+                if name in mock:
+                    yield ('field', name, value)
+        yield ('done', result)
+        return
+    yield ('done', parse(''.join(parts), api_key))
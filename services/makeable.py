@@ -0,0 +1,224 @@
+"""“现在能调什么”：配料倒排索引
+
+以前想知道库存能做哪些酒只能把整份库存丢给 AI。这里在进程内维护：
+- 倒排索引：归一化配料名 -> 使用它的配方 id 集合（来自 RecipeIngredient）；
+- 每个配方的配料集合，以及当前库存下每种配料是否“有货”。
+
+查询时只需遍历有货配料的倒排列表给配方计数，配料数减去命中数就是还缺几样，毫秒级返回
+“全部能做”和“只差一样”的配方，以及补哪样配料能解锁最多配方。
+
+有货的判断：库存名与配料名互相包含即算（“孟买蓝宝石金酒”可用于“金酒”，有“柠檬”就能做“柠檬汁”），
+烈酒类库存还按分类补充常见叫法（Gin -> 金酒/琴酒），冰和水视为常备。
+
+索引随数据增量更新：ORM flush 时记下改动的配方和库存，提交后只重读这些配方（库存变化时重算有货状态）。
+版本号 (services/versioning.py) 用来发现其它 worker 或批量导入的写入，此时下次查询整体重建。
+"""
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from sqlalchemy import event, select
+
+from models import db, Recipe, RecipeIngredient, InventoryItem, DataVersion
+from services import versioning
+
+SCOPES = ('recipe', 'inventory')
+
+STAPLES = {'冰', '冰块', '碎冰', '水', '热水', '冰水', 'ice', 'water'}
+
+CATEGORY_ALIASES = {
+    'gin': ('金酒', '琴酒', '杜松子酒', 'gin'),
+    'vodka': ('伏特加', 'vodka'),
+    'rum': ('朗姆', '朗姆酒', 'rum'),
+    'tequila': ('龙舌兰', 'tequila'),
+    'whisky': ('威士忌', 'whisky', 'whiskey'),
+    'brandy': ('白兰地', 'brandy'),
+}
+
+
+def normalize(name):
+    return ' '.join(unicodedata.normalize('NFKC', name or '').lower().split())
+
+
+def stock_keys(items):
+    """Normalized names (plus category aliases) an inventory provides. items: [(name, category)]."""
+    keys = set()
+    for name, category in items:
+        if normalize(name):
+            keys.add(normalize(name))
+        keys.update(CATEGORY_ALIASES.get(normalize(category), ()))
+    return keys
+
+
+def in_stock(ingredient, keys):
+    if ingredient in STAPLES or ingredient in keys:
+        return True
+    return any(len(key) >= 2 and (key in ingredient or ingredient in key) for key in keys)
+
+
+class MakeableIndex:
+    def __init__(self):
+        self.recipes = {}          # id -> {'name', 'recipe_type', 'ingredients': set}
+        self.by_ingredient = {}    # ingredient -> set(recipe ids)
+        self.keys = set()          # stock keys
+        self.available = set()     # ingredients currently in stock
+        self.versions = {}
+
+    def set_recipe(self, recipe_id, name, recipe_type, ingredient_names):
+        self.remove_recipe(recipe_id)
+        ingredients = {normalize(n) for n in ingredient_names if normalize(n)}
+        self.recipes[recipe_id] = {'name': name, 'recipe_type': recipe_type, 'ingredients': ingredients}
+        for ingredient in ingredients:
+            if ingredient not in self.by_ingredient:
+                self.by_ingredient[ingredient] = set()
+                if in_stock(ingredient, self.keys):
+                    self.available.add(ingredient)
+            self.by_ingredient[ingredient].add(recipe_id)
+
+    def remove_recipe(self, recipe_id):
+        recipe = self.recipes.pop(recipe_id, None)
+        if recipe is None:
+            return
+        for ingredient in recipe['ingredients']:
+            users = self.by_ingredient.get(ingredient)
+            if users is not None:
+                users.discard(recipe_id)
+                if not users:
+                    del self.by_ingredient[ingredient]
+                    self.available.discard(ingredient)
+
+    def set_inventory(self, items):
+        self.keys = stock_keys(items)
+        self.available = {i for i in self.by_ingredient if in_stock(i, self.keys)}
+
+    def query(self, limit=50):
+        have = Counter()
+        for ingredient in self.available:
+            for recipe_id in self.by_ingredient[ingredient]:
+                have[recipe_id] += 1
+
+        makeable, missing_one = [], []
+        unlocks = Counter()
+        for recipe_id, recipe in self.recipes.items():
+            total = len(recipe['ingredients'])
+            if not total:
+                continue
+            missing = total - have[recipe_id]
+            if missing == 0:
+                makeable.append(self._entry(recipe_id, recipe))
+            elif missing == 1:
+                needed = next(iter(recipe['ingredients'] - self.available))
+                missing_one.append(dict(self._entry(recipe_id, recipe), missing=needed))
+                unlocks[needed] += 1
+
+        makeable.sort(key=lambda r: r['name'])
+        missing_one.sort(key=lambda r: (-unlocks[r['missing']], r['name']))
+        return {
+            'makeable': makeable[:limit],
+            'makeable_count': len(makeable),
+            'missing_one': missing_one[:limit],
+            'missing_one_count': len(missing_one),
+            'unlocks': [{'ingredient': name, 'recipes': count} for name, count in unlocks.most_common(5)],
+            'recipe_count': len(self.recipes),
+        }
+
+    @staticmethod
+    def _entry(recipe_id, recipe):
+        return {'id': recipe_id, 'name': recipe['name'], 'recipe_type': recipe['recipe_type']}
+
+
+def _recipe_rows(conn, recipe_ids=None):
+    recipes = select(Recipe.id, Recipe.name, Recipe.recipe_type)
+    ingredients = select(RecipeIngredient.recipe_id, RecipeIngredient.name)
+    if recipe_ids is not None:
+        recipes = recipes.where(Recipe.id.in_(recipe_ids))
+        ingredients = ingredients.where(RecipeIngredient.recipe_id.in_(recipe_ids))
+    names = {}
+    for recipe_id, name in conn.execute(ingredients):
+        names.setdefault(recipe_id, []).append(name)
+    return [(rid, name, rtype, names.get(rid, [])) for rid, name, rtype in conn.execute(recipes)]
+
+
+def _inventory_rows(conn):
+    return conn.execute(select(InventoryItem.name, InventoryItem.category)).all()
+
+
+def build(conn):
+    index = MakeableIndex()
+    index.set_inventory(_inventory_rows(conn))
+    for row in _recipe_rows(conn):
+        index.set_recipe(*row)
+    return index
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _current_versions(conn):
+    found = dict(conn.execute(select(DataVersion.scope, DataVersion.version).where(DataVersion.scope.in_(SCOPES))).all())
+    return {scope: found.get(scope, 0) for scope in SCOPES}
+
+
+def what_can_i_make(limit=50):
+    """Makeable / missing-one recipes for the current inventory; rebuilds the index if another worker wrote."""
+    global _index
+    start = time.perf_counter()
+    with db.engine.connect() as conn, _lock:
+        versions = _current_versions(conn)
+        if _index is None or _index.versions != versions:
+            _index = build(conn)
+            _index.versions = versions
+        result = _index.query(limit)
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+def _apply(recipe_ids, inventory_changed, bumps):
+    """Apply this process's own committed changes, or drop the index if it had fallen behind."""
+    global _index
+    with _lock:
+        if _index is None:
+            return
+        # 事务开始前的版本 (first - 1) 必须和索引一致，否则中间还有别人的写入
+        if bumps is None or any(scope in bumps and bumps[scope][0] - 1 != _index.versions.get(scope)
+                                for scope in SCOPES):
+            _index = None
+            return
+        with db.engine.connect() as conn:
+            if inventory_changed:
+                _index.set_inventory(_inventory_rows(conn))
+            if recipe_ids:
+                rows = _recipe_rows(conn, recipe_ids)
+                for recipe_id in recipe_ids - {row[0] for row in rows}:
+                    _index.remove_recipe(recipe_id)
+                for row in rows:
+                    _index.set_recipe(*row)
+        for scope in SCOPES:
+            if scope in bumps:
+                _index.versions[scope] = bumps[scope][1]
+
+
+def install(session_factory):
+    """Track recipe/inventory changes per session and update the index after commit."""
+    @event.listens_for(session_factory, 'after_flush')
+    def _after_flush(session, flush_context):
+        changes = session.info.setdefault('makeable_changes', {'recipes': set(), 'inventory': False})
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, Recipe) and obj.id is not None:
+                changes['recipes'].add(obj.id)
+            elif isinstance(obj, RecipeIngredient) and obj.recipe_id is not None:
+                changes['recipes'].add(obj.recipe_id)
+            elif isinstance(obj, InventoryItem):
+                changes['inventory'] = True
+
+    @event.listens_for(session_factory, 'after_commit')
+    def _after_commit(session):
+        changes = session.info.pop('makeable_changes', None)
+        if changes and (changes['recipes'] or changes['inventory']):
+            _apply(changes['recipes'], changes['inventory'], versioning.transaction_bumps(session))
+
+    @event.listens_for(session_factory, 'after_rollback')
+    def _after_rollback(session):
+        session.info.pop('makeable_changes', None)
@@ -0,0 +1,168 @@
+"""运行指标 (Prometheus 文本格式)
+
+请求路径上只更新进程内的计数器和直方图（一次加锁的字典操作），每个 worker 每隔 METRICS_FLUSH_SECONDS
+秒把自己的累计值写入 metric_sample 表（每个 worker 一组行，值为该 worker 的累计值）。
+/metrics 先写入本进程的最新值，再按序列求和，多个 gunicorn worker 的数据因此能正确合并；
+worker 重启后换一个 id，旧行保留，计数器保持单调递增。
+
+另外在抓取时直接从数据库读取已经跨 worker 共享的数据：AI 缓存命中计数、后台任务队列状态。
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, MetricSample
+
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '5'))
+RETENTION_SECONDS = 7 * 24 * 3600
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+HELP = {
+    'clam_http_request_duration_seconds': ('histogram', 'Time to produce the response headers, per route.'),
+    'clam_llm_request_duration_seconds': ('histogram', 'Upstream AI call duration (leader calls only).'),
+    'clam_llm_first_token_seconds': ('histogram', 'Time to the first streamed token.'),
+    'clam_llm_requests_total': ('counter', 'Upstream AI calls by mode and outcome.'),
+    'clam_llm_prompt_tokens_total': ('counter', 'Prompt tokens reported in the usage field.'),
+    'clam_llm_completion_tokens_total': ('counter', 'Completion tokens reported in the usage field.'),
+    'clam_llm_parse_total': ('counter', 'AI answers parsed as JSON, by endpoint and outcome (ok/repaired/llm_repaired/failed).'),
+    'clam_llm_fallback_total': ('counter', 'Answers served from a fallback (cache/mock) because the AI failed.'),
+    'clam_ai_cache_requests_total': ('counter', 'AI response cache lookups, all workers.'),
+    'clam_event_summary_requests_total': ('counter', 'Event summary requests by cache state.'),
+    'clam_omakase_pool_total': ('counter', 'Preset Omakase requests served from the pre-generated pool (hit) or not (miss).'),
+    'clam_omakase_pool_generated_total': ('counter', 'Drinks added to the pre-generated Omakase pool.'),
+    'clam_ai_jobs': ('gauge', 'AI jobs currently in the queue table, by status.'),
+}
+
+_worker_id = None
+_worker_pid = None
+_lock = threading.Lock()
+_series = {}       # (name, labels) -> value；labels 为排好序的 (key, value) 元组
+_dirty = set()
+_last_flush = 0.0
+
+
+def _worker():
+    global _worker_id, _worker_pid, _series, _dirty
+    if _worker_pid != os.getpid():
+        # fork 之后重新开始计数，避免把父进程的数值算两遍
+        _worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        _worker_pid = os.getpid()
+        _series, _dirty = {}, set()
+    return _worker_id
+
+
+def _add(name, labels, value):
+    key = (name, labels)
+    _series[key] = _series.get(key, 0) + value
+    _dirty.add(key)
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter."""
+    with _lock:
+        _worker()
+        _add(name, tuple(sorted(labels.items())), value)
+
+
+def observe(name, value, buckets=HTTP_BUCKETS, **labels):
+    """Record a histogram observation (cumulative buckets, as in the exposition format)."""
+    labels = tuple(sorted(labels.items()))
+    with _lock:
+        _worker()
+        for bound in buckets:
+            if value <= bound:
+                _add(name + '_bucket', labels + (('le', f'{bound:g}'),), 1)
+        _add(name + '_bucket', labels + (('le', '+Inf'),), 1)
+        _add(name + '_sum', labels, value)
+        _add(name + '_count', labels, 1)
+
+
+def flush(force=False):
+    """Write this worker's changed series to the shared table (at most every METRICS_FLUSH_SECONDS)."""
+    global _last_flush, _dirty
+    now = time.time()
+    with _lock:
+        if not _dirty or (not force and now - _last_flush < METRICS_FLUSH_SECONDS):
+            return
+        worker = _worker()
+        rows = [{'worker': worker, 'name': name, 'labels': _format_labels(labels), 'value': _series[(name, labels)],
+                 'updated_at': now} for name, labels in _dirty]
+        _dirty = set()
+        _last_flush = now
+    stmt = insert(MetricSample)
+    with db.engine.begin() as conn:
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=['worker', 'name', 'labels'],
+            set_={'value': stmt.excluded.value, 'updated_at': stmt.excluded.updated_at},
+        ), rows)
+        conn.execute(delete(MetricSample).where(MetricSample.updated_at < now - RETENTION_SECONDS))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _family(series_name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if series_name.endswith(suffix) and series_name[:-len(suffix)] in HELP:
+            return series_name[:-len(suffix)]
+    return series_name
+
+
+def _shared_series():
+    """Series read straight from tables that are already shared across workers."""
+    from services import ai_cache, jobs
+    lines = []
+    for kind, row in sorted(ai_cache.stats().items()):
+        lines.append(('clam_ai_cache_requests_total', _format_labels((('kind', kind), ('result', 'hit'))), row['hits']))
+        lines.append(('clam_ai_cache_requests_total', _format_labels((('kind', kind), ('result', 'miss'))), row['misses']))
+    stats = jobs.queue_stats()
+    for status in ('queued', 'running', 'done', 'failed', 'cancelled'):
+        lines.append(('clam_ai_jobs', _format_labels((('status', status),)), stats[status]))
+    return lines
+
+
+def render():
+    """All workers' metrics in the Prometheus text exposition format."""
+    flush(force=True)
+    with db.engine.connect() as conn:
+        rows = conn.execute(
+            select(MetricSample.name, MetricSample.labels, func.sum(MetricSample.value))
+            .group_by(MetricSample.name, MetricSample.labels)
+            .order_by(MetricSample.name, MetricSample.labels)
+        ).all()
+    families = {}
+    for name, labels, value in list(rows) + _shared_series():
+        families.setdefault(_family(name), []).append((name, labels, value))
+    out = []
+    for family in sorted(families):
+        kind, text = HELP.get(family, ('untyped', ''))
+        out.append(f'# HELP {family} {text}')
+        out.append(f'# TYPE {family} {kind}')
+        for name, labels, value in _sorted_series(families[family]):
+            out.append(f'{name}{labels} {value:g}')
+    return '\n'.join(out) + '\n'
+
+
+def _sorted_series(series):
+    """Keep histogram buckets in ascending 'le' order, which Prometheus expects."""
+    def bucket_key(item):
+        name, labels, _ = item
+        if name.endswith('_bucket') and 'le="' in labels:
+            le = labels.rsplit('le="', 1)[1].split('"', 1)[0]
+            return (name, labels.rsplit('le="', 1)[0], float('inf') if le == '+Inf' else float(le))
+        return (name, labels, 0.0)
+    return sorted(series, key=bucket_key)
@@ -0,0 +1,172 @@
+"""版本化数据库迁移
+
+当前 schema 版本记录在 SQLite 的 `PRAGMA user_version` 中。`flask db-upgrade` 用 upgrade()
+按顺序执行尚未执行的迁移；应用启动时用 prepare()：建表 (create_all)、迁移和汇总表补算在同一个
+BEGIN IMMEDIATE 事务里完成。多个 gunicorn worker 同时启动时只有拿到写锁的那个真正执行，
+其余的最多等待 STARTUP_LOCK_TIMEOUT_MS，拿到锁后发现已经没有要做的事。
+（以前 create_all 和补算在写锁之外，新数据库上 `gunicorn -w 4` 会偶尔 "database is locked" 启动失败。）
+
+新增迁移：在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，版本号必须递增，函数应当幂等。
+"""
+import re
+from datetime import datetime
+
+from services.barday import bar_day_for
+from services.database import immediate
+
+STARTUP_LOCK_TIMEOUT_MS = 120000  # 等其它 worker 完成启动准备的最长时间
+
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def _add_column(cursor, table, column, ddl):
+    if column not in _columns(cursor, table):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _create_index(cursor, name, table, columns):
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+# 1-3: 原 migrate_db.py / migrate_feature.py / migrate_recipe_type.py
+def _consumption_event_id(cursor):
+    _add_column(cursor, 'consumption', 'event_id', 'INTEGER REFERENCES event(id)')
+
+
+def _consumption_recipe_id(cursor):
+    _add_column(cursor, 'consumption', 'recipe_id', 'INTEGER REFERENCES recipe(id)')
+
+
+def _recipe_type(cursor):
+    _add_column(cursor, 'recipe', 'recipe_type', "VARCHAR(20) DEFAULT '经典'")
+
+
+def _hot_path_indexes(cursor):
+    _create_index(cursor, 'ix_consumption_timestamp', 'consumption', 'timestamp')
+    _create_index(cursor, 'ix_consumption_event_id', 'consumption', 'event_id')
+    _create_index(cursor, 'ix_consumption_participant_id', 'consumption', 'participant_id')
+    _create_index(cursor, 'ix_recipe_ingredient_recipe_id', 'recipe_ingredient', 'recipe_id')
+    _create_index(cursor, 'ix_recipe_name', 'recipe', 'name')
+
+
+def _consumption_bar_day(cursor):
+    _add_column(cursor, 'consumption', 'bar_day', 'DATE')
+    _create_index(cursor, 'ix_consumption_bar_day', 'consumption', 'bar_day')
+    cursor.execute("SELECT id, timestamp FROM consumption WHERE bar_day IS NULL AND timestamp IS NOT NULL")
+    updates = [
+        (bar_day_for(datetime.fromisoformat(ts)).isoformat(), cid)
+        for cid, ts in cursor.fetchall()
+    ]
+    cursor.executemany("UPDATE consumption SET bar_day = ? WHERE id = ?", updates)
+
+
+MIGRATIONS = [
+    (1, 'consumption.event_id', _consumption_event_id),
+    (2, 'consumption.recipe_id', _consumption_recipe_id),
+    (3, 'recipe.recipe_type', _recipe_type),
+    (4, 'hot-path indexes', _hot_path_indexes),
+    (5, 'consumption.bar_day', _consumption_bar_day),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def _migrate(cursor, log):
+    """Apply pending migrations on ``cursor``, which must already hold the write lock."""
+    applied = []
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        log(f"Applying migration {target}: {description}")
+        migrate(cursor)
+        cursor.execute(f"PRAGMA user_version = {target}")
+        applied.append(target)
+    return applied
+
+
+def upgrade(engine, log=print):
+    """Apply pending migrations (`flask db-upgrade`). Returns the applied versions."""
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("PRAGMA user_version")
+        if cursor.fetchone()[0] >= LATEST_VERSION:
+            return []
+
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock: another worker may have just migrated
+            applied = _migrate(cursor, log)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        raw.close()
+    return applied
+
+
+def prepare(db, backfill=None, log=print):
+    """Startup: create missing tables, apply migrations and run ``backfill()`` in one BEGIN IMMEDIATE transaction.
+
+    ``backfill`` uses db.session, which is bound to the locked connection for the duration.
+    Safe for several workers starting at once. Returns the applied migration versions.
+    """
+    with immediate(db.engine).connect() as conn:
+        sqlite = conn.connection.driver_connection
+        busy_timeout = sqlite.execute("PRAGMA busy_timeout").fetchone()[0]
+        sqlite.execute(f"PRAGMA busy_timeout = {STARTUP_LOCK_TIMEOUT_MS}")
+        try:
+            with conn.begin():
+                db.metadata.create_all(conn)
+                applied = _migrate(conn.connection.cursor(), log)
+                if backfill is not None:
+                    db.session.remove()
+                    db.session(bind=conn)  # session 加入这个事务，它的 commit() 不会提前释放写锁
+                    try:
+                        backfill()
+                    finally:
+                        db.session.remove()
+        finally:
+            sqlite.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+    return applied
+
+
+# 热点查询及其期望使用的索引，供 `flask db-check-indexes` 用 EXPLAIN QUERY PLAN 校验
+HOT_QUERIES = [
+    ("SELECT id FROM recipe WHERE name = ? LIMIT 1", ('Mojito',), 'ix_recipe_name'),
+    ("SELECT participant_id, id, drink_name FROM consumption WHERE timestamp >= ? AND timestamp < ?",
+     ('2026-01-01 04:00:00', '2026-01-02 04:00:00'), 'ix_consumption_timestamp'),
+    ("SELECT participant_id, id, drink_name FROM consumption WHERE bar_day = ?",
+     ('2026-01-01',), 'ix_consumption_bar_day'),
+    ("SELECT DISTINCT event_id FROM consumption WHERE event_id = ?", (1,), 'ix_consumption_event_id'),
+    ("SELECT id FROM consumption WHERE participant_id = ?", (1,), 'ix_consumption_participant_id'),
+    ("SELECT name, unit, amount FROM recipe_ingredient WHERE recipe_id = ?", (1,), 'ix_recipe_ingredient_recipe_id'),
+]
+
+
+def plan_uses_index(plan, index):
+    """True if the plan reads through ``index`` and never scans a table without an index."""
+    uses = re.search(rf'USING (?:COVERING )?INDEX {re.escape(index)}\b', plan)
+    bare_scan = any(step.startswith('SCAN ') and 'USING' not in step for step in plan.split(' | '))
+    return bool(uses) and not bare_scan
+
+
+def explain_hot_queries(engine):
+    """Return [(sql, expected_index, plan_detail, ok)] for every hot query."""
+    results = []
+    with engine.connect() as conn:
+        for sql, params, index in HOT_QUERIES:
+            plan = " | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params))
+            results.append((sql, index, plan, plan_uses_index(plan, index)))
+    return results
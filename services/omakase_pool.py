@@ -0,0 +1,200 @@
+"""预先生成的 Omakase
+
+大多数客人点 Omakase 时的心情和天气就那几种，却每次都要等 AI 现场想 10 秒以上。
+这里为常见组合（OMAKASE_POOL_MOODS × OMAKASE_POOL_WEATHERS）按当前库存各预先生成
+OMAKASE_POOL_VARIANTS 杯，存在 omakase_variant 表里，所有 gunicorn worker 共享：
+- take()：随机端出一杯还没用过的（原子 UPDATE ... RETURNING，两位客人不会拿到同一杯），
+  这个组合剩下的少于 OMAKASE_POOL_LOW_WATER 杯（或没命中）时才在后台补货；
+- 每条记录带生成时的库存指纹，库存变化后旧的立即不再使用，提交库存修改时自动排队重新预热；
+  预热进行中库存又变了（那次排队与正在运行的任务合并了），warm() 结束前发现指纹不同会按新库存再补一轮；
+- 补货 (refill) 作为低优先级的后台任务 'omakase_warmup' 运行，不占前台 AI 请求的位置；
+- 提示词里的序号取自 data_version 表中的一个计数器，只增不减，清理旧记录后也不会重复；
+- 只保存完整的 AI 配方，备选结果和解析失败的不进池子。
+
+没有配置 DASHSCOPE_API_KEY 或 OMAKASE_POOL_VARIANTS=0 时不预热，请求照常现场生成。
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from flask import current_app, has_app_context
+from sqlalchemy import select, update, delete, func, or_, event
+
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, OmakaseVariant, DataVersion
+from services import ai_cache, jobs, metrics, versioning
+from services.llm_service import (get_omakase_suggestion, is_complete_recipe, llm_enabled,
+                                  OMAKASE_BATCH_CONCURRENCY)
+
+logger = logging.getLogger(__name__)
+
+
+def _list_setting(name, default):
+    return tuple(v.strip() for v in os.environ.get(name, default).split(',') if v.strip())
+
+
+OMAKASE_POOL_MOODS = _list_setting('OMAKASE_POOL_MOODS', '平静,开心,疲惫')
+OMAKASE_POOL_WEATHERS = _list_setting('OMAKASE_POOL_WEATHERS', '晴朗,下雨,寒冷')
+OMAKASE_POOL_VARIANTS = int(os.environ.get('OMAKASE_POOL_VARIANTS', '3'))
+OMAKASE_POOL_LOW_WATER = int(os.environ.get('OMAKASE_POOL_LOW_WATER', str((OMAKASE_POOL_VARIANTS + 1) // 2)))
+VARIANT_COUNTER = 'omakase_variant_seq'  # data_version 中的计数器，不参与 ETag
+WARMUP_JOB = 'omakase_warmup'
+WARMUP_PRIORITY = -10  # 排在所有前台 AI 任务之后
+
+
+def enabled():
+    return OMAKASE_POOL_VARIANTS > 0 and llm_enabled()
+
+
+def combos():
+    return [(mood, weather) for mood in OMAKASE_POOL_MOODS for weather in OMAKASE_POOL_WEATHERS]
+
+
+def _is_preset(mood, weather):
+    return mood in OMAKASE_POOL_MOODS and weather in OMAKASE_POOL_WEATHERS
+
+
+def take(inventory_list, mood, weather):
+    """An unused pre-generated drink for this mood/weather and inventory (marked as served), or None."""
+    if not enabled() or not _is_preset(mood, weather):
+        return None
+    fingerprint = ai_cache.inventory_fingerprint(inventory_list)
+    pick = (select(OmakaseVariant.id)
+            .where(OmakaseVariant.mood == mood, OmakaseVariant.weather == weather,
+                   OmakaseVariant.inventory_hash == fingerprint, OmakaseVariant.served_at.is_(None))
+            .order_by(func.random()).limit(1).scalar_subquery())
+    unused = (select(func.count()).select_from(OmakaseVariant)
+              .where(OmakaseVariant.mood == mood, OmakaseVariant.weather == weather,
+                     OmakaseVariant.inventory_hash == fingerprint, OmakaseVariant.served_at.is_(None)))
+    with db.engine.begin() as conn:
+        result = conn.execute(
+            update(OmakaseVariant)
+            .where(OmakaseVariant.id == pick, OmakaseVariant.served_at.is_(None))
+            .values(served_at=time.time())
+            .returning(OmakaseVariant.result)
+        ).scalar()
+        left = conn.execute(unused).scalar()
+    metrics.inc('clam_omakase_pool_total', outcome='hit' if result else 'miss')
+    # 快见底（或没命中：池子空了、库存刚变）时才补货，不是每端出一杯就排一次任务
+    if left < max(1, OMAKASE_POOL_LOW_WATER):
+        schedule_refresh()
+    return json.loads(result) if result else None
+
+
+def status(inventory_list):
+    """Unused drinks per preset combination for the current inventory."""
+    fingerprint = ai_cache.inventory_fingerprint(inventory_list)
+    with db.engine.connect() as conn:
+        counts = dict(((mood, weather), n) for mood, weather, n in conn.execute(
+            select(OmakaseVariant.mood, OmakaseVariant.weather, func.count())
+            .where(OmakaseVariant.inventory_hash == fingerprint, OmakaseVariant.served_at.is_(None))
+            .group_by(OmakaseVariant.mood, OmakaseVariant.weather)
+        ))
+    return {
+        'enabled': enabled(),
+        'target': OMAKASE_POOL_VARIANTS,
+        'ready': sum(counts.values()),
+        'combos': [{'mood': mood, 'weather': weather, 'ready': counts.get((mood, weather), 0)}
+                   for mood, weather in combos()],
+    }
+
+
+def _prune(fingerprint):
+    """Drop drinks already served or made for another inventory."""
+    with db.engine.begin() as conn:
+        conn.execute(delete(OmakaseVariant).where(or_(
+            OmakaseVariant.inventory_hash != fingerprint, OmakaseVariant.served_at.is_not(None)
+        )))
+
+
+def _next_variants(n):
+    """Reserve ``n`` prompt variant numbers from a counter that pruning never resets."""
+    with db.engine.begin() as conn:
+        last = conn.execute(
+            insert(DataVersion).values(scope=VARIANT_COUNTER, version=n)
+            .on_conflict_do_update(index_elements=['scope'], set_={'version': DataVersion.version + n})
+            .returning(DataVersion.version)
+        ).scalar()
+    return range(last - n + 1, last + 1)
+
+
+def refill(inventory_list):
+    """Generate the missing drinks for every preset combination; returns how many were added.
+
+    Combinations run concurrently (OMAKASE_BATCH_CONCURRENCY threads); each gets a different
+    variant number in the prompt so the drinks differ and concurrent calls are not coalesced.
+    """
+    if not enabled() or not inventory_list:
+        return 0
+    fingerprint = ai_cache.inventory_fingerprint(inventory_list)
+    _prune(fingerprint)
+    ready = {(c['mood'], c['weather']): c['ready'] for c in status(inventory_list)['combos']}
+    missing = [(mood, weather) for mood, weather in combos()
+               for _ in range(OMAKASE_POOL_VARIANTS - ready[(mood, weather)])]
+    if not missing:
+        return 0
+    wanted = [(mood, weather, variant) for (mood, weather), variant in zip(missing, _next_variants(len(missing)))]
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def one(mood, weather, variant):
+        with app.app_context() if app else nullcontext():
+            result = get_omakase_suggestion(inventory_list, mood, weather, variant=variant)
+            if not is_complete_recipe(result):
+                return 0
+            with db.engine.begin() as conn:
+                conn.execute(OmakaseVariant.__table__.insert().values(
+                    mood=mood, weather=weather, inventory_hash=fingerprint,
+                    result=json.dumps(result, ensure_ascii=False), created_at=time.time(),
+                ))
+            return 1
+
+    with ThreadPoolExecutor(max_workers=OMAKASE_BATCH_CONCURRENCY, thread_name_prefix='omakase-pool') as executor:
+        added = sum(executor.map(lambda args: one(*args), wanted))
+    metrics.inc('clam_omakase_pool_generated_total', added)
+    return added
+
+
+def warm(load_inventory):
+    """Refill for the current inventory, again for as long as it changed while drinks were generated.
+
+    Returns (drinks added, inventory list the pool now matches). A commit that changes the inventory
+    while a warmup runs does not queue another one (it is merged into the running job), so the
+    running job has to notice the change itself.
+    """
+    inventory_list, added = load_inventory(), 0
+    while True:
+        added += refill(inventory_list)
+        latest = load_inventory()
+        if ai_cache.inventory_fingerprint(latest) == ai_cache.inventory_fingerprint(inventory_list):
+            return added, inventory_list
+        inventory_list = latest
+
+
+def schedule_refresh():
+    """Queue a background refill (at most one queued or running at a time); returns the job id or None."""
+    if not enabled():
+        return None
+    try:
+        return jobs.submit(WARMUP_JOB, {}, priority=WARMUP_PRIORITY, unique=True)
+    except (jobs.QueueFull, jobs.UnknownJobKind) as e:
+        logger.info("omakase pool refresh not queued: %r", e)
+        return None
+
+
+def _warmed():
+    with db.engine.connect() as conn:
+        return conn.execute(select(OmakaseVariant.id).limit(1)).first() is not None
+
+
+def install(session_factory):
+    """Re-warm the pool after a commit that changed the inventory (only once it has been warmed)."""
+    @event.listens_for(session_factory, 'after_commit')
+    def _after_commit(session):
+        bumps = versioning.transaction_bumps(session)
+        # None：批量导入等直接执行 SQL 的写入，不知道改了哪些表
+        if (bumps is None or 'inventory' in bumps) and enabled() and _warmed():
+            schedule_refresh()
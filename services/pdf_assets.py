@@ -0,0 +1,61 @@
+"""PDF 酒单用到的图片素材
+
+封面 logo (static/images/The Drunken Clam.png) 原图 3508×2480、3.7 MB，以前每次生成酒单都把原图交给
+c.drawImage()：重新解码整张 PNG、重新压缩，并把全分辨率像素嵌进每一份 PDF。
+这里用 Pillow 在每个进程里只处理一次：按封面上的实际尺寸和 PDF_LOGO_DPI（默认 200，印刷够用）
+缩小，保留透明通道，得到一个 ImageReader 并提前解出像素数据，之后所有酒单共用这一个对象；
+每份 PDF 只剩一次 zlib 压缩（ASCII85 编码由 app.py 关闭，见 rl_config.useA85）。
+
+原图不存在或无法读取时 logo() 返回 None，酒单照常生成，只是没有 logo。
+"""
+import logging
+import os
+import threading
+
+from PIL import Image
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+
+logger = logging.getLogger(__name__)
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'static', 'images', 'The Drunken Clam.png')
+PDF_LOGO_DPI = int(os.environ.get('PDF_LOGO_DPI', '200'))
+COVER_LOGO_SIZE = (120 * mm, 55 * 1.5 * mm)  # 封面上 logo 的区域（按比例放入）
+
+_lock = threading.Lock()
+_logo = None
+_logo_loaded = False
+
+
+def _prepare(path, box, dpi):
+    """The image scaled down to fit ``box`` (points) at ``dpi``, as an ImageReader with decoded pixels."""
+    with Image.open(path) as im:
+        im.load()
+        max_size = tuple(max(1, round(side / 72 * dpi)) for side in box)
+        image = im.convert('RGBA' if 'A' in im.getbands() or 'transparency' in im.info else 'RGB')
+    image.thumbnail(max_size, Image.LANCZOS)
+    if image.mode == 'RGBA' and image.getchannel('A').getextrema() == (255, 255):
+        image = image.convert('RGB')  # 完全不透明就不需要 SMask
+    reader = ImageReader(image)
+    reader.getRGBData()  # 提前解出像素，之后各线程只读
+    return reader
+
+
+def logo():
+    """The cover logo as a shared ImageReader, built on first use; None if the file is unusable."""
+    global _logo, _logo_loaded
+    with _lock:
+        if not _logo_loaded:
+            if os.path.exists(LOGO_PATH):
+                try:
+                    _logo = _prepare(LOGO_PATH, COVER_LOGO_SIZE, PDF_LOGO_DPI)
+                except Exception as e:
+                    logger.warning("Menu logo could not be prepared from %s: %s", LOGO_PATH, e)
+            _logo_loaded = True
+        return _logo
+
+
+def load():
+    """Build every asset now (at app startup) so the first menu request does not pay for it."""
+    return {'logo': logo() is not None}
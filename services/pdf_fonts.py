@@ -0,0 +1,92 @@
+"""PDF 酒单字体注册表
+
+以前 /generate_menu 和 /generate_menu_by_spirit 每次请求都 registerFont(TTFont(...))，
+每次都要重新解析好几 MB 的中文 TTF 文件；两处还各有一份相同的回退逻辑。
+这里每个进程只加载一次（应用启动时调用 load()，也可在第一次生成酒单时按需加载），
+reportlab 的字体表本身是进程级的，注册之后所有请求直接按名字使用。
+
+每种字体按顺序尝试候选文件，第一个能加载的生效：
+- KaiTi（正文，楷体）：PDF_CJK_FONT 指定的文件 → 项目 fonts/simkai.ttf → Windows 系统字体目录；
+- QWERTYpe（封面标题）：项目 fonts/QWERTYpe.ttf。
+都不可用时正文退回 Helvetica（中文会显示不出来），标题退回正文字体。
+`flask pdf-fonts` 查看各字体实际加载的文件。
+"""
+import logging
+import os
+import threading
+import time
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+logger = logging.getLogger(__name__)
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
+FALLBACK_FONT = 'Helvetica'
+
+
+def _candidates():
+    return {
+        'KaiTi': [
+            os.environ.get('PDF_CJK_FONT'),
+            os.path.join(FONT_DIR, 'simkai.ttf'),
+            os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts', 'simkai.ttf'),
+        ],
+        'QWERTYpe': [os.path.join(FONT_DIR, 'QWERTYpe.ttf')],
+    }
+
+
+_lock = threading.Lock()
+_status = None   # {name: {'path', 'seconds', 'error'}}
+
+
+def load(force=False):
+    """Register every available font once per process; returns the status (see status()).
+
+    ``force`` re-reads the files even if they are already registered (used by the benchmark to
+    reproduce the old per-request behaviour).
+    """
+    global _status
+    with _lock:
+        if _status is not None and not force:
+            return _status
+        status = {}
+        for name, paths in _candidates().items():
+            entry = {'path': None, 'seconds': None, 'error': None}
+            for path in filter(None, paths):
+                if not os.path.exists(path):
+                    continue
+                started = time.perf_counter()
+                try:
+                    pdfmetrics.registerFont(TTFont(name, path))
+                except Exception as e:
+                    entry['error'] = f"{path}: {e}"
+                    logger.warning("PDF font %s could not be loaded from %s: %s", name, path, e)
+                    continue
+                entry.update(path=path, seconds=time.perf_counter() - started, error=None)
+                break
+            else:
+                if entry['error'] is None and _status is None:
+                    logger.warning("PDF font %s not found (tried %s)", name, ', '.join(filter(None, paths)))
+            status[name] = entry
+        _status = status
+        return _status
+
+
+def status():
+    """{font name: {'path': file loaded or None, 'seconds': load time, 'error': last error}}."""
+    return load()
+
+
+def available(name):
+    return load().get(name, {}).get('path') is not None
+
+
+def body_font():
+    """Font name for menu text: KaiTi, or Helvetica when no CJK font is installed."""
+    return 'KaiTi' if available('KaiTi') else FALLBACK_FONT
+
+
+def title_font():
+    """Font name for the cover title: QWERTYpe, or the body font."""
+    return 'QWERTYpe' if available('QWERTYpe') else body_font()
@@ -0,0 +1,208 @@
+"""活动统计汇总表的增量维护与重建
+
+log_drink / delete_consumption 在同一事务里调用 record_consumption / retract_consumption，
+同时维护按活动和按营业日的汇总。统计页只读汇总表，读取量只与不同酒款/原料的数量有关，
+与活动持续多久无关。
+"""
+from collections import defaultdict
+
+from sqlalchemy import select, update, delete, func, bindparam
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Consumption, RecipeIngredient, EventDrinkRollup, EventIngredientRollup, DailyDrinkRollup
+from services.barday import bar_day_for
+
+
+def _recipe_ingredient_totals(recipe_id):
+    """(name, unit) -> (amount, rows) for one recipe."""
+    totals = defaultdict(lambda: [0.0, 0])
+    rows = db.session.execute(
+        select(RecipeIngredient.name, RecipeIngredient.unit, RecipeIngredient.amount)
+        .where(RecipeIngredient.recipe_id == recipe_id)
+    )
+    for name, unit, amount in rows:
+        entry = totals[(name, unit or '')]
+        entry[0] += amount or 0.0
+        entry[1] += 1
+    return totals
+
+
+def _bump_drink(model, scope, scope_value, consumption, sign):
+    """Add ``sign`` drinks to the (scope, participant, drink) row of a drink rollup table,
+    where ``scope`` is the leading key column shared with Consumption (event_id / bar_day)."""
+    scope_col = getattr(model, scope)
+    participant_id = int(consumption.participant_id)
+
+    if sign > 0:
+        stmt = insert(model).values(
+            **{scope: scope_value},
+            participant_id=participant_id,
+            drink_name=consumption.drink_name,
+            count=1,
+            first_consumption_id=consumption.id,
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[scope, 'participant_id', 'drink_name'],
+            set_={'count': model.count + 1},
+        ))
+        return
+
+    key = (scope_col == scope_value,
+           model.participant_id == participant_id,
+           model.drink_name == consumption.drink_name)
+    db.session.execute(update(model).where(*key).values(count=model.count - 1))
+    # Keep first-appearance order correct when the earliest drink is removed
+    consumption_scope = getattr(Consumption, scope)
+    next_first = (
+        select(func.min(Consumption.id))
+        .where(consumption_scope == scope_value,
+               Consumption.participant_id == participant_id,
+               Consumption.drink_name == consumption.drink_name,
+               Consumption.id != consumption.id)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(model)
+        .where(*key, model.first_consumption_id == consumption.id)
+        .values(first_consumption_id=next_first)
+    )
+    db.session.execute(delete(model).where(scope_col == scope_value, model.count <= 0))
+
+
+def _apply(consumption, sign):
+    if consumption.bar_day:
+        _bump_drink(DailyDrinkRollup, 'bar_day', consumption.bar_day, consumption, sign)
+
+    if not consumption.event_id:
+        return
+    event_id = int(consumption.event_id)
+    _bump_drink(EventDrinkRollup, 'event_id', event_id, consumption, sign)
+
+    if not consumption.recipe_id:
+        return
+
+    for (name, unit), (amount, uses) in _recipe_ingredient_totals(consumption.recipe_id).items():
+        stmt = insert(EventIngredientRollup).values(
+            event_id=event_id, name=name, unit=unit,
+            amount=sign * amount, uses=sign * uses,
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['event_id', 'name', 'unit'],
+            set_={
+                'amount': EventIngredientRollup.amount + sign * amount,
+                'uses': EventIngredientRollup.uses + sign * uses,
+            },
+        ))
+    if sign < 0:
+        db.session.execute(delete(EventIngredientRollup).where(
+            EventIngredientRollup.event_id == event_id,
+            EventIngredientRollup.uses <= 0,
+        ))
+
+
+def record_consumption(consumption):
+    """Add a freshly flushed Consumption to its event and bar-day rollups (caller commits)."""
+    _apply(consumption, 1)
+
+
+def retract_consumption(consumption):
+    """Remove a Consumption that is about to be deleted from its rollups (caller commits)."""
+    _apply(consumption, -1)
+
+
+def rebuild_ingredient_rollups(event_ids):
+    """Recompute ingredient usage for the given events, e.g. after a recipe was edited."""
+    event_ids = list(event_ids)
+    if not event_ids:
+        return
+    db.session.execute(delete(EventIngredientRollup).where(EventIngredientRollup.event_id.in_(event_ids)))
+    unit = func.coalesce(RecipeIngredient.unit, '')
+    db.session.execute(insert(EventIngredientRollup).from_select(
+        ['event_id', 'name', 'unit', 'amount', 'uses'],
+        select(Consumption.event_id, RecipeIngredient.name, unit,
+               func.sum(func.coalesce(RecipeIngredient.amount, 0.0)), func.count())
+        .join(RecipeIngredient, RecipeIngredient.recipe_id == Consumption.recipe_id)
+        .where(Consumption.event_id.in_(event_ids))
+        .group_by(Consumption.event_id, RecipeIngredient.name, unit)
+    ))
+
+
+def events_using_recipe(recipe_id):
+    return db.session.execute(
+        select(Consumption.event_id).distinct()
+        .where(Consumption.recipe_id == recipe_id, Consumption.event_id.isnot(None))
+    ).scalars().all()
+
+
+def rebuild_rollups(event_id=None):
+    """Recompute rollups from the consumption log, for one event or all of them (caller commits)."""
+    if event_id is None:
+        event_ids = db.session.execute(
+            select(Consumption.event_id).distinct().where(Consumption.event_id.isnot(None))
+        ).scalars().all()
+        db.session.execute(delete(EventDrinkRollup))
+        db.session.execute(delete(EventIngredientRollup))
+    else:
+        event_ids = [event_id]
+        db.session.execute(delete(EventDrinkRollup).where(EventDrinkRollup.event_id == event_id))
+
+    if event_ids:
+        db.session.execute(insert(EventDrinkRollup).from_select(
+            ['event_id', 'participant_id', 'drink_name', 'count', 'first_consumption_id'],
+            select(Consumption.event_id, Consumption.participant_id, Consumption.drink_name,
+                   func.count(), func.min(Consumption.id))
+            .where(Consumption.event_id.in_(event_ids))
+            .group_by(Consumption.event_id, Consumption.participant_id, Consumption.drink_name)
+        ))
+    rebuild_ingredient_rollups(event_ids)
+    return len(event_ids)
+
+
+def rebuild_daily_rollups():
+    """Recompute the per-bar-day rollups from the consumption log (caller commits)."""
+    db.session.execute(delete(DailyDrinkRollup))
+    db.session.execute(insert(DailyDrinkRollup).from_select(
+        ['bar_day', 'participant_id', 'drink_name', 'count', 'first_consumption_id'],
+        select(Consumption.bar_day, Consumption.participant_id, Consumption.drink_name,
+               func.count(), func.min(Consumption.id))
+        .where(Consumption.bar_day.isnot(None))
+        .group_by(Consumption.bar_day, Consumption.participant_id, Consumption.drink_name)
+    ))
+
+
+def recompute_bar_days(batch_size=1000):
+    """Re-derive consumption.bar_day from timestamps, e.g. after BAR_TIMEZONE changed (caller commits)."""
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Consumption.id, Consumption.timestamp)
+            .where(Consumption.id > last_id, Consumption.timestamp.isnot(None))
+            .order_by(Consumption.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(
+            update(Consumption.__table__).where(Consumption.__table__.c.id == bindparam('cid')),
+            [{'cid': cid, 'bar_day': bar_day_for(ts)} for cid, ts in rows],
+        )
+        last_id = rows[-1][0]
+    rebuild_daily_rollups()
+
+
+def ensure_rollups():
+    """Backfill rollups once for databases that predate the rollup tables."""
+    has_rollups = db.session.execute(select(EventDrinkRollup.event_id).limit(1)).first()
+    has_event_logs = db.session.execute(
+        select(Consumption.id).where(Consumption.event_id.isnot(None)).limit(1)
+    ).first()
+    if has_event_logs and not has_rollups:
+        rebuild_rollups()
+        db.session.commit()
+
+    has_daily = db.session.execute(select(DailyDrinkRollup.bar_day).limit(1)).first()
+    has_day_logs = db.session.execute(
+        select(Consumption.id).where(Consumption.bar_day.isnot(None)).limit(1)
+    ).first()
+    if has_day_logs and not has_daily:
+        rebuild_daily_rollups()
+        db.session.commit()
@@ -0,0 +1,252 @@
+"""相同 AI 请求合并 (single-flight)
+
+聚会时几个人常常在几秒内点同一个预设（同样的心情/天气点 Omakase、同一场活动的总结），
+每次点击都会各自发起一次十几秒的 DashScope 调用。这里按 sha256(url + model + messages + temperature)
+识别相同的请求，正在进行中的相同请求只调用一次上游，其余的等待并共享结果：
+- 同一 worker 进程内：后来者直接跟随先到者，流式请求逐段收到同样的内容；
+- 跨 gunicorn worker：通过 llm_flight 表的租约。抢到租约的一方请求上游，同时由后台线程每 1/3 个租期续约
+  （非流式调用在整个响应返回前没有任何片段，不能靠片段到达时续约），完成后写入结果；
+  其它 worker 轮询该行，拿到完整结果后一次性返回（跨进程不逐段转发）。
+  租约过期（持有者崩溃或放弃）时由等待者接手重新请求。
+
+先到者的调用方中途放弃（客户端断开、任务取消）时，如果本进程还有人在等，就转入后台线程把上游读完；
+没人等则关闭上游并释放租约。
+
+LLM_SINGLE_FLIGHT=0 关闭合并。没有 Flask 应用上下文时（例如压测脚本）只做进程内合并。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+
+from flask import current_app, has_app_context
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, LLMFlight
+
+logger = logging.getLogger(__name__)
+
+LLM_SINGLE_FLIGHT = os.environ.get('LLM_SINGLE_FLIGHT', '1') != '0'
+LEASE_SECONDS = float(os.environ.get('LLM_FLIGHT_LEASE_SECONDS', '15'))
+POLL_INTERVAL = 0.2
+RETENTION_SECONDS = 60  # 已完成的行保留多久，供还在轮询的等待者读取
+
+
+class FlightError(Exception):
+    """The shared upstream call failed; carries the leader's error message."""
+
+
+def make_key(url, model, messages, temperature):
+    payload = json.dumps([url, model, messages, temperature], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Flight:
+    """One in-process upstream call that other threads can follow chunk by chunk."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def follow(self):
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                new, finished, error = self.chunks[i:], self.done, self.error
+                i = len(self.chunks)
+            yield from new
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+_flights = {}
+_lock = threading.Lock()
+
+
+def stream(key, produce):
+    """Yield the chunks of ``produce()`` (an iterator of str), sharing one upstream call per key."""
+    if not LLM_SINGLE_FLIGHT:
+        yield from produce()
+        return
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+        else:
+            flight.followers += 1
+    if leader:
+        yield from _lead(key, flight, produce)
+        return
+    try:
+        yield from flight.follow()
+    finally:
+        with _lock:
+            flight.followers -= 1
+
+
+def call(key, fn):
+    """Non-streaming variant: ``fn()`` returns the whole text."""
+    return ''.join(stream(key, lambda: iter((fn(),))))
+
+
+def _lead(key, flight, produce):
+    upstream = _upstream(key, produce) if has_app_context() else produce()
+    try:
+        for chunk in upstream:
+            flight.publish(chunk)
+            yield chunk
+    except GeneratorExit:
+        _abandon(key, flight, upstream)
+        raise
+    except Exception as e:
+        _end(key, flight, e)
+        raise
+    else:
+        _end(key, flight)
+
+
+def _end(key, flight, error=None):
+    with _lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+    flight.finish(error)
+
+
+def _abandon(key, flight, upstream):
+    """The leader's caller went away: finish in the background if anyone in this process is waiting."""
+    with _lock:
+        detach = flight.followers > 0
+        if not detach and _flights.get(key) is flight:
+            del _flights[key]
+    if not detach:
+        upstream.close()
+        flight.finish(FlightError("请求已取消"))
+        return
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def drain():
+        with app.app_context() if app else nullcontext():
+            try:
+                for chunk in upstream:
+                    flight.publish(chunk)
+            except Exception as e:
+                _end(key, flight, e)
+            else:
+                _end(key, flight)
+
+    threading.Thread(target=drain, name='llm-flight-drain', daemon=True).start()
+
+
+# ---------- 跨 worker 租约 ----------
+
+def _acquire(key, token):
+    """Take the lease if it is free, expired or finished. Returns True for the new owner."""
+    now = time.time()
+    with db.engine.begin() as conn:
+        stmt = insert(LLMFlight).values(key=key, owner=token, expires_at=now + LEASE_SECONDS, done=False)
+        owner = conn.execute(stmt.on_conflict_do_update(
+            index_elements=['key'],
+            set_={'owner': token, 'expires_at': now + LEASE_SECONDS, 'done': False,
+                  'result': None, 'error': None, 'finished_at': None},
+            where=(LLMFlight.expires_at < now) | LLMFlight.done,
+        ).returning(LLMFlight.owner)).scalar()
+        conn.execute(delete(LLMFlight).where(LLMFlight.done, LLMFlight.finished_at < now - RETENTION_SECONDS))
+    return owner == token
+
+
+def _update_lease(key, token, **values):
+    with db.engine.begin() as conn:
+        conn.execute(update(LLMFlight).where(LLMFlight.key == key, LLMFlight.owner == token).values(**values))
+
+
+def _upstream(key, produce):
+    """Chunks for this process's flight: call upstream as lease owner, or wait for another worker's result."""
+    token = uuid.uuid4().hex
+    deadline = time.time() + float(os.environ.get('LLM_READ_TIMEOUT', '60')) * 2
+    while not _acquire(key, token):
+        # 另一个 worker 正在请求：等它写入结果，或者租约过期后接手
+        while True:
+            if time.time() > deadline:
+                raise FlightError("等待相同请求的结果超时")
+            time.sleep(POLL_INTERVAL)
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    select(LLMFlight.done, LLMFlight.result, LLMFlight.error, LLMFlight.expires_at)
+                    .where(LLMFlight.key == key)
+                ).first()
+            if row is None or (not row.done and row.expires_at < time.time()):
+                break
+            if row.done:
+                if row.error is not None:
+                    raise FlightError(row.error)
+                yield row.result
+                return
+    yield from _own(key, token, produce)
+
+
+def _keep_alive(key, token):
+    """Renew the lease from a background thread until the returned ``stop()`` is called."""
+    app = current_app._get_current_object()
+    stopped = threading.Event()
+
+    def renew():
+        with app.app_context():
+            while not stopped.wait(LEASE_SECONDS / 3):
+                try:
+                    _update_lease(key, token, expires_at=time.time() + LEASE_SECONDS)
+                except Exception:
+                    logger.warning("LLM flight lease renewal failed", exc_info=True)
+
+    thread = threading.Thread(target=renew, name='llm-flight-lease', daemon=True)
+    thread.start()
+
+    def stop():
+        stopped.set()
+        thread.join()  # 之后不会再有续约覆盖放弃租约时写入的 expires_at=0
+
+    return stop
+
+
+def _own(key, token, produce):
+    parts = []
+    completed = False
+    stop_renewing = _keep_alive(key, token)
+    try:
+        for chunk in produce():
+            parts.append(chunk)
+            yield chunk
+        completed = True
+        _update_lease(key, token, done=True, result=''.join(parts), finished_at=time.time())
+    except Exception as e:
+        completed = True
+        _update_lease(key, token, done=True, error=str(e), finished_at=time.time())
+        raise
+    finally:
+        stop_renewing()
+        if not completed:
+            # 调用方放弃：让出租约，等待者会接手
+            _update_lease(key, token, expires_at=0)
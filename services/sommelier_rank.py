@@ -0,0 +1,161 @@
+"""侍酒师推荐的本地预筛选
+
+原来 /sommelier_recommend 把整本配方（连同每条配料）都塞进提示词，配方越多提示词越长，
+延迟和费用线性增长，迟早超出上下文窗口。现在先在本地给每个配方打分，只把前 K 个候选交给 LLM：
+- 客人提到的配方名、配料名（“想喝金酒的”）；
+- 风味标签：从配方名、配料、做法文字里按 FLAVOR_TAGS 词表打标签，与需求里的标签比对（“酸一点”“清爽”）；
+- 关键词重叠：中文按二元组、英文按单词切分，按 IDF 加权，常见词（“加冰”）权重低；
+- recipe_type：需求里提到“经典”或“特调”时加分。
+
+打好标签的索引按进程缓存，配方的数据版本号 (services/versioning.py) 变化时重建。
+K 由 SOMMELIER_TOP_K 配置（默认 20，0 表示不筛选）；配方数不超过 K 时原样全部交给 LLM。
+"""
+import heapq
+import math
+import os
+import re
+import threading
+import unicodedata
+
+from sqlalchemy.orm import selectinload
+
+from models import Recipe
+from services import versioning
+
+SOMMELIER_TOP_K = int(os.environ.get('SOMMELIER_TOP_K', '20'))
+
+FLAVOR_TAGS = {
+    '酸': ('酸', '柠檬', '青柠', '西柚', 'lemon', 'lime', 'sour', 'grapefruit'),
+    '甜': ('甜', '糖浆', '蜂蜜', '利口', 'syrup', 'honey', 'liqueur', 'sweet'),
+    '苦': ('苦', '金巴利', '阿佩罗', 'campari', 'aperol', 'bitter', 'negroni'),
+    '清爽': ('清爽', '清新', '苏打', '汤力', '气泡', '薄荷', 'tonic', 'soda', 'mint', 'highball', 'fizz'),
+    '浓烈': ('烈', '浓郁', '威士忌', '白兰地', '干邑', 'whisky', 'whiskey', 'bourbon', 'brandy', 'cognac', 'old fashioned'),
+    '果味': ('果', '橙', '菠萝', '莓', '桃', '芒果', '西瓜', 'fruit', 'orange', 'pineapple', 'berry', 'peach'),
+    '奶香': ('奶', '椰', '咖啡', '巧克力', 'cream', 'milk', 'coconut', 'coffee', 'chocolate'),
+    '烟熏': ('烟熏', '泥煤', '艾雷', '梅斯卡尔', 'smoky', 'peat', 'islay', 'mezcal'),
+    '草本': ('草本', '杜松', '金酒', '罗勒', '迷迭香', '味美思', '苦艾', 'gin', 'herbal', 'basil', 'vermouth', 'absinthe'),
+    '热饮': ('热', '暖', 'hot', 'warm', 'toddy'),
+    '辛辣': ('辣', '姜', '肉桂', 'ginger', 'spicy', 'cinnamon'),
+    '热带': ('朗姆', '椰', '菠萝', 'rum', 'tiki', 'tropical'),
+}
+
+RECIPE_TYPE_WORDS = {
+    '经典': ('经典', 'classic'),
+    '特调': ('特调', '原创', '创意', 'signature'),
+}
+
+_CJK_RUN = re.compile(r'[一-鿿]+')
+_WORD = re.compile(r'[a-z0-9]{2,}')
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def terms(text):
+    """Keyword set: CJK character bigrams plus latin words."""
+    text = normalize(text)
+    result = set(_WORD.findall(text))
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            result.add(run)
+        result.update(run[i:i + 2] for i in range(len(run) - 1))
+    return result
+
+
+def flavor_tags(text):
+    text = normalize(text)
+    return {tag for tag, words in FLAVOR_TAGS.items() if any(word in text for word in words)}
+
+
+def build_index(recipes):
+    """recipes: [{'id', 'name', 'ingredients': [names], 'recipe_type', 'text', 'prompt_ingredients'}]."""
+    docs = []
+    df = {}
+    for recipe in recipes:
+        ingredient_names = {normalize(name).strip() for name in recipe['ingredients'] if name}
+        blob = ' '.join([recipe['name'], ' '.join(recipe['ingredients']), recipe.get('text') or ''])
+        doc_terms = terms(blob)
+        for term in doc_terms:
+            df[term] = df.get(term, 0) + 1
+        docs.append({
+            'id': recipe['id'],
+            'name': recipe['name'],
+            'key': normalize(recipe['name']).strip(),
+            'recipe_type': recipe.get('recipe_type') or '',
+            'prompt_ingredients': recipe['prompt_ingredients'],
+            'ingredients': ingredient_names,
+            'terms': doc_terms,
+            'tags': flavor_tags(blob),
+        })
+    n = len(docs)
+    idf = {term: math.log(1 + n / count) for term, count in df.items()}
+    return {'docs': docs, 'idf': idf}
+
+
+def score(doc, query, query_terms, query_tags, wanted_types, idf):
+    points = 0.0
+    if doc['key'] and doc['key'] in query:
+        points += 10
+    points += 3 * sum(1 for name in doc['ingredients'] if name and name in query)
+    points += 2 * len(query_tags & doc['tags'])
+    if doc['recipe_type'] in wanted_types:
+        points += 1
+    points += sum(idf.get(term, 0) for term in query_terms & doc['terms']) / 4
+    return points
+
+
+def top_k(index, user_request, k=None):
+    """The k best-matching docs for the request, best first (original order on ties)."""
+    k = SOMMELIER_TOP_K if k is None else k
+    docs = index['docs']
+    if k <= 0 or len(docs) <= k:
+        return list(docs)
+    query = normalize(user_request)
+    query_terms = terms(user_request)
+    query_tags = flavor_tags(user_request)
+    wanted_types = {t for t, words in RECIPE_TYPE_WORDS.items() if any(word in query for word in words)}
+    idf = index['idf']
+    scored = (
+        (score(doc, query, query_terms, query_tags, wanted_types, idf), -i, doc)
+        for i, doc in enumerate(docs)
+    )
+    return [doc for _, _, doc in heapq.nlargest(k, scored, key=lambda item: item[:2])]
+
+
+def to_prompt(docs):
+    """Docs in the shape llm_service expects: [{'name', 'ingredients', 'id'}]."""
+    return [{'name': d['name'], 'ingredients': d['prompt_ingredients'], 'id': d['id']} for d in docs]
+
+
+def _load_recipes():
+    recipes = []
+    for r in Recipe.query.options(selectinload(Recipe.ingredients_structured)).all():
+        recipes.append({
+            'id': r.id,
+            'name': r.name,
+            'ingredients': [ing.name for ing in r.ingredients_structured],
+            'prompt_ingredients': ", ".join(f"{ing.name} {ing.amount}{ing.unit}" for ing in r.ingredients_structured),
+            'recipe_type': r.recipe_type,
+            'text': ' '.join(filter(None, [r.ingredients, r.instructions])),
+        })
+    return recipes
+
+
+_cache = {'version': None, 'index': None}
+_cache_lock = threading.Lock()
+
+
+def get_index():
+    """Per-process index of the recipe book, rebuilt when the 'recipe' data version changes."""
+    version = versioning.get_versions(['recipe'])['recipe']
+    with _cache_lock:
+        if _cache['index'] is None or _cache['version'] != version:
+            _cache['index'] = build_index(_load_recipes())
+            _cache['version'] = version
+        return _cache['index']
+
+
+def candidates(user_request, k=None):
+    """Top-k recipes for the sommelier prompt."""
+    return to_prompt(top_k(get_index(), user_request, k))
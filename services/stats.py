@@ -0,0 +1,90 @@
+"""活动统计引擎
+
+统计页 (/event/<id>/stats) 与 AI 总结 (/event/<id>/get_summary) 共用同一套统计，
+数据来自按活动/营业日维护的汇总表 (services/rollups.py)，读取量只与不同酒款/原料的数量有关，
+与消费记录条数无关。
+"""
+from sqlalchemy import select
+
+from models import db, Participant, EventDrinkRollup, EventIngredientRollup, DailyDrinkRollup
+
+
+def _participant_drink_counts(model, scope_col, scope_value):
+    """(participant, drink) -> count from a drink rollup table, in order of first appearance."""
+    return db.session.execute(
+        select(Participant.name, model.drink_name, model.count)
+        .join(Participant, Participant.id == model.participant_id)
+        .where(scope_col == scope_value)
+        .order_by(model.first_consumption_id)
+    ).all()
+
+
+def _ingredient_usage(event_id):
+    rows = db.session.execute(
+        select(EventIngredientRollup.name, EventIngredientRollup.unit, EventIngredientRollup.amount)
+        .where(EventIngredientRollup.event_id == event_id)
+        .order_by(EventIngredientRollup.amount.desc())
+    )
+    # Key by ingredient name + unit to avoid mixing units (e.g. ml vs oz)
+    return [(f"{name} ({unit})", float(total)) for name, unit, total in rows]
+
+
+def _aggregate(rows):
+    stats = {
+        'total_drinks': 0,
+        'by_participant': {},
+        'drink_counts': {},
+    }
+
+    for p_name, drink_name, count in rows:
+        stats['total_drinks'] += count
+
+        entry = stats['by_participant'].setdefault(p_name, {'count': 0, 'drinks': []})
+        entry['count'] += count
+        entry['drinks'].extend([drink_name] * count)
+
+        stats['drink_counts'][drink_name] = stats['drink_counts'].get(drink_name, 0) + count
+
+    # MVP: first participant reaching the highest count
+    mvp = None
+    max_count = 0
+    for name, data in stats['by_participant'].items():
+        if data['count'] > max_count:
+            max_count = data['count']
+            mvp = name
+    stats['mvp'] = mvp
+    stats['mvp_count'] = max_count
+
+    stats['top_drinks'] = sorted(stats['drink_counts'].items(), key=lambda x: x[1], reverse=True)
+    return stats
+
+
+def compute_event_stats(event_id, include_ingredients=True):
+    """Aggregate an event's consumption log.
+
+    Returns a dict with ``total_drinks``, ``by_participant`` (name -> count/drinks),
+    ``drink_counts``, ``top_drinks``, ``mvp``/``mvp_count`` and, unless
+    ``include_ingredients`` is False, ``ingredient_usage`` sorted by amount.
+    """
+    stats = _aggregate(_participant_drink_counts(EventDrinkRollup, EventDrinkRollup.event_id, event_id))
+    if include_ingredients:
+        stats['ingredient_usage'] = _ingredient_usage(event_id)
+    return stats
+
+
+def compute_day_stats(bar_day):
+    """Same shape as compute_event_stats (without ingredients) for one bar day."""
+    return _aggregate(_participant_drink_counts(DailyDrinkRollup, DailyDrinkRollup.bar_day, bar_day))
+
+
+def format_stats_text(stats):
+    """Render stats as the plain-text block fed to the event summary prompt."""
+    stats_text = f"总共喝了 {stats['total_drinks']} 杯。\n"
+
+    if stats['mvp']:
+        stats_text += f"今日酒神 (MVP)：{stats['mvp']}，喝了 {stats['mvp_count']} 杯。\n"
+
+    stats_text += "大家喝了：\n"
+    for drink, count in stats['drink_counts'].items():
+        stats_text += f"- {drink}: {count} 杯\n"
+    return stats_text
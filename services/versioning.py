@@ -0,0 +1,172 @@
+"""数据版本号与 ETag
+
+data_version 表为每个作用域保存一个递增版本号：
+- 'global'：任何数据变化都会 +1
+- 表级：'participant' / 'inventory' / 'recipe' / 'event' / 'consumption' / 'bartender'
+- 活动级：'event:<id>'（活动本身、酒单或其饮酒记录变化）
+
+版本号在 ORM flush 时根据新增/修改/删除的对象自动递增，和业务数据处于同一事务，
+所有 gunicorn worker 共享。直接执行 SQL 批量写入的代码需要自行调用 bump()。
+
+读路由用 @conditional 声明依赖的作用域：根据版本号生成强 ETag，
+客户端带着匹配的 If-None-Match 请求时直接返回 304，不做任何业务查询和模板渲染。
+ETag 还包含应用构建标识 (build_id)：部署了新的模板、静态文件或代码后，浏览器不会继续用旧页面。
+"""
+import hashlib
+import os
+from functools import wraps
+
+from flask import request, make_response
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import (db, DataVersion, Participant, InventoryItem, Recipe, RecipeIngredient, Event,
+                    Consumption, Bartender)
+
+GLOBAL = 'global'
+
+_TABLE_SCOPES = {
+    Participant: 'participant',
+    InventoryItem: 'inventory',
+    Recipe: 'recipe',
+    RecipeIngredient: 'recipe',
+    Event: 'event',
+    Consumption: 'consumption',
+    Bartender: 'bartender',
+}
+
+
+def _scopes_for(obj):
+    scope = _TABLE_SCOPES.get(type(obj))
+    if scope is None:
+        return set()
+    scopes = {scope}
+    if isinstance(obj, Event) and obj.id is not None:
+        scopes.add(f'event:{obj.id}')
+    elif isinstance(obj, Consumption) and obj.event_id:
+        scopes.add(f'event:{int(obj.event_id)}')
+    return scopes
+
+
+def _bump_statement(scopes):
+    rows = [{'scope': s, 'version': 1} for s in sorted(set(scopes) | {GLOBAL})]
+    stmt = insert(DataVersion).values(rows)
+    return stmt.on_conflict_do_update(index_elements=['scope'], set_={'version': DataVersion.version + 1})
+
+
+def _execute_bump(session, connection, scopes):
+    """Run the bump and remember, per scope, the first and last version this transaction produced."""
+    rows = connection.execute(_bump_statement(scopes).returning(DataVersion.scope, DataVersion.version))
+    bumps = session.info.setdefault('version_bumps', {})
+    for scope, version in rows:
+        bumps[scope] = (bumps.get(scope, (version,))[0], version)
+
+
+def bump(*scopes):
+    """Increment the given scopes (and 'global') in the current transaction."""
+    _execute_bump(db.session, db.session, scopes)
+    db.session.info['version_bumps_raw'] = True
+
+
+def transaction_bumps(session):
+    """{scope: (first, last)} versions written by the session's current (or just committed) transaction,
+    or None if it also called bump() for raw SQL writes that ORM listeners never saw.
+
+    写事务持有 SQLite 的写锁直到提交，所以同一事务内的版本号是连续的：first - 1 就是事务开始前的版本。
+    进程内缓存可以据此判断自己是否错过了其它 worker 的写入（见 services/makeable.py）。
+    """
+    if session.info.get('version_bumps_raw'):
+        return None
+    return session.info.get('version_bumps', {})
+
+
+def install(session_factory):
+    """Bump versions automatically for every ORM flush that changes tracked models."""
+    @event.listens_for(session_factory, 'after_begin')
+    def _after_begin(session, transaction, connection):
+        session.info.pop('version_bumps', None)
+        session.info.pop('version_bumps_raw', None)
+
+    @event.listens_for(session_factory, 'after_flush')
+    def _after_flush(session, flush_context):
+        scopes = set()
+        for obj in session.new:
+            scopes |= _scopes_for(obj)
+        for obj in session.deleted:
+            scopes |= _scopes_for(obj)
+        for obj in session.dirty:
+            if session.is_modified(obj):
+                scopes |= _scopes_for(obj)
+        if scopes:
+            _execute_bump(session, session.connection(), scopes)
+
+
+def get_versions(scopes):
+    """{scope: version} for the given scopes; unknown scopes are 0."""
+    scopes = list(scopes)
+    rows = db.session.execute(
+        select(DataVersion.scope, DataVersion.version).where(DataVersion.scope.in_(scopes))
+    ).all()
+    found = dict(rows)
+    return {s: found.get(s, 0) for s in scopes}
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_BUILD_PATHS = ('app.py', 'models.py', 'services', 'templates', 'static')
+_build_id = None
+
+
+def _hash_build_files():
+    digest = hashlib.sha1()
+    for path in _BUILD_PATHS:
+        full = os.path.join(_ROOT, path)
+        files = [full] if os.path.isfile(full) else sorted(
+            os.path.join(dirpath, name)
+            for dirpath, dirnames, names in os.walk(full) if '__pycache__' not in dirpath
+            for name in names
+        )
+        for file in files:
+            stat = os.stat(file)
+            digest.update(f'{os.path.relpath(file, _ROOT)}:{stat.st_mtime_ns}:{stat.st_size}\n'.encode())
+    return digest.hexdigest()[:12]
+
+
+def build_id():
+    """APP_VERSION, or a hash of the code/template/static files' mtimes; computed once per process."""
+    global _build_id
+    if _build_id is None:
+        _build_id = os.environ.get('APP_VERSION') or _hash_build_files()
+    return _build_id
+
+
+def compute_etag(scopes, extra=''):
+    versions = get_versions(scopes)
+    key = build_id() + '|' + ';'.join(f'{s}={versions[s]}' for s in sorted(versions)) + '|' + extra
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def conditional(scopes_for):
+    """Answer with a strong ETag derived from data versions, and 304 when it still matches.
+
+    ``scopes_for(**view_args)`` returns a list of scopes, or (scopes, extra) where ``extra``
+    is any additional string the response depends on (e.g. the current bar day).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            spec = scopes_for(**kwargs)
+            scopes, extra = spec if isinstance(spec, tuple) else (spec, '')
+            etag = compute_etag(scopes, extra)
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                # 允许缓存，但每次都要带 If-None-Match 回来校验
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
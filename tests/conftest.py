@@ -0,0 +1,76 @@
+"""测试共用的应用与数据库
+
+app.py 在导入时就按环境变量配置数据库，所以先把 DATABASE_URL 指向临时目录里的新数据库，
+关掉登录和 AI（空的 DASHSCOPE_API_KEY 走模拟结果，也不会被 .env 覆盖），再导入应用。
+所有测试共用这一个数据库；需要固定数据的测试自己写入并在结束时清理。
+"""
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+_DB_DIR = tempfile.mkdtemp(prefix='clam-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ['APP_PASSWORD'] = ''
+os.environ['DASHSCOPE_API_KEY'] = ''
+os.environ['METRICS_FLUSH_SECONDS'] = '3600'  # 指标写库不要混进按请求统计的查询条数
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def db(app):
+    from models import db as sqlalchemy_db
+    return sqlalchemy_db
+
+
+@contextmanager
+def writing(app):
+    """An app context whose transactions take the write lock up front, like a @write_transaction route.
+
+    Requests made inside it would share its session, so seed data here and send requests outside.
+    """
+    from flask import g
+    from models import db as sqlalchemy_db
+    with app.app_context():
+        g.write_transaction = True
+        try:
+            yield sqlalchemy_db.session
+        finally:
+            sqlalchemy_db.session.rollback()
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect the SQL statements this thread sends through ``engine`` (background job threads are ignored)."""
+    statements = []
+    thread = threading.get_ident()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
@@ -0,0 +1,38 @@
+"""/api/<resource> 分页游标 (services/api.py)"""
+import base64
+import json
+from datetime import date
+
+import pytest
+
+from conftest import writing
+from models import Participant, Event
+
+
+def _cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('resource', ['participants', 'events', 'recipes', 'inventory', 'today'])
+@pytest.mark.parametrize('cursor', ['MQ', '!!!', _cursor({'a': 1}), _cursor([]), _cursor(['x']), _cursor([True]),
+                                    _cursor(['2024-01-01']), _cursor(['not-a-date', 1]), _cursor([None, 1]),
+                                    _cursor(['2024-01-01', 1, 2])])
+def test_malformed_cursor_is_a_bad_request(client, resource, cursor):
+    resp = client.get(f'/api/{resource}', query_string={'cursor': cursor})
+    assert resp.status_code == 400
+    assert resp.get_json() == {'error': '无效的 cursor'}
+
+
+def test_next_cursor_round_trips(app, client):
+    with writing(app) as session:
+        session.add_all(Participant(name=f'游标朋友{i}') for i in range(5))
+        session.add_all(Event(name=f'游标聚会{i}', date=date(2024, 2, 1)) for i in range(2))
+        session.commit()
+    first = client.get('/api/participants', query_string={'limit': 2}).get_json()
+    second = client.get('/api/participants', query_string={'limit': 2, 'cursor': first['next_cursor']}).get_json()
+    assert first['next_cursor'] and second['items']
+    assert {i['id'] for i in first['items']}.isdisjoint(i['id'] for i in second['items'])
+
+    events = client.get('/api/events', query_string={'limit': 1}).get_json()
+    assert events['next_cursor']
+    assert client.get('/api/events', query_string={'cursor': events['next_cursor']}).status_code == 200
@@ -0,0 +1,34 @@
+"""SQLite 写锁 (services/database.py)：只有写路由的 session 申请 BEGIN IMMEDIATE"""
+from sqlalchemy import text
+
+from services.database import immediate
+from conftest import count_queries, writing
+
+
+def _begins(statements):
+    return [s for s in statements if s.startswith('BEGIN')]
+
+
+def test_write_session_takes_the_lock_side_connections_do_not(app, db):
+    with app.app_context():
+        engine = db.engine
+    with writing(app) as session, count_queries(engine) as statements:
+        session.execute(text('SELECT 1'))
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    assert _begins(statements) == ['BEGIN IMMEDIATE', 'BEGIN']
+
+
+def test_read_session_is_deferred(app, db):
+    with app.app_context():
+        with count_queries(db.engine) as statements:
+            db.session.execute(text('SELECT 1'))
+        db.session.rollback()
+    assert _begins(statements) == ['BEGIN']
+
+
+def test_immediate_side_connection(app, db):
+    with app.app_context():
+        with count_queries(db.engine) as statements, immediate(db.engine).begin() as conn:
+            conn.execute(text('SELECT 1'))
+    assert _begins(statements) == ['BEGIN IMMEDIATE']
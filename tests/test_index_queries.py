@@ -0,0 +1,43 @@
+"""首页 (/) 的查询条数不随数据量增长 (services/dashboard.py)"""
+from datetime import date, datetime
+
+from conftest import count_queries, writing
+from models import Participant, Event, Recipe, RecipeIngredient, Consumption
+
+MAX_INDEX_QUERIES = 10
+
+
+def _seed(app, n, tag):
+    participants = [Participant(name=f'{tag}朋友{i}') for i in range(n)]
+    recipes = []
+    for i in range(n):
+        recipe = Recipe(name=f'{tag}特饮{i}', instructions='摇匀。')
+        recipe.ingredients_structured = [RecipeIngredient(name='金酒', amount=45, unit='ml')]
+        recipes.append(recipe)
+    events = [Event(name=f'{tag}聚会{i}', date=date(2024, 1, 1 + i % 28), recipes=recipes[:3]) for i in range(n)]
+    with writing(app) as session:
+        session.add_all(participants + recipes + events)
+        session.flush()
+        session.add_all(Consumption(participant_id=p.id, drink_name=recipes[0].name, event_id=events[0].id,
+                                    timestamp=datetime(2024, 1, 1, 21)) for p in participants)
+        session.commit()
+
+
+def _index_queries(app, db):
+    with app.app_context():
+        engine = db.engine
+    with app.test_client() as client, count_queries(engine) as statements:
+        resp = client.get('/')
+    assert resp.status_code == 200
+    return len(statements)
+
+
+def test_index_query_count_does_not_grow_with_rows(app, db):
+    _seed(app, 3, 'small')
+    _index_queries(app, db)  # 第一次请求：启动后台线程、首次写入指标等
+    small = _index_queries(app, db)
+    _seed(app, 40, 'large')
+    large = _index_queries(app, db)
+
+    assert large == small
+    assert small <= MAX_INDEX_QUERIES
@@ -0,0 +1,95 @@
+"""后台 AI 任务队列 (services/jobs.py)：空闲时不抢写锁，提交任务时先拿写锁"""
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event
+
+from services import jobs
+
+
+@jobs.handler('test_echo')
+def _echo(params):
+    yield ('done', params)
+
+
+def _claims(engine, seconds):
+    """Claim statements (UPDATE ... SET worker=...) sent by any thread during ``seconds``."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE ai_job') and 'worker=' in statement:
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        time.sleep(seconds)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def test_idle_workers_do_not_take_the_write_lock(app, client, db):
+    client.get('/')  # 启动本进程的后台线程
+    with app.app_context():
+        engine = db.engine
+    assert _claims(engine, 1.5) == []
+
+
+def test_submitted_job_is_claimed_promptly(app, client, db):
+    client.get('/')
+    time.sleep(1)  # 让后台线程进入空闲退避
+    with app.app_context():
+        job_id = jobs.submit('test_echo', {'value': 42})
+        deadline = time.time() + 3
+        while jobs.get(job_id)['status'] in ('queued', 'running') and time.time() < deadline:
+            time.sleep(0.05)
+        job = jobs.get(job_id)
+    assert job['status'] == 'done'
+    assert job['result'] == {'value': 42}
+
+
+def test_submit_survives_a_concurrent_commit(app, db):
+    """Another connection commits between submit()'s duplicate check and its insert."""
+    with app.app_context():
+        engine = db.engine
+        path = engine.url.database
+    committed = []
+
+    def other_writer():
+        conn = sqlite3.connect(path, timeout=0.2)
+        try:
+            conn.execute("UPDATE ai_job SET priority = priority WHERE 0")
+            conn.execute("INSERT INTO data_version (scope, version) VALUES ('test-writer', 1) "
+                         "ON CONFLICT(scope) DO UPDATE SET version = version + 1")
+            conn.commit()
+            committed.append(True)
+        except sqlite3.OperationalError:
+            committed.append(False)  # submit() 已经持有写锁，只能等它
+        finally:
+            conn.close()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT count(*)') and 'ai_job' in statement and not committed:
+            thread = threading.Thread(target=other_writer)
+            thread.start()
+            thread.join()
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        with app.app_context():
+            job_id = jobs.submit('test_echo', {'value': 'concurrent'}, unique=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert job_id
+    assert committed == [False]
+
+
+def test_client_cannot_choose_the_priority(app, client, monkeypatch):
+    monkeypatch.setattr(jobs, '_wake', threading.Event())  # 本进程的后台线程不要马上领走
+    resp = client.post('/jobs/suggest', data={'user_request': '清爽一点', 'priority': '1000'})
+    assert resp.status_code == 202
+    with app.app_context():
+        job = jobs.get(resp.get_json()['job_id'])
+        jobs.cancel(job['id'])
+    assert job['priority'] == 10
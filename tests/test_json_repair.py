@@ -0,0 +1,57 @@
+"""AI 回答 JSON 容错解析 (services/json_repair.py)
+
+data/json_repair_corpus.jsonl 每行一条模型回答的样本：endpoint、原始文本 raw，以及期望解析出的字段 expect
+（只比较列出的字段；为 null 表示本地无法修复，线上会再请求一次 AI 修正）。
+遇到新的解析失败时把原文加进语料，再改 services/json_repair.py。
+"""
+import json
+import os
+
+import pytest
+
+from services import json_repair
+from services.llm_service import SCHEMAS
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'json_repair_corpus.jsonl')
+
+with open(CORPUS, encoding='utf-8') as f:
+    CASES = [json.loads(line) for line in f if line.strip()]
+
+RECIPE = {'name': '金汤力', 'ingredients': [{'name': '金酒', 'amount': 45, 'unit': 'ml'}],
+          'instructions': '加冰，倒入金酒和通宁水。'}
+SOMMELIER = {'name': '金汤力', 'presentation': '今晚推荐这一款。', 'tasting_notes': '清爽', 'pairing_reason': '很配'}
+
+# 能解析出 JSON 对象、但不符合接口 schema 的回答：(endpoint, 回答, 错误信息)
+REJECTED = [
+    ('suggest', dict(RECIPE, name=''), '缺少字段 name'),
+    ('suggest', {k: v for k, v in RECIPE.items() if k != 'instructions'}, '缺少字段 instructions'),
+    ('suggest', dict(RECIPE, ingredients=[]), 'ingredients 应为非空的配料列表'),
+    ('suggest', dict(RECIPE, ingredients=[{'amount': 45, 'unit': 'ml'}]), 'ingredients 配料缺少 name'),
+    ('suggest', dict(RECIPE, instructions={'step': '摇匀'}), 'instructions 应为文本'),
+    ('omakase', {k: v for k, v in RECIPE.items() if k != 'ingredients'}, '缺少字段 ingredients'),
+    ('omakase', dict(RECIPE, ingredients=45), 'ingredients 应为非空的配料列表'),
+    ('omakase', dict(RECIPE, name=['热托迪', {'alt': '格罗格'}]), 'name 应为文本'),
+    ('sommelier', {k: v for k, v in SOMMELIER.items() if k != 'presentation'}, '缺少字段 presentation'),
+    ('sommelier', dict(SOMMELIER, tasting_notes={'nose': '柑橘'}), 'tasting_notes 应为文本'),
+    ('sommelier', {'recommendation': dict(SOMMELIER, pairing_reason=None)}, '缺少字段 pairing_reason'),
+]
+
+
+def _parse(endpoint, raw):
+    return json_repair.parse(raw, SCHEMAS[endpoint], unwrap='recommendation' if endpoint == 'sommelier' else None)
+
+
+@pytest.mark.parametrize('case', CASES, ids=[f"{c['endpoint']}: {c['case']}" for c in CASES])
+def test_corpus(case):
+    result, outcome, error = _parse(case['endpoint'], case['raw'])
+    if case['expect'] is None:
+        assert result is None and outcome == 'failed'
+        return
+    assert result is not None, f"not repaired: {error}"
+    assert {k: result.get(k) for k in case['expect']} == case['expect']
+
+
+@pytest.mark.parametrize('endpoint, answer, message', REJECTED,
+                         ids=[f'{endpoint}: {message}' for endpoint, _, message in REJECTED])
+def test_schema_rejects(endpoint, answer, message):
+    assert _parse(endpoint, json.dumps(answer, ensure_ascii=False)) == (None, 'failed', message)
@@ -0,0 +1,79 @@
+"""DashScope HTTP 客户端 (services/llm_client.py)：重试不超出时间预算
+
+用 benchmarks/dashscope_stub.py 的桩服务器在本地模拟上游。
+"""
+import os
+import socket
+import sys
+import time
+import uuid
+
+import pytest
+
+from services import llm_client
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from dashscope_stub import start_stub  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    monkeypatch.setenv('LLM_MAX_RETRIES', '5')
+    monkeypatch.setenv('LLM_RETRY_BACKOFF', '0.2')
+    monkeypatch.setattr(llm_client, 'breaker', llm_client.CircuitBreaker())
+
+
+@pytest.fixture
+def failing_stub():
+    server, url = start_stub(latency=0.4, error_rate=1.0)  # 0.2 秒后返回 503
+    yield url
+    server.shutdown()
+
+
+def _messages():
+    return [{'role': 'user', 'content': uuid.uuid4().hex}]  # 每次不同，不会被合并
+
+
+def _closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/v1/chat/completions'
+
+
+def test_retries_stop_at_the_budget(failing_stub):
+    started = time.time()
+    with pytest.raises(llm_client.LLMError, match='503'):
+        llm_client.chat_completion(_messages(), 0, 'key', url=failing_stub, budget=1.0)
+    assert time.time() - started < 1.2
+
+
+def test_streamed_retries_stop_at_the_budget(failing_stub):
+    started = time.time()
+    with pytest.raises(llm_client.LLMError, match='503'):
+        list(llm_client.stream_chat_completion(_messages(), 0, 'key', url=failing_stub, budget=1.0))
+    assert time.time() - started < 1.2
+
+
+def test_connection_errors_are_retried_within_the_budget():
+    started = time.time()
+    with pytest.raises(llm_client.LLMError):
+        llm_client.chat_completion(_messages(), 0, 'key', url=_closed_port_url(), budget=0.5)
+    assert time.time() - started < 0.7
+
+
+def test_without_budget_every_retry_is_made(failing_stub, monkeypatch):
+    monkeypatch.setenv('LLM_MAX_RETRIES', '2')
+    monkeypatch.setenv('LLM_RETRY_BACKOFF', '0.05')
+    started = time.time()
+    with pytest.raises(llm_client.LLMError, match='503'):
+        llm_client.chat_completion(_messages(), 0, 'key', url=failing_stub)
+    assert time.time() - started >= 3 * 0.2
+
+
+def test_success():
+    server, url = start_stub(latency=0.05)
+    try:
+        assert '桩服务器' in llm_client.chat_completion(_messages(), 0, 'key', url=url, budget=5)
+    finally:
+        server.shutdown()
@@ -0,0 +1,117 @@
+"""迁移后热点查询走索引 (services/migrations.py，同 `flask db-check-indexes`)"""
+import pytest
+from sqlalchemy import create_engine
+
+from models import db
+from services import migrations
+
+# 迁移之前的 schema：没有 consumption.event_id / recipe_id / bar_day、recipe.recipe_type，也没有索引
+LEGACY_SCHEMA = """
+CREATE TABLE participant (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL);
+CREATE TABLE event (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, date DATE, description VARCHAR(200));
+CREATE TABLE recipe (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, ingredients TEXT,
+                     instructions TEXT NOT NULL, is_generated BOOLEAN);
+CREATE TABLE recipe_ingredient (id INTEGER PRIMARY KEY, recipe_id INTEGER NOT NULL REFERENCES recipe(id),
+                                name VARCHAR(100) NOT NULL, amount FLOAT, unit VARCHAR(20));
+CREATE TABLE consumption (id INTEGER PRIMARY KEY, participant_id INTEGER NOT NULL REFERENCES participant(id),
+                          drink_name VARCHAR(100) NOT NULL, timestamp DATETIME);
+INSERT INTO consumption (participant_id, drink_name, timestamp) VALUES (1, 'Mojito', '2026-01-01 23:30:00');
+"""
+
+
+def _legacy(path):
+    engine = create_engine(f"sqlite:///{path}")
+    raw = engine.raw_connection()
+    try:
+        raw.executescript(LEGACY_SCHEMA)
+    finally:
+        raw.close()
+    return engine
+
+
+def _current(path):
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture(params=[_legacy, _current], ids=['legacy-schema', 'fresh-schema'])
+def migrated(request, tmp_path):
+    engine = request.param(tmp_path / 'migrate.db')
+    migrations.upgrade(engine, log=lambda message: None)
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_reaches_latest_version(migrated):
+    assert migrations.current_version(migrated) == migrations.LATEST_VERSION
+    assert migrations.upgrade(migrated, log=lambda message: None) == []
+
+
+@pytest.mark.parametrize('sql, params, index', migrations.HOT_QUERIES, ids=[q[2] for q in migrations.HOT_QUERIES])
+def test_hot_query_uses_index(migrated, sql, params, index):
+    with migrated.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params)]
+    assert any(f'USING INDEX {index}' in step or f'USING COVERING INDEX {index}' in step for step in plan), plan
+    assert not [step for step in plan if step.startswith('SCAN ') and 'USING' not in step], plan
+    assert migrations.plan_uses_index(' | '.join(plan), index)
+
+
+def test_plan_check_rejects_table_scan():
+    assert not migrations.plan_uses_index('SCAN consumption', 'ix_consumption_timestamp')
+    assert not migrations.plan_uses_index('SEARCH recipe USING INDEX ix_recipe_name (name=?) | SCAN consumption',
+                                          'ix_recipe_name')
+    assert migrations.plan_uses_index('SEARCH recipe USING COVERING INDEX ix_recipe_name (name=?)', 'ix_recipe_name')
+
+
+LEGACY_EVENT_LOG = """
+INSERT INTO participant (id, name) VALUES (1, 'Kenji');
+INSERT INTO event (id, name, date) VALUES (1, 'Whisky Night', '2026-01-01');
+"""
+
+STARTUP = """
+import os, sys
+sys.path.insert(0, os.environ['ROOT'])
+import app
+"""
+
+
+def test_prepare_migrates_and_backfills_legacy_database(tmp_path):
+    from flask import Flask
+    from services.database import configure_database, install_sqlite_pragmas
+    from services.rollups import ensure_rollups
+    from models import EventDrinkRollup
+
+    path = tmp_path / 'legacy.db'
+    _legacy(path).dispose()
+    raw = create_engine(f"sqlite:///{path}").raw_connection()
+    try:
+        raw.executescript(LEGACY_EVENT_LOG)
+        raw.execute("ALTER TABLE consumption ADD COLUMN event_id INTEGER")
+        raw.execute("UPDATE consumption SET event_id = 1")
+        raw.commit()
+    finally:
+        raw.close()
+
+    legacy_app = Flask('legacy')
+    legacy_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    db.init_app(legacy_app)
+    with legacy_app.app_context():
+        install_sqlite_pragmas(db.engine)
+        assert migrations.prepare(db, backfill=ensure_rollups, log=lambda m: None) == [v for v, _, _ in migrations.MIGRATIONS]
+        assert db.session.query(EventDrinkRollup.count).all() == [(1,)]
+        assert migrations.prepare(db, backfill=ensure_rollups, log=lambda m: None) == []
+        db.engine.dispose()
+
+
+def test_workers_starting_together_on_a_fresh_database(tmp_path):
+    """Like `gunicorn -w 4` without --preload: every worker imports the app at the same time."""
+    import os
+    import subprocess
+    import sys
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, ROOT=root, DATABASE_URL=f"sqlite:///{tmp_path / 'fresh.db'}", SQLITE_BUSY_TIMEOUT_MS='200')
+    workers = [subprocess.Popen([sys.executable, '-c', STARTUP], cwd=tmp_path, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True) for _ in range(3)]
+    errors = [w.communicate(timeout=120)[1] for w in workers]
+    assert [w.returncode for w in workers] == [0] * 3, errors
@@ -0,0 +1,67 @@
+"""预先生成的 Omakase (services/omakase_pool.py)：补货时机、预热期间库存变化、提示词序号
+
+AI 调用换成本地函数，只记录请求的心情/天气/序号。
+"""
+import pytest
+from sqlalchemy import delete, select
+
+from models import OmakaseVariant
+from services import ai_cache, omakase_pool
+
+INVENTORY = ['金酒 (Gin)', '通宁水 (Other)']
+
+
+@pytest.fixture
+def pool(app, db, monkeypatch):
+    """A one-combination pool of three drinks; yields (generated (mood, weather, variant) list, refresh calls)."""
+    generated, refreshes = [], []
+    monkeypatch.setattr(omakase_pool, 'enabled', lambda: True)
+    monkeypatch.setattr(omakase_pool, 'OMAKASE_POOL_MOODS', ('平静',))
+    monkeypatch.setattr(omakase_pool, 'OMAKASE_POOL_WEATHERS', ('晴朗',))
+    monkeypatch.setattr(omakase_pool, 'OMAKASE_POOL_VARIANTS', 3)
+    monkeypatch.setattr(omakase_pool, 'OMAKASE_POOL_LOW_WATER', 2)
+    monkeypatch.setattr(omakase_pool, 'schedule_refresh', lambda: refreshes.append(1))
+
+    def suggestion(inventory_list, mood, weather, variant=None):
+        generated.append((mood, weather, variant))
+        return {'name': f'特调 {variant}', 'ingredients': [], 'instructions': '摇匀'}
+
+    monkeypatch.setattr(omakase_pool, 'get_omakase_suggestion', suggestion)
+    with app.app_context():
+        yield generated, refreshes
+        with db.engine.begin() as conn:
+            conn.execute(delete(OmakaseVariant))
+
+
+def test_take_refills_only_below_low_water(pool):
+    generated, refreshes = pool
+    assert omakase_pool.refill(INVENTORY) == 3
+    assert omakase_pool.take(INVENTORY, '平静', '晴朗') is not None
+    assert refreshes == []  # 还剩 2 杯
+    assert omakase_pool.take(INVENTORY, '平静', '晴朗') is not None
+    assert refreshes == [1]  # 还剩 1 杯，低于 2
+    assert omakase_pool.take(INVENTORY, '开心', '下雨') is None  # 不是预设组合
+    assert refreshes == [1]
+
+
+def test_variant_numbers_never_repeat(pool):
+    generated, _ = pool
+    omakase_pool.refill(INVENTORY)
+    for _ in range(3):
+        omakase_pool.take(INVENTORY, '平静', '晴朗')
+    omakase_pool.refill(INVENTORY)  # 先清理端出的 3 杯，再补 3 杯
+    variants = [variant for _, _, variant in generated]
+    assert len(variants) == 6
+    assert variants == sorted(set(variants))
+
+
+def test_warm_follows_an_inventory_change(pool, db):
+    generated, _ = pool
+    changed = INVENTORY + ['青柠 (Other)']
+    snapshots = iter([INVENTORY, changed, changed])  # 第一轮补货期间库存变了
+    added, inventory_list = omakase_pool.warm(lambda: next(snapshots))
+    assert inventory_list == changed
+    assert added == 6
+    with db.engine.connect() as conn:
+        hashes = set(conn.execute(select(OmakaseVariant.inventory_hash)).scalars())
+    assert hashes == {ai_cache.inventory_fingerprint(changed)}
@@ -0,0 +1,84 @@
+""".env 中的设置对导入时读取设置的模块生效 (app.py 在导入 services 之前 load_dotenv)"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV_FILE = {
+    'BAR_TIMEZONE': 'UTC',
+    'BAR_DAY_CUTOFF_HOUR': '6',
+    'LLM_BUDGET_SUGGEST': '3',
+    'LLM_FALLBACK': '0',
+    'AI_JOB_WORKERS': '0',
+    'AI_JOB_MAX_QUEUED': '7',
+    'SOMMELIER_TOP_K': '5',
+    'AI_CACHE_TTL': '60',
+    'METRICS_FLUSH_SECONDS': '30',
+    'OMAKASE_BATCH_MAX_GUESTS': '3',
+    'OMAKASE_POOL_VARIANTS': '1',
+    'PDF_LOGO_DPI': '72',
+    'LLM_SINGLE_FLIGHT': '0',
+}
+
+PROBE = """
+import json
+import app
+from services import (barday, llm_service, jobs, sommelier_rank, ai_cache, metrics, omakase_pool, pdf_assets,
+                      single_flight)
+print(json.dumps({
+    'BAR_TIMEZONE': str(barday.BAR_TIMEZONE),
+    'BAR_DAY_CUTOFF_HOUR': barday.BAR_DAY_CUTOFF_HOUR,
+    'LLM_BUDGET_SUGGEST': llm_service.BUDGETS['suggest'],
+    'LLM_FALLBACK': llm_service.LLM_FALLBACK,
+    'AI_JOB_WORKERS': jobs.AI_JOB_WORKERS,
+    'AI_JOB_MAX_QUEUED': jobs.AI_JOB_MAX_QUEUED,
+    'SOMMELIER_TOP_K': sommelier_rank.SOMMELIER_TOP_K,
+    'AI_CACHE_TTL': ai_cache.AI_CACHE_TTL,
+    'METRICS_FLUSH_SECONDS': metrics.METRICS_FLUSH_SECONDS,
+    'OMAKASE_BATCH_MAX_GUESTS': llm_service.OMAKASE_BATCH_MAX_GUESTS,
+    'OMAKASE_POOL_VARIANTS': omakase_pool.OMAKASE_POOL_VARIANTS,
+    'PDF_LOGO_DPI': pdf_assets.PDF_LOGO_DPI,
+    'LLM_SINGLE_FLIGHT': single_flight.LLM_SINGLE_FLIGHT,
+}))
+"""
+
+EXPECTED = {
+    'BAR_TIMEZONE': 'UTC',
+    'BAR_DAY_CUTOFF_HOUR': 6,
+    'LLM_BUDGET_SUGGEST': 3.0,
+    'LLM_FALLBACK': False,
+    'AI_JOB_WORKERS': 0,
+    'AI_JOB_MAX_QUEUED': 7,
+    'SOMMELIER_TOP_K': 5,
+    'AI_CACHE_TTL': 60,
+    'METRICS_FLUSH_SECONDS': 30.0,
+    'OMAKASE_BATCH_MAX_GUESTS': 3,
+    'OMAKASE_POOL_VARIANTS': 1,
+    'PDF_LOGO_DPI': 72,
+    'LLM_SINGLE_FLIGHT': False,
+}
+
+
+def test_dotenv_settings_reach_every_module(tmp_path):
+    env_file = dict(ENV_FILE, DATABASE_URL=f"sqlite:///{tmp_path / 'settings.db'}", APP_PASSWORD='',
+                    DASHSCOPE_API_KEY='')
+    (tmp_path / '.env').write_text(''.join(f'{k}={v}\n' for k, v in env_file.items()), encoding='utf-8')
+    # 只从 .env 读取：去掉外部环境（包括 conftest）里的同名变量
+    env = {k: v for k, v in os.environ.items() if k not in env_file}
+    env['PYTHONPATH'] = ROOT
+    # `python -c` 没有 __main__.__file__，python-dotenv 从当前目录查找 .env
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=tmp_path, env=env, capture_output=True, text=True,
+                         timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == EXPECTED
+
+
+def test_importing_pdf_assets_leaves_reportlab_settings_alone():
+    probe = ("from reportlab import rl_config; default = rl_config.useA85\n"
+             "from services import pdf_assets; pdf_assets.load()\n"
+             "print(rl_config.useA85 == default)")
+    out = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == 'True'
@@ -0,0 +1,31 @@
+"""相同 AI 请求合并 (services/single_flight.py)：跨 worker 租约"""
+import time
+import uuid
+
+from services import single_flight
+
+
+def test_lease_is_held_while_a_non_streamed_call_runs(app, monkeypatch):
+    monkeypatch.setattr(single_flight, 'LEASE_SECONDS', 0.3)
+    key = uuid.uuid4().hex
+    stolen = []
+
+    def slow_call():
+        time.sleep(1)  # 远超租期，期间没有任何片段
+        stolen.append(single_flight._acquire(key, 'another-worker'))
+        return 'result'
+
+    with app.app_context():
+        assert single_flight.call(key, slow_call) == 'result'
+    assert stolen == [False]
+
+
+def test_abandoned_lease_is_released(app, monkeypatch):
+    monkeypatch.setattr(single_flight, 'LEASE_SECONDS', 0.3)
+    key = uuid.uuid4().hex
+    with app.app_context():
+        chunks = single_flight.stream(key, lambda: iter(['a', 'b']))
+        assert next(chunks) == 'a'
+        time.sleep(0.5)
+        chunks.close()
+        assert single_flight._acquire(key, 'another-worker')
@@ -0,0 +1,24 @@
+"""ETag 与 304 (services/versioning.py)"""
+from services import versioning
+
+
+def test_matching_etag_answers_304(client):
+    etag = client.get('/').headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_new_build_invalidates_etag(client, monkeypatch):
+    etag = client.get('/').headers['ETag']
+    monkeypatch.setattr(versioning, '_build_id', 'next-deploy')
+    resp = client.get('/', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+def test_build_id_prefers_app_version(monkeypatch):
+    monkeypatch.setattr(versioning, '_build_id', None)
+    monkeypatch.setenv('APP_VERSION', '2024.06.1')
+    assert versioning.build_id() == '2024.06.1'
+    monkeypatch.setattr(versioning, '_build_id', None)
+    monkeypatch.delenv('APP_VERSION')
+    assert versioning.build_id() == versioning._hash_build_files()